@@ -0,0 +1,353 @@
+"""
+Accounting module for YouTube Livestream Transcriber.
+Counts what each stream and each API key spends: seconds of audio sent to the
+hosted Whisper API, and prompt and completion tokens of chat completions. Cached
+results and local engines cost nothing and are not counted.
+
+Budgets are spending rates in USD per hour, per stream (STREAM_BUDGET_PER_HOUR)
+and per API key across its streams (KEY_BUDGET_PER_HOUR). While either rate is
+over budget, the BudgetController activates one more action from BUDGET_POLICY,
+and releases them one at a time once spending is back under
+BUDGET_RECOVER_RATIO of the budget. Available actions:
+
+- reduce_cadence: analyze topics on every BUDGET_CADENCE_STRIDE-th chunk only
+- local_topics: detect fine-grained topics with a keyword heuristic, not the LLM
+- local_transcription: transcribe with a local Whisper engine, if one is installed
+
+Hosted transcription is most of the cost ($0.36 per hour of audio against well
+under a cent of topic prompts), so only local_transcription can bring a stream
+far below that rate; the other actions trim the LLM share first.
+
+Run `python accounting.py` to simulate a stream that runs over its budget.
+"""
+
+import os
+import time
+import logging
+import threading
+import collections
+from dotenv import load_dotenv
+import summaries
+import whisper_backends
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Prices in USD: hosted Whisper per minute, gpt-4o-mini per million tokens
+WHISPER_PRICE_PER_MINUTE = float(os.getenv("WHISPER_PRICE_PER_MINUTE", "0.006"))
+PROMPT_PRICE_PER_MTOK = float(os.getenv("PROMPT_PRICE_PER_MTOK", "0.15"))
+COMPLETION_PRICE_PER_MTOK = float(os.getenv("COMPLETION_PRICE_PER_MTOK", "0.60"))
+
+# Budgets in USD per hour; 0 disables a budget
+STREAM_BUDGET_PER_HOUR = float(os.getenv("STREAM_BUDGET_PER_HOUR", "0"))
+KEY_BUDGET_PER_HOUR = float(os.getenv("KEY_BUDGET_PER_HOUR", "0"))
+
+POLICIES = ("reduce_cadence", "local_topics", "local_transcription")
+
+# Actions in escalation order
+BUDGET_POLICY = os.getenv("BUDGET_POLICY", ",".join(POLICIES))
+BUDGET_CADENCE_STRIDE = int(os.getenv("BUDGET_CADENCE_STRIDE", "3"))
+BUDGET_RECOVER_RATIO = 0.8  # Release an action below this share of the budget
+# Spending rates are measured over this window; a change waits a third of it
+BUDGET_WINDOW_SECONDS = float(os.getenv("BUDGET_WINDOW_SECONDS", "900"))
+BUDGET_WINDOW_BUCKETS = 60  # Points kept per window, at any call rate
+BUDGET_MIN_SPAN_SECONDS = 60.0  # Shortest span a rate is computed over
+
+# Tokens a chat message adds besides its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def parse_policy(value):
+    """Turn a comma-separated policy string into a validated action list"""
+    actions = [action.strip() for action in value.split(",") if action.strip()]
+    for action in actions:
+        if action not in POLICIES:
+            raise ValueError(
+                f"Unknown budget action '{action}', expected one of {', '.join(POLICIES)}"
+            )
+    return actions
+
+
+def estimate_tokens(messages):
+    """Prompt tokens of chat messages, for streamed calls that report no usage"""
+    return sum(
+        len(message["content"]) // summaries.CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+        for message in messages
+    )
+
+
+class Usage:
+    """Spend counters of one stream or key, with a sliding window for the rate"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.audio_seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.chat_requests = 0
+        self.transcriptions = 0
+        # (time, cumulative cost) points; the first one is the window's base
+        self.history = collections.deque([(clock(), 0.0)])
+
+    @property
+    def cost(self):
+        return (
+            self.audio_seconds / 60 * WHISPER_PRICE_PER_MINUTE
+            + self.prompt_tokens / 1e6 * PROMPT_PRICE_PER_MTOK
+            + self.completion_tokens / 1e6 * COMPLETION_PRICE_PER_MTOK
+        )
+
+    def add(
+        self,
+        audio_seconds=0.0,
+        prompt_tokens=0,
+        completion_tokens=0,
+        chat_requests=0,
+        transcriptions=0,
+    ):
+        with self.lock:
+            # Cost so far at the start of each bucket; the first point at or
+            # before the window start is the base of the rate
+            now = self.clock()
+            if (
+                now - self.history[-1][0]
+                >= BUDGET_WINDOW_SECONDS / BUDGET_WINDOW_BUCKETS
+            ):
+                self.history.append((now, self.cost))
+            while (
+                len(self.history) > 1
+                and self.history[1][0] <= now - BUDGET_WINDOW_SECONDS
+            ):
+                self.history.popleft()
+
+            self.audio_seconds += audio_seconds
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.chat_requests += chat_requests
+            self.transcriptions += transcriptions
+
+    def hourly_rate(self):
+        """USD per hour spent over the last BUDGET_WINDOW_SECONDS"""
+        with self.lock:
+            now = self.clock()
+            base_time, base_cost = self.history[0]
+            span = max(now - base_time, BUDGET_MIN_SPAN_SECONDS)
+            return (self.cost - base_cost) / span * 3600
+
+    def stats(self):
+        with self.lock:
+            stats = {
+                "audio_minutes": round(self.audio_seconds / 60, 2),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "chat_requests": self.chat_requests,
+                "transcriptions": self.transcriptions,
+                "cost": round(self.cost, 4),
+            }
+        stats["cost_per_hour"] = round(self.hourly_rate(), 4)
+        return stats
+
+
+# Spend of each API key, shared by every stream using it
+_key_usage = {}
+_key_usage_lock = threading.Lock()
+
+
+def get_key_usage(key_id):
+    """Return the process-wide usage counters of an API key"""
+    with _key_usage_lock:
+        usage = _key_usage.get(key_id)
+        if usage is None:
+            usage = _key_usage[key_id] = Usage()
+        return usage
+
+
+class MeteredClient:
+    """A stream's view of its pooled key client that records what calls cost"""
+
+    def __init__(self, client, usage=None):
+        self.client = client
+        self.credentials = client.credentials
+        self.usage = usage or Usage()
+        self.key_usage = get_key_usage(client.credentials.key_id)
+
+    def _record(self, **amounts):
+        self.usage.add(**amounts)
+        self.key_usage.add(**amounts)
+
+    def chat_completion(self, **kwargs):
+        """Chat completion; only calls that reach the API are counted"""
+
+        def record(usage):
+            self._record(
+                chat_requests=1,
+                prompt_tokens=usage.get("prompt_tokens", 0),
+                completion_tokens=usage.get("completion_tokens", 0),
+            )
+
+        return self.client.chat_completion(on_usage=record, **kwargs)
+
+    def chat_completion_stream(self, **kwargs):
+        """Streamed chat completion; tokens are counted up to where it stopped"""
+        prompt_tokens = estimate_tokens(kwargs["messages"])
+
+        def record(usage):
+            self._record(
+                chat_requests=1,
+                prompt_tokens=usage.get("prompt_tokens", prompt_tokens),
+                completion_tokens=usage.get("completion_tokens", 0),
+            )
+
+        return self.client.chat_completion_stream(on_usage=record, **kwargs)
+
+    def transcribe(self, model, file, **kwargs):
+        transcript = self.client.transcribe(model, file, **kwargs)
+        self._record(transcriptions=1)
+        return transcript
+
+    def record_audio(self, seconds):
+        """Count audio billed by the hosted Whisper API"""
+        if seconds:
+            self._record(audio_seconds=seconds)
+
+
+class BudgetController:
+    """Spend-driven degradation state for one pipeline"""
+
+    def __init__(
+        self,
+        emitter,
+        usage,
+        key_usage,
+        policy=None,
+        stream_budget=None,
+        key_budget=None,
+        clock=time.monotonic,
+    ):
+        self.emitter = emitter
+        self.usage = usage
+        self.key_usage = key_usage
+        if policy is None:
+            policy = BUDGET_POLICY
+            # Leave out what this installation cannot do
+            if whisper_backends.local_backend_name() is None:
+                policy = policy.replace("local_transcription", "")
+        self.actions = parse_policy(policy)
+        self.stream_budget = (
+            STREAM_BUDGET_PER_HOUR if stream_budget is None else stream_budget
+        )
+        self.key_budget = KEY_BUDGET_PER_HOUR if key_budget is None else key_budget
+        self.clock = clock
+        self.level = 0  # Number of actions currently active
+        self.pace = 0.0  # Highest spending rate as a share of its budget
+        self.changed_at = None
+
+    @property
+    def active_actions(self):
+        return self.actions[: self.level]
+
+    def is_active(self, action):
+        return action in self.active_actions
+
+    def cadence(self):
+        """Analyze topics on every n-th chunk"""
+        if self.is_active("reduce_cadence"):
+            return BUDGET_CADENCE_STRIDE
+        return 1
+
+    def update(self):
+        """Compare spending with the budgets and escalate or relax by one step"""
+        paces = []
+        if self.stream_budget:
+            paces.append(self.usage.hourly_rate() / self.stream_budget)
+        if self.key_budget:
+            paces.append(self.key_usage.hourly_rate() / self.key_budget)
+        self.pace = max(paces, default=0.0)
+
+        # Give the rate time to reflect the last change
+        now = self.clock()
+        if (
+            self.changed_at is not None
+            and now - self.changed_at < BUDGET_WINDOW_SECONDS / 3
+        ):
+            return
+        if self.pace > 1.0 and self.level < len(self.actions):
+            self.level += 1
+            self.changed_at = now
+            self._report("degraded", f"activated {self.actions[self.level - 1]}")
+        elif self.pace < BUDGET_RECOVER_RATIO and self.level > 0:
+            self.level -= 1
+            self.changed_at = now
+            self._report("recovered", f"released {self.actions[self.level]}")
+
+    def stats(self):
+        return {
+            "level": self.level,
+            "pace": round(self.pace, 2),
+            "actions": self.active_actions,
+            "stream_budget": self.stream_budget,
+            "key_budget": self.key_budget,
+        }
+
+    def _report(self, state, detail):
+        """Tell clients the pipeline changed its budget state"""
+        message = f"Budget {state} (spending at {self.pace:.0%} of budget): {detail}"
+        logger.warning(message)
+        self.emitter.emit("debug_log", {"message": message, "type": "warning"})
+        self.emitter.emit("budget", dict(self.stats(), state=state))
+
+
+def _simulate(hours=3, chunk_seconds=20, budget=0.25):
+    """A stream whose hosted transcription alone costs more than its budget"""
+
+    class _NullEmitter:
+        def emit(self, event, data=None, **kwargs):
+            pass
+
+    logger.setLevel(logging.ERROR)
+    now = [0.0]
+    clock = lambda: now[0]
+    usage = Usage(clock)
+    controller = BudgetController(
+        _NullEmitter(),
+        usage,
+        Usage(clock),
+        policy=",".join(POLICIES),
+        stream_budget=budget,
+        clock=clock,
+    )
+    print(
+        f"budget ${budget:.2f}/h, hosted Whisper ${WHISPER_PRICE_PER_MINUTE * 60:.2f}/h"
+    )
+
+    levels = collections.Counter()
+    for chunk in range(int(hours * 3600 / chunk_seconds)):
+        now[0] += chunk_seconds
+        if not controller.is_active("local_transcription"):
+            usage.add(audio_seconds=chunk_seconds, transcriptions=1)
+        # Fine and major topic prompts, minus what reduced cadence and local
+        # topic detection skip
+        if chunk % controller.cadence() == 0:
+            usage.add(prompt_tokens=1500, completion_tokens=12, chat_requests=1)
+            if not controller.is_active("local_topics"):
+                usage.add(prompt_tokens=400, completion_tokens=8, chat_requests=1)
+        controller.update()
+        levels[controller.level] += 1
+        if chunk % 90 == 89:
+            print(
+                f"  {now[0] / 3600:4.1f}h: ${usage.hourly_rate():.3f}/h, "
+                f"actions: {', '.join(controller.active_actions) or 'none'}"
+            )
+    print(f"  total ${usage.cost:.3f} over {hours}h (${usage.cost / hours:.3f}/h)")
+    for level in range(len(controller.actions) + 1):
+        actions = ", ".join(controller.actions[:level]) or "none"
+        print(f"  {levels[level] / sum(levels.values()):4.0%} of chunks with {actions}")
+
+
+if __name__ == "__main__":
+    _simulate()
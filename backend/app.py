@@ -4,18 +4,27 @@ from gevent import monkey
 monkey.patch_all()
 
 # Now it's safe to import everything else
-from flask import Flask, render_template, send_from_directory
-from flask_socketio import SocketIO, emit
+from flask import (
+    Flask,
+    Response,
+    abort,
+    jsonify,
+    request,
+    send_from_directory,
+)
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import os
-import json
-import time
-import threading
 import logging
 from dotenv import load_dotenv
-import transcription
-import topic_detection  # Add import for topic detection module
-import major_topic_detection  # Add import for major topic detection module
-import datetime  # Added for timestamp handling
+import wire_format
+import broker
+import pipeline
+import credentials
+import concurrency
+import resilience
+import exporters
+import streams
+import channel_watcher
 
 # Load environment variables
 load_dotenv()
@@ -27,19 +36,54 @@ socketio = SocketIO(
     app,
     cors_allowed_origins="*",
     async_mode="gevent",
+    message_queue=broker.message_queue_url(),  # Fan out events published by workers
     logger=True,
     engineio_logger=True,
+    # Compress polling responses; binary frames are not base64-inflated
+    http_compression=True,
+    compression_threshold=512,
 )
 
+# High-frequency pipeline events go through the (optionally compact) emitter
+emitter = wire_format.CompactEmitter(socketio)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Packets queued for one client before it is dropped as too slow; 0 disables
+CLIENT_BUFFER_MAX_PACKETS = int(os.getenv("CLIENT_BUFFER_MAX_PACKETS", "2000"))
+CLIENT_BUFFER_CHECK_SECONDS = 5
+
 # Global variabless
 connected_clients = 0
-active_transcription = False
-transcription_thread = None
-stop_transcription_flag = False
+# One shared pipeline per livestream, reference-counted by subscribed clients
+stream_registry = streams.StreamRegistry()
+
+# Workers on other hosts write exports and dead letters to their own disks
+if broker.message_queue_url() and not (
+    os.getenv("EXPORT_DIR") and os.getenv("DEAD_LETTER_DIR")
+):
+    logger.warning(
+        "Pipelines run in worker processes that may be on other hosts; set "
+        "EXPORT_DIR and DEAD_LETTER_DIR to storage shared with this web node"
+    )
+
+# Relay events from worker processes when using the local UNIX socket broker
+broker.start_subscriber(socketio, streams.SubscriberRelay(stream_registry, emitter))
+
+
+def leave_stream(sid, left):
+    """Take a client out of a stream's room, stopping the stream if it was the last"""
+    if left is None:
+        return
+    session, orphaned = left
+    leave_room(session.room, sid=sid)
+    if orphaned:
+        log_message = f"Last subscriber left {session.key}, stopping its pipeline"
+        logger.info(log_message)
+        socketio.emit("debug_log", {"message": log_message})
+        session.stop()
 
 
 # Routes
@@ -48,11 +92,116 @@ def index():
     return send_from_directory(app.static_folder, "index.html")
 
 
+def subscribed_exports():
+    """Export ids of the stream the requesting Socket.IO client (?sid=) watches"""
+    key = stream_registry.stream_of(request.args.get("sid", ""))
+    if key is None:
+        return []
+    return exporters.list_exports(streams.canonical_url(key))
+
+
+@app.route("/exports")
+def list_exports():
+    return jsonify({"streams": subscribed_exports()})
+
+
+@app.route("/exports/<stream_id>/<kind>")
+def download_export(stream_id, kind):
+    """Stream a caption or chapter file straight from disk"""
+    if stream_id == "latest":
+        stream_ids = subscribed_exports()
+        if not stream_ids:
+            abort(404)
+        stream_id = stream_ids[0]
+    path = exporters.export_path(stream_id, kind)
+    if path is None or not os.path.exists(path):
+        abort(404)
+
+    size = os.path.getsize(path)
+    file_name, mime_type = exporters.EXPORT_FILES[kind]
+    return Response(
+        exporters.read_blocks(path, size),
+        mimetype=mime_type,
+        headers={
+            "Content-Length": str(size),
+            "Content-Disposition": f'attachment; filename="{stream_id}-{file_name}"',
+            "Cache-Control": "no-store",
+        },
+    )
+
+
 @app.route("/<path:path>")
 def serve_static(path):
     return send_from_directory(app.static_folder, path)
 
 
+# Channel watchlist
+def watcher_sid(channel):
+    """Subscriber id that keeps an auto-started stream alive while it is live"""
+    return f"watcher:{channel}"
+
+
+def handle_channel_live(channel, live):
+    """Start (or keep) transcribing a watched channel's live stream"""
+    session, created, left = stream_registry.subscribe(
+        watcher_sid(channel), live["video_id"]
+    )
+    if left is not None and left[1]:
+        left[0].stop()  # The channel moved on to a new stream
+    if not created:
+        return
+
+    session.start(emitter, credentials.Credentials.from_environment())
+    log_message = f"{channel} went live, transcribing {live['stream_info']['title']}"
+    logger.info(log_message)
+    socketio.emit("debug_log", {"message": log_message, "type": "success"})
+    socketio.emit(
+        "channel_live",
+        {
+            "channel": channel,
+            "url": session.url,
+            "title": live["stream_info"]["title"],
+        },
+    )
+
+
+def handle_channel_offline(channel, video_id):
+    """Release a watched channel's stream; it stops unless clients are watching"""
+    left = stream_registry.unsubscribe(watcher_sid(channel))
+    if left is not None and left[1]:
+        left[0].stop()
+    socketio.emit("debug_log", {"message": f"{channel} is no longer live"})
+
+
+def enforce_client_buffer_cap():
+    """Disconnect clients whose outgoing packet queue passed the cap
+
+    Socket.IO queues every packet for a client until its transport takes it, so
+    a stalled client would otherwise hold a copy of the whole stream.
+    """
+    eio = socketio.server.eio
+    while True:
+        socketio.sleep(CLIENT_BUFFER_CHECK_SECONDS)
+        for eio_sid, client in list(eio.sockets.items()):
+            backlog = client.queue.qsize()
+            if backlog > CLIENT_BUFFER_MAX_PACKETS:
+                logger.warning(
+                    f"Disconnecting client {eio_sid}: {backlog} packets not delivered"
+                )
+                eio.disconnect(eio_sid)
+
+
+if CLIENT_BUFFER_MAX_PACKETS:
+    socketio.start_background_task(enforce_client_buffer_cap)
+
+
+watcher = channel_watcher.create_from_environment(
+    handle_channel_live, handle_channel_offline
+)
+if watcher is not None:
+    watcher.start()
+
+
 # Socket.IO events
 @socketio.on("connect")
 def handle_connect():
@@ -60,6 +209,7 @@ def handle_connect():
     connected_clients += 1
     logger.info(f"Client connected. Total clients: {connected_clients}")
     socketio.emit("clients_update", {"count": connected_clients})
+    emit("wire_format", {"compact": emitter.enabled})
     logger.info(f"Emitted clients_update event with count: {connected_clients}")
 
 
@@ -69,12 +219,11 @@ def handle_disconnect():
     connected_clients = max(0, connected_clients - 1)
     logger.info(f"Client disconnected. Total clients: {connected_clients}")
     socketio.emit("clients_update", {"count": connected_clients})
+    leave_stream(request.sid, stream_registry.unsubscribe(request.sid))
 
 
 @socketio.on("connect_livestream")
 def handle_connect_livestream(data):
-    global active_transcription, transcription_thread, stop_transcription_flag
-
     url = data.get("url", "")
     custom_api_key = data.get("apiKey", "")
 
@@ -82,204 +231,106 @@ def handle_connect_livestream(data):
     logger.info(log_message)
     socketio.emit("debug_log", {"message": log_message})
 
-    # Set custom API key if provided
+    # Use the custom API key for this session only, if provided
     if custom_api_key:
+        session_credentials = credentials.Credentials(custom_api_key, source="frontend")
         log_message = "Using custom API key from frontend"
         logger.info(log_message)
         socketio.emit("debug_log", {"message": log_message})
+    else:
+        session_credentials = credentials.Credentials.from_environment()
 
-        # Store the custom API key for later use
-        os.environ["TEMP_OPENAI_API_KEY"] = custom_api_key
-
-    # Validate URL (simple check)
-    if "youtube.com" not in url and "youtu.be" not in url:
+    # Validate URL and reduce it to the stream it points to
+    key = streams.resolve_stream_key(url)
+    if key is None:
         error_message = "Invalid YouTube URL"
         logger.error(error_message)
         socketio.emit("debug_log", {"message": error_message, "type": "error"})
         socketio.emit("livestream_error", {"message": error_message})
         return
 
-    # If already transcribing, stop the current one
-    if (
-        active_transcription
-        and transcription_thread
-        and transcription_thread.is_alive()
-    ):
-        stop_transcription_flag = True
-        transcription_thread.join(timeout=1.0)
-        stop_transcription_flag = False
-        topic_detection.stop_topic_detection()  # Stop the topic detection thread
-        major_topic_detection.stop_major_topic_detection()  # Stop the major topic detection thread
-
-    # Start topic detection thread
-    topic_detection.start_topic_detection(socketio)
-    socketio.emit("debug_log", {"message": "Topic detection thread started"})
-
-    # Start major topic detection thread
-    major_topic_detection.start_major_topic_detection(socketio)
-    socketio.emit("debug_log", {"message": "Major topic detection thread started"})
-
-    # Start transcription process
-    active_transcription = True
-    stop_transcription_flag = False
-    transcription_thread = socketio.start_background_task(
-        target=transcribe_livestream, url=url
-    )
+    sid = request.sid
+    # A client asking again for its current stream already has the history
+    resubscribed = stream_registry.stream_of(sid) == key
+    session, created, left = stream_registry.subscribe(sid, key)
+    leave_stream(sid, left)  # Switching streams releases the previous one
+    join_room(session.room)
+
+    if created:
+        session.start(emitter, session_credentials)
+        if session.worker_process is not None:
+            socketio.emit(
+                "debug_log",
+                {"message": f"Started worker process {session.worker_process.pid}"},
+            )
+    elif not resubscribed:
+        # Attach to the running pipeline and catch up on its history
+        log_message = f"{key} is already being transcribed, joining {len(session.subscribers) - 1} other client(s)"
+        logger.info(log_message)
+        emit("debug_log", {"message": log_message, "type": "success"})
+        for event, event_data in session.replay():
+            emitter.emit(event, event_data, to=sid)
 
     # Send status update
-    socketio.emit("livestream_connected", {"status": "connected", "url": url})
-    logger.info(f"Emitted livestream_connected event for URL: {url}")
+    emit(
+        "livestream_connected",
+        {
+            "status": "connected",
+            "url": session.url,
+            "shared": not created,
+            "subscribers": len(session.subscribers),
+        },
+    )
+    logger.info(f"Emitted livestream_connected event for URL: {session.url}")
+    emit("dead_letters", resilience.get_dead_letters().summary(session.url))
 
 
 @socketio.on("stop_transcription")
 def handle_stop_transcription():
-    global active_transcription, stop_transcription_flag
-
     log_message = "Stopping transcription"
     logger.info(log_message)
     socketio.emit("debug_log", {"message": log_message})
 
-    stop_transcription_flag = True
-    active_transcription = False
-    topic_detection.stop_topic_detection()  # Stop the topic detection thread
-    major_topic_detection.stop_major_topic_detection()  # Stop the major topic detection thread
+    # Only this client leaves; the pipeline keeps running for other subscribers
+    leave_stream(request.sid, stream_registry.unsubscribe(request.sid))
 
 
-@socketio.on("ping")
-def handle_ping(data):
-    logger.info(f"Received ping: {data}")
-    socketio.emit("pong", {"message": "Server received ping"})
-    logger.info("Emitted pong response")
-
-
-def transcribe_livestream(url):
-    """Main function to transcribe a YouTube livestream"""
-    global stop_transcription_flag, active_transcription
-
-    try:
-        # Get the direct audio stream URL
-        log_message = f"Extracting audio stream URL from: {url}"
-        socketio.emit("debug_log", {"message": log_message})
-
-        audio_url, stream_info = transcription.get_audio_stream_url(url)
-
-        # Send livestream info to frontend
-        socketio.emit("livestream_info", stream_info)
-        socketio.emit(
-            "debug_log",
-            {"message": "Successfully extracted audio stream URL", "type": "success"},
-        )
-
-        if not audio_url:
-            error_message = "Failed to get audio stream URL"
-            logger.error(error_message)
-            socketio.emit("debug_log", {"message": error_message, "type": "error"})
-            socketio.emit("livestream_error", {"message": error_message})
-            return
-
-        # Initialize timestamp reference point - the moment transcription begins
-        transcription_start_time = datetime.datetime.now()
-        logger.info(f"Transcription started at: {transcription_start_time}")
-        socketio.emit(
+@socketio.on("retry_dead_letters")
+def handle_retry_dead_letters(data=None):
+    # Clients may only retry the failed chunks of the stream they are watching
+    key = stream_registry.stream_of(request.sid)
+    if key is None:
+        emit(
             "debug_log",
             {
-                "message": f"Transcription started at: {transcription_start_time.strftime('%H:%M:%S')}"
+                "message": "Connect to a stream to retry its failed chunks",
+                "type": "error",
             },
         )
+        return
 
-        # Start transcribing chunks sequentially
-        current_time = 0  # Still needed for ffmpeg extraction
-        chunk_duration = 20  # seconds
-
-        while not stop_transcription_flag:
-            try:
-                # Extract audio chunk
-                log_message = f"Extracting audio chunk at {transcription.format_timestamp(current_time)}"
-                socketio.emit("debug_log", {"message": log_message})
-
-                audio_file = transcription.extract_audio_chunk(
-                    audio_url, chunk_duration, current_time
-                )
-
-                # Transcribe the audio chunk
-                log_message = "Transcribing chunk..."
-                socketio.emit("debug_log", {"message": log_message})
-
-                transcription_text = transcription.transcribe_audio_chunk(audio_file)
-
-                # Calculate timestamp based on real-world time
-                current_real_time = datetime.datetime.now()
-                elapsed_seconds = (
-                    current_real_time - transcription_start_time
-                ).total_seconds()
-                timestamp = transcription.format_timestamp(int(elapsed_seconds))
-
-                # Send transcription to frontend
-                log_message = f"Transcription sent to frontend: {transcription_text}"
-                logger.info(log_message)
-                socketio.emit("debug_log", {"message": log_message, "type": "success"})
-
-                # Emit transcription event to all clients
-                socketio.emit(
-                    "transcription",
-                    {"timestamp": timestamp, "text": transcription_text},
-                    broadcast=True,
-                )
-                logger.info(f"Emitted transcription event with timestamp: {timestamp}")
-
-                # Send transcription for topic change detection
-                topic_detection.add_transcription_for_analysis(
-                    timestamp, transcription_text
-                )
-
-                # Send transcription for major topic detection
-                major_topic_detection.add_transcription_for_major_analysis(
-                    timestamp, transcription_text
-                )
-
-                # Move to next chunk (still needed for ffmpeg extraction)
-                current_time += chunk_duration
-
-            except Exception as e:
-                error_message = f"Error processing chunk: {str(e)}"
-                logger.error(error_message)
-                socketio.emit("debug_log", {"message": error_message, "type": "error"})
-                # Continue to next chunk even if this one fails
-                current_time += chunk_duration
-                continue
-
-    except Exception as e:
-        error_message = f"Transcription error: {str(e)}"
-        logger.error(error_message)
-        socketio.emit("debug_log", {"message": error_message, "type": "error"})
-        socketio.emit("livestream_error", {"message": error_message})
-    finally:
-        # Clean up and mark as inactive
-        if not stop_transcription_flag:
-            # Get final timestamp based on real world time
-            current_real_time = datetime.datetime.now()
-            elapsed_seconds = (
-                current_real_time - transcription_start_time
-            ).total_seconds()
-            final_timestamp = transcription.format_timestamp(int(elapsed_seconds))
-
-            socketio.emit(
-                "transcription",
-                {
-                    "timestamp": final_timestamp,
-                    "text": "Transcription ended due to an error.",
-                },
-                broadcast=True,
-            )
+    custom_api_key = (data or {}).get("apiKey", "")
+    if custom_api_key:
+        session_credentials = credentials.Credentials(custom_api_key, source="frontend")
+    else:
+        session_credentials = credentials.Credentials.from_environment()
+
+    # Re-transcribe in the background so this handler returns immediately
+    concurrency.start_worker(
+        pipeline.retry_dead_letters,
+        emitter,
+        session_credentials,
+        request.sid,
+        streams.canonical_url(key),
+        name="dead-letter-retry",
+    )
 
-        active_transcription = False
-        topic_detection.stop_topic_detection()  # Stop the topic detection thread
-        major_topic_detection.stop_major_topic_detection()  # Stop the major topic detection thread
 
-        # Remove temporary API key if it was set
-        if "TEMP_OPENAI_API_KEY" in os.environ:
-            del os.environ["TEMP_OPENAI_API_KEY"]
-            logger.info("Removed temporary API key")
+@socketio.on("ping")
+def handle_ping(data):
+    logger.info(f"Received ping: {data}")
+    socketio.emit("pong", {"message": "Server received ping"})
+    logger.info("Emitted pong response")
 
 
 if __name__ == "__main__":
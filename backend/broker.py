@@ -0,0 +1,174 @@
+"""
+Broker module for YouTube Livestream Transcriber.
+Carries pipeline events from worker processes to the Socket.IO web tier.
+
+Supported BROKER_URL schemes:
+- memory://            pipeline runs inside the web process (default)
+- redis://host:port/0  Flask-SocketIO message_queue, any number of web nodes fan out
+- unix:///path.sock    local stand-in, web node listens on a UNIX socket
+"""
+
+import os
+import sys
+import json
+import socket
+import logging
+import subprocess
+import threading
+from dotenv import load_dotenv
+import wire_format
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+BROKER_URL = os.getenv("BROKER_URL", "memory://")
+SESSION_API_KEY_ENV = "TRANSCRIBER_SESSION_API_KEY"
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py")
+
+
+def broker_scheme(broker_url):
+    """Return the scheme of a broker URL ("memory", "redis", "unix", ...)"""
+    return broker_url.split("://", 1)[0].lower() if "://" in broker_url else "memory"
+
+
+def uses_worker_processes(broker_url=BROKER_URL):
+    """Whether pipelines run in separate worker processes for this broker"""
+    return broker_scheme(broker_url) != "memory"
+
+
+def message_queue_url(broker_url=BROKER_URL):
+    """The message_queue argument for Flask-SocketIO, or None if not applicable"""
+    if broker_scheme(broker_url) in ("redis", "rediss", "amqp", "kafka", "zmq"):
+        return broker_url
+    return None
+
+
+def _unix_path(broker_url):
+    """Filesystem path of a unix:// broker URL"""
+    return broker_url.split("://", 1)[1]
+
+
+class UnixSocketPublisher:
+    """Publishes events as newline-delimited JSON over a UNIX socket"""
+
+    def __init__(self, path):
+        self.path = path
+        self._socket = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(self.path)
+        return client
+
+    def emit(self, event, data=None, to=None, **kwargs):
+        """Send an event to the web tier; only the "to" room is forwarded"""
+        message = {"event": event, "data": data}
+        if to is not None:
+            message["to"] = to
+        line = (json.dumps(message) + "\n").encode("utf-8")
+        with self._lock:
+            # Reconnect once if the web node restarted
+            for attempt in range(2):
+                try:
+                    if self._socket is None:
+                        self._socket = self._connect()
+                    self._socket.sendall(line)
+                    return
+                except OSError as e:
+                    self.close()
+                    if attempt == 1:
+                        logger.error(f"Failed to publish {event} event: {str(e)}")
+
+    def close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+            self._socket = None
+
+
+def create_publisher(broker_url=BROKER_URL):
+    """Create the object worker processes emit events through"""
+    scheme = broker_scheme(broker_url)
+
+    if scheme == "unix":
+        return UnixSocketPublisher(_unix_path(broker_url))
+
+    if message_queue_url(broker_url):
+        # Write-only Socket.IO instance that publishes to the message queue
+        from flask_socketio import SocketIO
+
+        return wire_format.CompactEmitter(SocketIO(message_queue=broker_url))
+
+    raise ValueError(f"Broker {broker_url} cannot be used from a worker process")
+
+
+def start_subscriber(socketio, emitter, broker_url=BROKER_URL):
+    """Start relaying worker events to clients on this web node"""
+    if broker_scheme(broker_url) != "unix":
+        # memory:// needs no relay and message queues are consumed by Flask-SocketIO
+        return None
+
+    path = _unix_path(broker_url)
+    if os.path.exists(path):
+        os.remove(path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(16)
+    logger.info(f"Listening for worker events on {path}")
+
+    def relay(connection):
+        """Forward every event line from one worker connection"""
+        with connection, connection.makefile("r", encoding="utf-8") as lines:
+            for line in lines:
+                try:
+                    message = json.loads(line)
+                    if "to" in message:
+                        emitter.emit(
+                            message["event"], message["data"], to=message["to"]
+                        )
+                    else:
+                        emitter.emit(message["event"], message["data"])
+                except (ValueError, KeyError) as e:
+                    logger.error(f"Invalid worker event: {str(e)}")
+
+    def accept_loop():
+        while True:
+            connection, _ = server.accept()
+            socketio.start_background_task(relay, connection)
+
+    return socketio.start_background_task(accept_loop)
+
+
+def spawn_worker(url, session_credentials=None, broker_url=BROKER_URL):
+    """Launch a pipeline worker process for a livestream URL"""
+    env = dict(os.environ)
+    env["BROKER_URL"] = broker_url
+    # The session key only exists in this child's environment
+    if session_credentials and session_credentials.source == "frontend":
+        env[SESSION_API_KEY_ENV] = session_credentials.api_key
+
+    process = subprocess.Popen([sys.executable, WORKER_SCRIPT, url], env=env)
+    logger.info(f"Started worker process {process.pid} for {url}")
+    return process
+
+
+def stop_worker(process, timeout=10.0):
+    """Ask a worker process to finish its pipeline, killing it if it hangs"""
+    if process is None or process.poll() is not None:
+        return
+
+    process.terminate()  # SIGTERM lets the worker emit its final chapters
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.warning(f"Worker process {process.pid} did not stop, killing it")
+        process.kill()
+        process.wait()
@@ -0,0 +1,301 @@
+"""
+Channel watcher module for YouTube Livestream Transcriber.
+Polls the live status of a watchlist of channels (WATCHLIST_CHANNELS) and starts
+transcription when one of them goes live.
+
+- Each channel is polled every WATCH_POLL_SECONDS with random jitter, so the
+  channels do not all hit YouTube at the same moment.
+- At most WATCH_MAX_CONCURRENT_POLLS polls run at once, however long the list.
+- A channel whose poll fails backs off exponentially, up to
+  WATCH_BACKOFF_MAX_SECONDS, without slowing down the others.
+- The poll already resolves the audio URL of a live stream, so it is handed to
+  the pipeline (pre-warmed) and ingest starts without a second yt-dlp call.
+
+The extractor is pluggable; run `python channel_watcher.py` to simulate a
+watchlist against a stub extractor.
+"""
+
+import os
+import time
+import heapq
+import random
+import logging
+import itertools
+import threading
+import yt_dlp
+from dotenv import load_dotenv
+import broker
+import concurrency
+import transcription
+import streams
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Comma-separated channel handles (@name), channel IDs (UC...) or channel URLs
+WATCHLIST_CHANNELS = [
+    channel.strip()
+    for channel in os.getenv("WATCHLIST_CHANNELS", "").split(",")
+    if channel.strip()
+]
+WATCH_POLL_SECONDS = float(os.getenv("WATCH_POLL_SECONDS", "60"))
+WATCH_POLL_JITTER = float(os.getenv("WATCH_POLL_JITTER", "0.2"))  # +/- fraction
+WATCH_MAX_CONCURRENT_POLLS = int(os.getenv("WATCH_MAX_CONCURRENT_POLLS", "4"))
+WATCH_BACKOFF_MAX_SECONDS = float(os.getenv("WATCH_BACKOFF_MAX_SECONDS", "900"))
+
+# yt-dlp messages for channels that are not live right now
+_OFFLINE_MESSAGES = ("not currently live", "will begin", "premieres in", "is offline")
+
+
+def channel_live_url(channel):
+    """The /live page of a channel given as @handle, channel ID or URL"""
+    channel = channel.strip().rstrip("/")
+    if channel.startswith("@"):
+        channel = f"https://www.youtube.com/{channel}"
+    elif channel.startswith("UC") and "/" not in channel:
+        channel = f"https://www.youtube.com/channel/{channel}"
+    elif "://" not in channel:
+        channel = f"https://{channel}"
+    return channel if channel.endswith("/live") else f"{channel}/live"
+
+
+class YtDlpLiveExtractor:
+    """Live status of a channel through yt-dlp's YouTube extractor"""
+
+    def check(self, live_url):
+        """Return the live stream of a channel's /live page, or None if offline
+
+        The result is a dict with the video_id, audio_url and stream_info.
+        Errors other than "not live" are raised so the caller can back off.
+        """
+        ydl_opts = {
+            "format": "bestaudio/best",
+            "quiet": True,
+            "no_warnings": True,
+        }
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(live_url, download=False)
+        except yt_dlp.utils.DownloadError as e:
+            if any(message in str(e).lower() for message in _OFFLINE_MESSAGES):
+                return None
+            raise
+
+        if not info or not info.get("is_live"):
+            return None  # Upcoming stream or the channel's latest upload
+        audio_url, stream_info = transcription.stream_from_info(info)
+        return {
+            "video_id": info["id"],
+            "audio_url": audio_url,
+            "stream_info": stream_info,
+        }
+
+
+class ChannelState:
+    """Polling state of one watched channel"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.live_url = channel_live_url(channel)
+        self.failures = 0
+        self.live_video_id = None  # Video currently live on the channel
+        self.polls = 0
+
+
+class ChannelWatcher:
+    """Jittered, bounded-concurrency polling of channel live status"""
+
+    def __init__(
+        self,
+        channels,
+        on_live,
+        on_offline=None,
+        extractor=None,
+        interval=WATCH_POLL_SECONDS,
+        jitter=WATCH_POLL_JITTER,
+        max_concurrent=WATCH_MAX_CONCURRENT_POLLS,
+        backoff_max=WATCH_BACKOFF_MAX_SECONDS,
+    ):
+        self.states = [ChannelState(channel) for channel in channels]
+        self.on_live = on_live  # Called with (channel, live stream) on every live poll
+        self.on_offline = on_offline  # Called with (channel, video_id) when it ends
+        self.extractor = extractor or YtDlpLiveExtractor()
+        self.interval = interval
+        self.jitter = jitter
+        self.backoff_max = backoff_max
+
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.condition = threading.Condition()
+        self.schedule = []  # Heap of (due time, tie-breaker, state)
+        self._order = itertools.count()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def start(self):
+        """Spread the first polls over one jitter window and start scheduling"""
+        for state in self.states:
+            self._schedule(state, random.uniform(0, self.interval * self.jitter))
+        self.thread = concurrency.start_worker(self.run, name="channel-watcher")
+        logger.info(f"Watching {len(self.states)} channel(s) for live streams")
+
+    def stop(self):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def next_delay(self):
+        """Regular poll interval with +/- jitter"""
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def backoff_delay(self, state):
+        """Exponential backoff after consecutive failures, with jitter"""
+        delay = min(self.interval * 2**state.failures, self.backoff_max)
+        return delay * random.uniform(1 - self.jitter, 1)
+
+    def _schedule(self, state, delay):
+        with self.condition:
+            heapq.heappush(
+                self.schedule, (time.monotonic() + delay, next(self._order), state)
+            )
+            self.condition.notify()
+
+    def run(self):
+        """Start each poll when it is due, never more than the concurrency cap"""
+        while not self.stop_event.is_set():
+            with self.condition:
+                while not self.stop_event.is_set():
+                    delay = (
+                        self.schedule[0][0] - time.monotonic()
+                        if self.schedule
+                        else None
+                    )
+                    if delay is not None and delay <= 0:
+                        break
+                    self.condition.wait(delay)
+                if self.stop_event.is_set():
+                    break
+                _, _, state = heapq.heappop(self.schedule)
+
+            # Wait for a free slot; a backlog of due polls runs in due order
+            self.slots.acquire()
+            if self.stop_event.is_set():
+                self.slots.release()
+                break
+            concurrency.start_worker(self.poll, state, name="channel-poll")
+
+    def poll(self, state):
+        """Check one channel, report changes and schedule its next poll"""
+        with self.condition:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            live = concurrency.run_blocking(self.extractor.check, state.live_url)
+        except Exception as e:
+            state.failures += 1
+            delay = self.backoff_delay(state)
+            logger.warning(
+                f"Live check of {state.channel} failed ({state.failures} in a row), next in {delay:.0f}s: {str(e)}"
+            )
+        else:
+            state.failures = 0
+            delay = self.next_delay()
+            self._report(state, live)
+        finally:
+            state.polls += 1
+            with self.condition:
+                self.in_flight -= 1
+            self.slots.release()
+
+        if not self.stop_event.is_set():
+            self._schedule(state, delay)
+
+    def _report(self, state, live):
+        try:
+            if live is not None:
+                if live["video_id"] != state.live_video_id:
+                    logger.info(f"{state.channel} is live: {live['video_id']}")
+                    state.live_video_id = live["video_id"]
+                    # Hand the resolved audio URL to the pipeline about to start,
+                    # unless it starts in a worker process that cannot see it
+                    if not broker.uses_worker_processes():
+                        transcription.prewarm_stream_url(
+                            streams.canonical_url(live["video_id"]),
+                            live["audio_url"],
+                            live["stream_info"],
+                        )
+                self.on_live(state.channel, live)
+            elif state.live_video_id is not None:
+                logger.info(f"{state.channel} is no longer live")
+                ended, state.live_video_id = state.live_video_id, None
+                if self.on_offline:
+                    self.on_offline(state.channel, ended)
+        except Exception as e:
+            logger.error(f"Error handling live status of {state.channel}: {str(e)}")
+
+
+def create_from_environment(on_live, on_offline=None):
+    """A watcher for WATCHLIST_CHANNELS, or None when the list is empty"""
+    if not WATCHLIST_CHANNELS:
+        return None
+    return ChannelWatcher(WATCHLIST_CHANNELS, on_live, on_offline)
+
+
+def _simulate(channels=12, seconds=6.0):
+    """Poll a watchlist against a stub extractor that is slow and sometimes fails"""
+
+    class _StubExtractor:
+        def __init__(self):
+            self.live = {}
+
+        def check(self, live_url):
+            time.sleep(random.uniform(0.05, 0.2))  # Network round trip
+            if "flaky" in live_url:
+                raise RuntimeError("HTTP Error 429: Too Many Requests")
+            if random.random() < 0.2:
+                self.live[live_url] = not self.live.get(live_url, False)
+            if not self.live.get(live_url):
+                return None
+            video_id = f"{abs(hash(live_url)) % 10**11:011d}"
+            return {
+                "video_id": video_id,
+                "audio_url": f"https://example.invalid/{video_id}.m3u8",
+                "stream_info": {"title": live_url, "channel": live_url, "viewers": "0"},
+            }
+
+    events = []
+    watcher = ChannelWatcher(
+        [f"@channel{index}" for index in range(channels)] + ["@flaky"],
+        on_live=lambda channel, live: events.append(("live", channel)),
+        on_offline=lambda channel, video_id: events.append(("offline", channel)),
+        extractor=_StubExtractor(),
+        interval=0.5,
+        max_concurrent=3,
+        backoff_max=4.0,
+    )
+    watcher.start()
+    time.sleep(seconds)
+    watcher.stop()
+    watcher.join()
+
+    polls = sum(state.polls for state in watcher.states)
+    flaky = watcher.states[-1]
+    print(f"{polls} polls of {len(watcher.states)} channels in {seconds:.0f}s")
+    print(f"  max concurrent polls: {watcher.max_in_flight} (cap 3)")
+    print(f"  live reports: {sum(1 for kind, _ in events if kind == 'live')}")
+    print(f"  went offline: {sum(1 for kind, _ in events if kind == 'offline')}")
+    print(f"  failing channel: {flaky.polls} polls, {flaky.failures} failures in a row")
+
+
+if __name__ == "__main__":
+    _simulate()
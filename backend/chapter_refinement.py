@@ -0,0 +1,205 @@
+"""
+Chapter refinement module for YouTube Livestream Transcriber.
+Re-optimizes major topic (chapter) boundaries over the full chunk timeline.
+The live detector decides greedily one chunk at a time; this pass revisits those
+decisions with dynamic programming once more context is available.
+"""
+
+import re
+import logging
+import difflib
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Refinement settings
+DEFAULT_MIN_CHAPTER_CHUNKS = 2  # Shortest allowed chapter (20 s chunks)
+DEFAULT_MAX_CHAPTER_CHUNKS = 45  # Longest allowed chapter before a forced split
+DEFAULT_BOUNDARY_PENALTY = 0.65  # Cost of opening a chapter, matches live threshold
+DEFAULT_MERGE_SIMILARITY = 0.8  # Title similarity above which chapters are merged
+
+
+def refine_chapters(
+    chunks,
+    min_chunks=DEFAULT_MIN_CHAPTER_CHUNKS,
+    max_chunks=DEFAULT_MAX_CHAPTER_CHUNKS,
+    boundary_penalty=DEFAULT_BOUNDARY_PENALTY,
+    merge_similarity=DEFAULT_MERGE_SIMILARITY,
+    snap_boundary=None,
+):
+    """Return a globally optimized chapter list for a sequence of analyzed chunks.
+
+    Each chunk is a dict with "timestamp", "confidence" (boundary confidence that a
+    new chapter starts at this chunk, 0.0 if none was proposed) and "title" (the
+    title proposed for the content at this chunk, or None).
+    snap_boundary, if given, maps a boundary chunk's timestamp to a more precise one.
+    The result uses the same shape as the live "major_topic_change" event.
+    """
+    segments = refine_segments(
+        chunks, min_chunks, max_chunks, boundary_penalty, merge_similarity
+    )
+    return segments_to_chapters(chunks, segments, snap_boundary)
+
+
+def refine_segments(
+    chunks,
+    min_chunks=DEFAULT_MIN_CHAPTER_CHUNKS,
+    max_chunks=DEFAULT_MAX_CHAPTER_CHUNKS,
+    boundary_penalty=DEFAULT_BOUNDARY_PENALTY,
+    merge_similarity=DEFAULT_MERGE_SIMILARITY,
+):
+    """Optimized chapters as {"start", "end", "title"} with chunk indices"""
+    n = len(chunks)
+    if n == 0:
+        return []
+
+    boundaries = find_optimal_boundaries(
+        [chunk.get("confidence") or 0.0 for chunk in chunks],
+        min_chunks,
+        max_chunks,
+        boundary_penalty,
+    )
+
+    # Build segments with a title for each one
+    segments = []
+    for index, start in enumerate(boundaries):
+        end = boundaries[index + 1] if index + 1 < len(boundaries) else n
+        segments.append(
+            {"start": start, "end": end, "title": _segment_title(chunks, start, end)}
+        )
+
+    return merge_similar_segments(segments, merge_similarity, max_chunks)
+
+
+def segments_to_chapters(chunks, segments, snap_boundary=None):
+    """Convert index segments to the interval format used by the frontend"""
+    n = len(chunks)
+
+    def boundary_timestamp(index):
+        timestamp = chunks[index]["timestamp"]
+        return snap_boundary(timestamp) if snap_boundary and index > 0 else timestamp
+
+    chapters = []
+    for segment in segments:
+        start_timestamp = boundary_timestamp(segment["start"])
+        if segment["end"] < n:
+            end_timestamp = boundary_timestamp(segment["end"])
+        else:
+            end_timestamp = chunks[-1]["timestamp"]
+        chapters.append(
+            {
+                "interval": f"{start_timestamp}-{end_timestamp}",
+                "topic": segment["title"],
+            }
+        )
+
+    return chapters
+
+
+def find_optimal_boundaries(confidences, min_chunks, max_chunks, boundary_penalty):
+    """Pick chapter start indices maximizing total boundary confidence.
+
+    Opening a chapter at chunk j scores confidences[j] - boundary_penalty, so only
+    boundaries stronger than the penalty pay for themselves, while min/max lengths
+    are enforced as hard constraints. Runs in O(n * max_chunks).
+    """
+    n = len(confidences)
+    min_chunks = max(1, min_chunks)
+    # Any length >= min_chunks must be splittable into valid chapters
+    max_chunks = max(max_chunks, 2 * min_chunks - 1)
+
+    if n <= min_chunks:
+        return [0]
+
+    # best[i] is the best score for chunks[0:i] ending on a chapter boundary
+    neg_inf = float("-inf")
+    best = [neg_inf] * (n + 1)
+    previous = [-1] * (n + 1)
+    best[0] = 0.0
+
+    for end in range(min_chunks, n + 1):
+        lowest_start = max(0, end - max_chunks)
+        for start in range(lowest_start, end - min_chunks + 1):
+            if best[start] == neg_inf:
+                continue
+            # The first chapter is free, every later one must earn its boundary
+            gain = 0.0 if start == 0 else confidences[start] - boundary_penalty
+            score = best[start] + gain
+            if score > best[end]:
+                best[end] = score
+                previous[end] = start
+
+    if best[n] == neg_inf:
+        # Constraints could not be satisfied, keep everything as one chapter
+        return [0]
+
+    # Walk back from the end to recover boundaries
+    boundaries = []
+    position = n
+    while position > 0:
+        position = previous[position]
+        boundaries.append(position)
+    boundaries.reverse()
+    return boundaries
+
+
+def merge_similar_segments(
+    segments, merge_similarity, max_chunks=DEFAULT_MAX_CHAPTER_CHUNKS
+):
+    """Merge adjacent segments whose titles are near-duplicates.
+
+    A merge that would make a chapter longer than max_chunks is skipped, so the
+    length limit enforced by find_optimal_boundaries still holds afterwards.
+    """
+    merged = []
+    for segment in segments:
+        if (
+            merged
+            and segment["end"] - merged[-1]["start"] <= max_chunks
+            and title_similarity(merged[-1]["title"], segment["title"])
+            >= merge_similarity
+        ):
+            merged[-1]["end"] = segment["end"]
+            continue
+        merged.append(dict(segment))
+    return merged
+
+
+def title_similarity(first, second):
+    """Similarity between two chapter titles in the range 0.0-1.0"""
+    first_normalized = _normalize_title(first)
+    second_normalized = _normalize_title(second)
+    if not first_normalized or not second_normalized:
+        return 0.0
+    if first_normalized == second_normalized:
+        return 1.0
+
+    # Token overlap catches reordered titles, character ratio catches small edits
+    first_tokens = set(first_normalized.split())
+    second_tokens = set(second_normalized.split())
+    jaccard = len(first_tokens & second_tokens) / len(first_tokens | second_tokens)
+    ratio = difflib.SequenceMatcher(None, first_normalized, second_normalized).ratio()
+    return max(jaccard, ratio)
+
+
+def _normalize_title(title):
+    """Lowercase a title and strip punctuation for comparison"""
+    if not title:
+        return ""
+    return " ".join(re.sub(r"[^a-z0-9 ]+", " ", title.lower()).split())
+
+
+def _segment_title(chunks, start, end):
+    """Choose a title for chunks[start:end]"""
+    # Prefer the title proposed where the chapter begins, then inside the chapter
+    for index in range(start, end):
+        if chunks[index].get("title"):
+            return chunks[index]["title"]
+
+    # Fall back to the most recent title before the chapter
+    for index in range(start - 1, -1, -1):
+        if chunks[index].get("title"):
+            return chunks[index]["title"]
+
+    return "Untitled Chapter"
@@ -0,0 +1,110 @@
+"""
+Concurrency helpers for YouTube Livestream Transcriber.
+One execution model for the pipeline and detector workers, whether they run in the
+gevent web server (monkey-patched) or in a plain worker process.
+
+- Workers are threads, which become cooperative greenlets under gevent.
+- Workers block on their queue or stop event instead of polling with timeouts.
+- Blocking calls that gevent cannot make cooperative (Whisper/LLM SDK calls,
+  file hashing, local inference) are offloaded to a real OS thread pool.
+"""
+
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Sentinel put on worker queues to wake them up for shutdown
+STOP = object()
+
+# Live worker threads, used to verify nothing leaks across restarts
+_active_workers = set()
+_active_workers_lock = threading.Lock()
+
+
+class DropOldestQueue(queue.Queue):
+    """Queue that never blocks producers: when full, the oldest item is dropped"""
+
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+        self.dropped = 0
+
+    def put(self, item, block=True, timeout=None):
+        with self.not_empty:
+            if item is not STOP:
+                while self.limit and len(self.queue) >= self.limit:
+                    self.queue.popleft()
+                    self.unfinished_tasks -= 1
+                    self.dropped += 1
+            self.queue.append(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def trim(self, keep):
+        """Drop all but the newest keep items, returning how many were dropped"""
+        with self.mutex:
+            dropped = 0
+            while len(self.queue) > keep and self.queue[0] is not STOP:
+                self.queue.popleft()
+                self.unfinished_tasks -= 1
+                dropped += 1
+            self.dropped += dropped
+            return dropped
+
+
+def is_gevent_patched():
+    """Whether the current process has gevent-patched threading"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+def run_blocking(func, *args, **kwargs):
+    """Run a blocking call without starving other greenlets"""
+    if is_gevent_patched():
+        import gevent
+
+        # Real OS thread from the hub's pool; the calling greenlet yields meanwhile
+        return gevent.get_hub().threadpool.apply(func, args, kwargs)
+    return func(*args, **kwargs)
+
+
+def map_blocking(func, items, max_workers):
+    """Run a blocking call on each item in parallel OS threads, keeping order"""
+    if is_gevent_patched():
+        import gevent
+
+        return list(gevent.get_hub().threadpool.imap(func, items))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, items))
+
+
+def start_worker(target, *args, name=None):
+    """Start a daemon worker and track it until it exits"""
+
+    def run():
+        try:
+            target(*args)
+        finally:
+            with _active_workers_lock:
+                _active_workers.discard(thread)
+
+    thread = threading.Thread(target=run, name=name)
+    thread.daemon = True
+    with _active_workers_lock:
+        _active_workers.add(thread)
+    thread.start()
+    return thread
+
+
+def active_workers():
+    """Names of the worker threads that are currently running"""
+    with _active_workers_lock:
+        return sorted(thread.name for thread in _active_workers)
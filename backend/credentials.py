@@ -0,0 +1,182 @@
+"""
+Credentials module for YouTube Livestream Transcriber.
+Per-session API credentials and a per-key client pool.
+Each pipeline carries its own Credentials object, and every OpenAI call goes through
+the pooled client for that key, so concurrent streams never share a global key and
+each key keeps its own rate-limit state.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+import openai
+from dotenv import load_dotenv
+import llm_cache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Per-key rate limiting
+MAX_CONCURRENT_REQUESTS = int(os.getenv("OPENAI_MAX_CONCURRENT_REQUESTS", "4"))
+RATE_LIMIT_BASE_BACKOFF = 2.0  # Seconds to pause a key after its first 429
+RATE_LIMIT_MAX_BACKOFF = 60.0  # Longest pause after repeated 429s
+
+
+class Credentials:
+    """API credentials for one session"""
+
+    def __init__(self, api_key, source="env", api_base=None):
+        self.api_key = api_key
+        self.source = source  # "frontend" or "env", for logging only
+        self.api_base = api_base or os.getenv("OPENAI_API_BASE") or None
+
+    @classmethod
+    def from_environment(cls):
+        """Default credentials from the server's .env file"""
+        return cls(os.getenv("OPENAI_API_KEY"), source="env")
+
+    @property
+    def key_id(self):
+        """Stable, non-secret identifier for the key"""
+        if not self.api_key:
+            return "none"
+        return hashlib.sha256(self.api_key.encode("utf-8")).hexdigest()[:12]
+
+    def __repr__(self):
+        return f"Credentials(key_id={self.key_id}, source={self.source})"
+
+
+class RateLimitState:
+    """Concurrency cap and 429 backoff for one API key"""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_REQUESTS):
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.lock = threading.Lock()
+        self.paused_until = 0.0
+        self.consecutive_limits = 0
+
+    def wait_until_allowed(self):
+        """Sleep while the key is paused after a rate-limit response"""
+        with self.lock:
+            delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def record_rate_limit(self):
+        """Pause the key with exponential backoff"""
+        with self.lock:
+            self.consecutive_limits += 1
+            backoff = min(
+                RATE_LIMIT_BASE_BACKOFF * 2 ** (self.consecutive_limits - 1),
+                RATE_LIMIT_MAX_BACKOFF,
+            )
+            self.paused_until = max(self.paused_until, time.monotonic() + backoff)
+            return backoff
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_limits = 0
+
+
+class OpenAIClient:
+    """OpenAI SDK calls bound to one key and its rate-limit state"""
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self.rate_limit = RateLimitState()
+
+    def _call(self, func, **kwargs):
+        """Run one SDK call under this key's concurrency cap and backoff"""
+        self.rate_limit.wait_until_allowed()
+        with self.rate_limit.slots:
+            try:
+                result = func(
+                    api_key=self.credentials.api_key,
+                    api_base=self.credentials.api_base,
+                    **kwargs,
+                )
+            except openai.error.RateLimitError:
+                backoff = self.rate_limit.record_rate_limit()
+                logger.warning(
+                    f"Rate limited on key {self.credentials.key_id}, pausing {backoff:.0f}s"
+                )
+                raise
+        self.rate_limit.record_success()
+        return result
+
+    def _create_completion(self, on_usage, kwargs):
+        """One ChatCompletion.create call, reporting its token usage"""
+        response = self._call(openai.ChatCompletion.create, **kwargs)
+        if on_usage is not None and not kwargs.get("stream"):
+            on_usage(response.get("usage") or {})
+        return response
+
+    def chat_completion(self, on_usage=None, **kwargs):
+        """openai.ChatCompletion.create with this client's key, memoized by prompt
+
+        on_usage is called with the token usage of calls that reach the API,
+        not of cache hits.
+        """
+        cache = llm_cache.get_llm_cache()
+        if cache is None or kwargs.get("stream"):
+            return self._create_completion(on_usage, kwargs)
+
+        # Completions depend only on the request, so results are shared across keys
+        key = llm_cache.prompt_key(
+            kwargs["model"], kwargs["messages"], kwargs.get("max_tokens")
+        )
+        response = cache.get_or_call(
+            key,
+            lambda: self._create_completion(on_usage, kwargs).to_dict_recursive(),
+        )
+        # Fresh object per caller so nobody mutates the cached response
+        return openai.util.convert_to_openai_object(response)
+
+    def chat_completion_stream(self, on_usage=None, **kwargs):
+        """Yield the text deltas of a streamed chat completion with this client's key
+
+        Closing the generator early drops the HTTP response, which makes the
+        server stop generating (and billing) the rest of the completion.
+        on_usage is called with the completion tokens received (one per delta)
+        once the stream ends or is closed.
+        """
+        chunks = self._call(openai.ChatCompletion.create, stream=True, **kwargs)
+        received = 0
+        try:
+            for chunk in chunks:
+                if chunk.choices:
+                    text = chunk.choices[0].delta.get("content")
+                    if text:
+                        received += 1
+                        yield text
+        finally:
+            chunks.close()
+            if on_usage is not None:
+                on_usage({"completion_tokens": received})
+
+    def transcribe(self, model, file, **kwargs):
+        """openai.Audio.transcribe with this client's key"""
+        return self._call(openai.Audio.transcribe, model=model, file=file, **kwargs)
+
+
+# One client per key, shared by every session using that key
+_client_pool = {}
+_client_pool_lock = threading.Lock()
+
+
+def get_client(credentials):
+    """Return the pooled client for a session's credentials"""
+    pool_key = (credentials.api_key, credentials.api_base)
+    with _client_pool_lock:
+        client = _client_pool.get(pool_key)
+        if client is None:
+            client = OpenAIClient(credentials)
+            _client_pool[pool_key] = client
+            logger.info(f"Created OpenAI client for {credentials}")
+        return client
@@ -0,0 +1,249 @@
+"""
+Exporters module for YouTube Livestream Transcriber.
+Writes SRT and WebVTT captions and a YouTube chapter list for each stream while
+it is being transcribed. Captions are appended cue by cue and the chapter list is
+rewritten whenever chapters change, so a download only has to stream files that
+already exist on disk, however long the stream was. Old exports are pruned to
+EXPORT_MAX_STREAMS streams and EXPORT_MAX_MB on disk when a new one starts.
+"""
+
+import os
+import re
+import json
+import shutil
+import secrets
+import logging
+import datetime
+import threading
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Read size when streaming an export to a client
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+
+EXPORT_DIR = os.getenv(
+    "EXPORT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "exports"),
+)
+
+# Retention: the oldest finished exports are deleted beyond these limits
+EXPORT_MAX_STREAMS = int(os.getenv("EXPORT_MAX_STREAMS", "50"))
+EXPORT_MAX_MB = float(os.getenv("EXPORT_MAX_MB", "500"))
+# Exports written to this recently belong to running streams and are kept
+EXPORT_ACTIVE_SECONDS = 300
+
+# Which stream an export belongs to
+EXPORT_META_FILE = "stream.json"
+
+# Download name and MIME type of each export
+EXPORT_FILES = {
+    "srt": ("captions.srt", "application/x-subrip"),
+    "vtt": ("captions.vtt", "text/vtt"),
+    "chapters": ("chapters.txt", "text/plain"),
+}
+
+_UNSAFE_ID_PATTERN = re.compile(r"[^A-Za-z0-9_-]+")
+
+
+def _caption_time(seconds, separator):
+    """HH:MM:SS,mmm (SRT) or HH:MM:SS.mmm (VTT)"""
+    milliseconds = int(round(max(seconds, 0.0) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+def _chapter_time(seconds):
+    """YouTube description timestamp: M:SS, or H:MM:SS from one hour on"""
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def _parse_timestamp(timestamp):
+    """HH:MM:SS to seconds"""
+    seconds = 0
+    for part in timestamp.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def make_stream_id(name):
+    """Directory-safe export id for a stream started now
+
+    The random suffix keeps ids unguessable, since a download link is all a
+    client needs to fetch an export.
+    """
+    started = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    safe_name = _UNSAFE_ID_PATTERN.sub("-", name).strip("-")[:40] or "stream"
+    return f"{safe_name}-{started}-{secrets.token_hex(8)}"
+
+
+def export_path(stream_id, kind):
+    """File behind one export, or None for unknown ids and kinds"""
+    if kind not in EXPORT_FILES or _UNSAFE_ID_PATTERN.search(stream_id):
+        return None
+    return os.path.join(EXPORT_DIR, stream_id, EXPORT_FILES[kind][0])
+
+
+def read_blocks(path, size):
+    """Yield the first size bytes of a file in blocks
+
+    The file may still be growing, so the download stops at the size seen when
+    the request started and always matches its Content-Length.
+    """
+    with open(path, "rb") as export_file:
+        remaining = size
+        while remaining > 0:
+            block = export_file.read(min(DOWNLOAD_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def _export_usage(directory):
+    """(bytes, newest modification time) of one export directory"""
+    size = 0
+    modified = os.path.getmtime(directory)
+    for name in os.listdir(directory):
+        stat = os.stat(os.path.join(directory, name))
+        size += stat.st_size
+        modified = max(modified, stat.st_mtime)
+    return size, modified
+
+
+def _export_url(directory):
+    try:
+        with open(os.path.join(directory, EXPORT_META_FILE), encoding="utf-8") as meta:
+            return json.load(meta).get("url")
+    except (OSError, ValueError):
+        return None
+
+
+def _exports():
+    """(stream id, bytes, newest modification time) on disk, newest first"""
+    if not os.path.isdir(EXPORT_DIR):
+        return []
+    exports = []
+    for name in os.listdir(EXPORT_DIR):
+        directory = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.isdir(directory):
+                exports.append((name,) + _export_usage(directory))
+        except OSError:
+            continue  # Pruned meanwhile
+    return sorted(exports, key=lambda export: export[2], reverse=True)
+
+
+def list_exports(url):
+    """Stream ids with exports of one stream URL, newest first"""
+    return [
+        stream_id
+        for stream_id, _, _ in _exports()
+        if _export_url(os.path.join(EXPORT_DIR, stream_id)) == url
+    ]
+
+
+def prune_exports(
+    max_streams=EXPORT_MAX_STREAMS, max_bytes=EXPORT_MAX_MB * 1048576, now=None
+):
+    """Delete the oldest finished exports beyond the stream and size limits"""
+    now = datetime.datetime.now().timestamp() if now is None else now
+    kept_streams = 0
+    kept_bytes = 0
+    for stream_id, size, modified in _exports():
+        kept_streams += 1
+        kept_bytes += size
+        if kept_streams <= max_streams and kept_bytes <= max_bytes:
+            continue
+        if now - modified < EXPORT_ACTIVE_SECONDS:
+            continue  # Still being written
+        logger.info(f"Pruning export {stream_id} ({size / 1024:.0f} KB)")
+        shutil.rmtree(os.path.join(EXPORT_DIR, stream_id), ignore_errors=True)
+        kept_streams -= 1
+        kept_bytes -= size
+
+
+class StreamExport:
+    """Caption and chapter files for one stream, updated as results arrive"""
+
+    def __init__(self, stream_id, url=None):
+        self.stream_id = stream_id
+        self.directory = os.path.join(EXPORT_DIR, stream_id)
+        self.lock = threading.Lock()
+        self.cue_count = 0
+        self.chapters = []  # (start seconds, title)
+
+        prune_exports()
+        os.makedirs(self.directory, exist_ok=True)
+        with open(
+            os.path.join(self.directory, EXPORT_META_FILE), "w", encoding="utf-8"
+        ) as meta:
+            json.dump({"url": url}, meta)
+        self._write("vtt", "WEBVTT\n\n", mode="w")
+        self._write("srt", "", mode="w")
+        self._write("chapters", "", mode="w")
+
+    def _write(self, kind, text, mode="a"):
+        path = os.path.join(self.directory, EXPORT_FILES[kind][0])
+        with open(path, mode, encoding="utf-8") as export_file:
+            export_file.write(text)
+
+    def add_caption(self, start, end, text):
+        """Append one cue to both caption files"""
+        text = text.strip()
+        if not text or end <= start:
+            return
+        with self.lock:
+            self.cue_count += 1
+            self._write(
+                "srt",
+                f"{self.cue_count}\n{_caption_time(start, ',')} --> {_caption_time(end, ',')}\n{text}\n\n",
+            )
+            self._write(
+                "vtt",
+                f"{_caption_time(start, '.')} --> {_caption_time(end, '.')}\n{text}\n\n",
+            )
+
+    def add_chapter(self, interval, topic):
+        """Record a completed chapter from a major_topic_change interval"""
+        start = _parse_timestamp(interval.split("-")[0])
+        with self.lock:
+            self.chapters = [chapter for chapter in self.chapters if chapter[0] < start]
+            self.chapters.append((start, topic))
+            self._write_chapters()
+
+    def set_chapters(self, chapters):
+        """Replace the chapter list after a refinement pass"""
+        with self.lock:
+            self.chapters = [
+                (_parse_timestamp(chapter["interval"].split("-")[0]), chapter["topic"])
+                for chapter in chapters
+            ]
+            self._write_chapters()
+
+    def _write_chapters(self):
+        """Rewrite the chapter list; YouTube requires the first one at 0:00"""
+        lines = []
+        for index, (start, title) in enumerate(self.chapters):
+            lines.append(f"{_chapter_time(0 if index == 0 else start)} {title}\n")
+        path = os.path.join(self.directory, EXPORT_FILES["chapters"][0])
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as export_file:
+            export_file.writelines(lines)
+        os.replace(temp_path, path)
+
+    def urls(self):
+        """Download paths for the web server's export route"""
+        return {kind: f"/exports/{self.stream_id}/{kind}" for kind in EXPORT_FILES}
@@ -0,0 +1,293 @@
+"""
+Failure check for YouTube Livestream Transcriber.
+Injects extraction and transcription failures into a running pipeline and fails
+when a chunk is lost, a circuit breaker misbehaves or a dead-letter retry does
+not recover what was stored.
+
+Only the edges are stubbed: extraction writes random bytes where ffmpeg would
+and can be told to fail its next calls, and transcription goes to the stub
+OpenAI server unless the API is marked down. The checks cover:
+
+- chunks that fail extraction or transcription end up in the DeadLetterStore,
+  the latter with their audio;
+- the API breaker opens, lets a single probe through when half-open, doubles
+  its pause when the probe fails and closes once a probe succeeds;
+- retry_dead_letters only touches the requested stream's chunks, records
+  another attempt for every chunk that fails again, and removes the chunks it
+  recovers.
+
+Run `python failure_check.py`; the exit status is 1 when any check failed.
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import credentials
+import disk_cache
+import exporters
+import pipeline
+import resilience
+import stub_openai
+import transcription
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Breaker pause while checking, short so probes happen within the check
+FAILURE_BREAKER_RESET_SECONDS = 0.2
+FAILURE_WAIT_SECONDS = 30
+
+
+class _FlakySource:
+    """Writes chunks where ffmpeg would, failing its next calls on request"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.chunks = 0
+        self.failures_left = 0
+
+    def extract(
+        self,
+        audio_url,
+        chunk_duration=15,
+        start_time=0,
+        register_process=None,
+        temp_dir=None,
+    ):
+        time.sleep(0.01)  # Keep the ingest loop from spinning
+        if self.failures_left:
+            self.failures_left -= 1
+            raise RuntimeError("ffmpeg exited with status 1")
+        temp_file = tempfile.NamedTemporaryFile(
+            suffix=".mp3", delete=False, dir=temp_dir or self.directory
+        )
+        with temp_file:
+            temp_file.write(os.urandom(2048))
+        self.chunks += 1
+        return temp_file.name, (start_time, chunk_duration)
+
+
+class _FlakyApi:
+    """Transcribes through the stub server unless the API is marked down"""
+
+    def __init__(self, transcribe):
+        self.transcribe_audio_chunk = transcribe
+        self.down = False
+        self.calls = 0
+
+    def transcribe(self, *args, **kwargs):
+        self.calls += 1
+        if self.down:
+            raise RuntimeError("The server is overloaded or not ready yet")
+        return self.transcribe_audio_chunk(*args, **kwargs)
+
+
+class _RecordingEmitter:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, data=None, **kwargs):
+        self.events.append((event, data, kwargs.get("to")))
+
+
+def _wait_until(condition, timeout=FAILURE_WAIT_SECONDS):
+    """Poll condition until it holds; False on timeout"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def failure_check():
+    """Run the failure scenarios and return True when every check passed"""
+    logging.getLogger().setLevel(logging.ERROR)
+    scratch = tempfile.mkdtemp(prefix="failure-check-")
+    server = stub_openai.serve(0)
+
+    pipeline.CHUNK_TEMP_DIR = scratch
+    exporters.EXPORT_DIR = os.path.join(scratch, "exports")
+    resilience.DEAD_LETTER_DIR = os.path.join(scratch, "dead-letters")
+    resilience._dead_letters = None
+    disk_cache.RESULT_CACHE_ENABLED = False  # Fingerprinting needs ffmpeg
+    # Same attempt counts, without the real backoff delays
+    resilience.RETRY_POLICIES = {
+        stage: resilience.RetryPolicy(policy.attempts, 0.01, 0.02)
+        for stage, policy in resilience.RETRY_POLICIES.items()
+    }
+    source = _FlakySource(scratch)
+    api = _FlakyApi(transcription.transcribe_audio_chunk)
+    transcription.extract_audio_chunk = source.extract
+    transcription.transcribe_audio_chunk = api.transcribe
+    transcription.get_audio_stream_url = lambda url: (
+        "failure://audio",
+        {"title": "Failure Check Stream", "channel": "Failure", "viewers": "0"},
+    )
+    session_credentials = credentials.Credentials(
+        "sk-failure", api_base=f"http://127.0.0.1:{server.server_port}/v1"
+    )
+    store = resilience.get_dead_letters()
+
+    failures = []
+
+    def check(passed, message):
+        print(f"{'ok  ' if passed else 'FAIL'} {message}")
+        if not passed:
+            failures.append(message)
+        return passed
+
+    def stored(stage):
+        return [entry for entry in store.list_entries() if entry["stage"] == stage]
+
+    livestream = pipeline.LivestreamPipeline(
+        "https://www.youtube.com/watch?v=failurechk0",
+        _RecordingEmitter(),
+        session_credentials,
+    )
+    breaker = livestream.api_breaker
+    breaker.base_reset_seconds = breaker.reset_seconds = FAILURE_BREAKER_RESET_SECONDS
+    # (state, pause, API calls so far) after each breaker change
+    transitions = []
+    report_breaker = breaker.on_change
+
+    def record_transition(changed):
+        transitions.append((changed.state, changed.reset_seconds, api.calls))
+        report_breaker(changed)
+
+    breaker.on_change = record_transition
+    livestream.start()
+
+    try:
+        # Extraction fails on every attempt for one chunk
+        _wait_until(lambda: source.chunks >= 2)
+        source.failures_left = resilience.RETRY_POLICIES["extract"].attempts
+        check(
+            _wait_until(lambda: stored("extract")),
+            "a chunk that failed extraction was dead-lettered",
+        )
+        check(
+            livestream.source_breaker.state == "closed",
+            "a single failed chunk left the source breaker closed",
+        )
+
+        # The API goes down: open, failed probe, longer pause, then recovery
+        api.down = True
+        states = lambda: [state for state, _, _ in transitions]
+        probe_failed = _wait_until(
+            lambda: states()[:3] == ["open", "half_open", "open"]
+        )
+        if check(probe_failed, "API breaker opened and reopened after a failed probe"):
+            _, first_pause, _ = transitions[0]
+            _, _, calls_at_probe = transitions[1]
+            _, second_pause, calls_after_probe = transitions[2]
+            check(
+                calls_after_probe - calls_at_probe == 1,
+                f"the half-open probe made a single call ({calls_after_probe - calls_at_probe})",
+            )
+            check(
+                second_pause == 2 * first_pause,
+                f"the failed probe doubled the pause ({first_pause}s -> {second_pause}s)",
+            )
+        api.down = False
+        check(
+            _wait_until(lambda: states()[-1:] == ["closed"]),
+            "API breaker closed after a successful probe",
+        )
+        check(
+            breaker.reset_seconds == FAILURE_BREAKER_RESET_SECONDS,
+            "closing restored the base pause",
+        )
+        chunks = source.chunks
+        check(
+            _wait_until(lambda: source.chunks >= chunks + 2),
+            "ingest continued after recovery",
+        )
+    finally:
+        livestream.stop(timeout=5.0)
+
+    transcribe_letters = stored("transcribe")
+    check(
+        len(transcribe_letters) > breaker.failure_threshold,
+        f"chunks that failed transcription were dead-lettered ({len(transcribe_letters)})",
+    )
+    check(
+        all(
+            entry["audio_file"] and os.path.exists(entry["audio_file"])
+            for entry in transcribe_letters
+        ),
+        "dead-lettered transcriptions kept their audio",
+    )
+
+    # Another stream's chunk, which a retry for this stream must leave alone
+    entries = store.list_entries()
+    other = store.add(
+        "https://www.youtube.com/watch?v=otherstream0",
+        "extract",
+        "ffmpeg exited with status 1",
+        "00:00:20",
+        20,
+        20,
+    )
+
+    # Retrying while the API is still down only counts another attempt
+    api.down = True
+    emitter = _RecordingEmitter()
+    pipeline.retry_dead_letters(
+        emitter, session_credentials, to="requester", url=livestream.url
+    )
+    retried = store.list_entries(livestream.url)
+    check(
+        len(retried) == len(entries)
+        and all(entry["attempts"] == 2 for entry in retried),
+        "failed retries recorded another attempt and kept every chunk",
+    )
+
+    # Once the API is back every chunk is recovered and removed
+    api.down = False
+    emitter = _RecordingEmitter()
+    pipeline.retry_dead_letters(
+        emitter, session_credentials, to="requester", url=livestream.url
+    )
+    recovered = [
+        event for event in emitter.events if event[0] == "dead_letter_recovered"
+    ]
+    check(
+        len(recovered) == len(entries) and not store.list_entries(livestream.url),
+        f"retry recovered and removed every chunk ({len(recovered)} of {len(entries)})",
+    )
+    check(
+        [entry["id"] for entry in store.list_entries()] == [other["id"]]
+        and store.list_entries()[0]["attempts"] == 1,
+        "retries left other streams' chunks untouched",
+    )
+    check(
+        not any(
+            entry["audio_file"] and os.path.exists(entry["audio_file"])
+            for entry in entries
+        ),
+        "recovered chunks' audio was deleted",
+    )
+    check(
+        all(to == "requester" for _, _, to in emitter.events),
+        "retry results went to the requesting client only",
+    )
+
+    if failures:
+        print(f"FAIL: {len(failures)} check(s) failed")
+    else:
+        print(
+            "PASS: every failure was dead-lettered, the breaker recovered and retries drained the store"
+        )
+
+    server.shutdown()
+    shutil.rmtree(scratch, ignore_errors=True)
+    return not failures
+
+
+if __name__ == "__main__":
+    sys.exit(0 if failure_check() else 1)
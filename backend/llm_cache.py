@@ -0,0 +1,171 @@
+"""
+LLM cache module for YouTube Livestream Transcriber.
+Memoizes chat completions by a normalized hash of (model, messages, max_tokens).
+An in-memory LRU with TTL sits in front of an optional on-disk tier, and concurrent
+identical requests are collapsed into one API call (single-flight), so restarts,
+replays and sessions watching the same stream don't pay for the same prompt twice.
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+import disk_cache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Cache settings
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 3600)))
+LLM_CACHE_DISK = os.getenv("LLM_CACHE_DISK", "false").lower() == "true"
+LLM_CACHE_DIR = os.getenv(
+    "LLM_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "llm"),
+)
+LLM_CACHE_DISK_MAX_MB = float(os.getenv("LLM_CACHE_DISK_MAX_MB", "64"))
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def prompt_key(model, messages, max_tokens):
+    """Hash of a chat request with insignificant whitespace normalized away"""
+    normalized = [
+        (message["role"], _WHITESPACE_PATTERN.sub(" ", message["content"]).strip())
+        for message in messages
+    ]
+    return disk_cache.make_key("chat", model, max_tokens, normalized)
+
+
+class _Flight:
+    """One in-progress call that identical requests wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class LLMResponseCache:
+    """Memory LRU + optional disk tier + TTL + single-flight for chat completions"""
+
+    def __init__(self, max_entries, ttl_seconds, disk=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk = disk
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()  # key -> (expires_at, value)
+        self.inflight = {}  # key -> _Flight
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+
+    def _lookup(self, key):
+        """Return a fresh cached value from memory or disk, or None"""
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self.memory.move_to_end(key)
+                return entry[1]
+            del self.memory[key]
+
+        if self.disk is not None:
+            stored = self.disk.get(key)
+            if stored is not None and stored["expires_at"] > now:
+                self._remember(key, stored["expires_at"], stored["value"])
+                return stored["value"]
+        return None
+
+    def _remember(self, key, expires_at, value):
+        self.memory[key] = (expires_at, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get_or_call(self, key, call):
+        """Return the cached value for key, calling call() at most once concurrently"""
+        with self.lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+            flight = self.inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self.inflight[key] = flight
+                self.misses += 1
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            # An identical request is already running, share its result
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = call()
+            expires_at = time.time() + self.ttl_seconds
+            with self.lock:
+                self._remember(key, expires_at, flight.value)
+            if self.disk is not None:
+                self.disk.set(key, {"expires_at": expires_at, "value": flight.value})
+            return flight.value
+        except Exception as e:
+            # Failures are shared with waiters but never cached
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            flight.done.set()
+
+    def stats(self):
+        """Hit/miss metrics for reporting"""
+        with self.lock:
+            lookups = self.hits + self.misses + self.collapsed
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "collapsed": self.collapsed,
+                "hit_rate": (
+                    round((self.hits + self.collapsed) / lookups, 3) if lookups else 0.0
+                ),
+                "entries": len(self.memory),
+            }
+
+
+# Shared LLM cache for this process
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Return the process-wide LLM cache, or None when caching is disabled"""
+    global _llm_cache
+
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            disk = None
+            if LLM_CACHE_DISK:
+                disk = disk_cache.DiskLRUCache(
+                    LLM_CACHE_DIR, int(LLM_CACHE_DISK_MAX_MB * 1024 * 1024)
+                )
+            _llm_cache = LLMResponseCache(
+                LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS, disk
+            )
+        return _llm_cache
@@ -0,0 +1,160 @@
+"""
+LLM stream module for YouTube Livestream Transcriber.
+Streams chat completions and parses their "[Name: value]" fields as they arrive.
+
+The topic prompts answer in bracketed fields, decision first. Parsing the stream
+lets a caller stop as soon as it has what it needs: right after "[Topic Change:
+No]" (the topic is kept, nothing else matters) or right after the title field
+closes, instead of waiting for the full completion.
+
+Run `python llm_stream.py` to compare streamed and buffered topic calls against
+the stub OpenAI server, which streams its replies as SSE chunks.
+"""
+
+import os
+import re
+import time
+import logging
+from dotenv import load_dotenv
+import disk_cache
+import llm_cache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() == "true"
+
+_FIELD_PATTERN = re.compile(r"\[([^\[\]:]+):([^\[\]]*)\]")
+
+
+class FieldParser:
+    """Incremental parser for "[Name: value]" fields in streamed text"""
+
+    def __init__(self):
+        self.text = ""
+        self.position = 0  # Everything before this has been parsed
+        self.fields = {}
+
+    def feed(self, delta):
+        """Add streamed text and return the (name, value) fields it closed"""
+        self.text += delta
+        closed = []
+        for match in _FIELD_PATTERN.finditer(self.text, self.position):
+            name, value = match.group(1).strip(), match.group(2).strip()
+            self.fields[name] = value
+            closed.append((name, value))
+            self.position = match.end()
+        return closed
+
+
+def is_no(value):
+    """Whether a Yes/No field says No"""
+    return value.strip().lower().startswith("no")
+
+
+def _complete_text(client, fields, stop_on, kwargs):
+    """Stream one completion until every field is closed or stop_on fires"""
+    parser = FieldParser()
+    if not LLM_STREAMING:
+        response = client.chat_completion(**kwargs)
+        parser.feed(response.choices[0].message.content)
+        return parser.text, False
+
+    stream = client.chat_completion_stream(**kwargs)
+    cancelled = False
+    try:
+        for delta in stream:
+            for name, value in parser.feed(delta):
+                if stop_on is not None and stop_on(name, value):
+                    cancelled = True
+                elif name in fields and all(field in parser.fields for field in fields):
+                    cancelled = True  # Nothing after the last field is used
+            if cancelled:
+                break
+    finally:
+        stream.close()  # Drops the connection when stopping early
+    return parser.text, cancelled
+
+
+def stream_fields(client, fields, stop_on=None, **kwargs):
+    """Run a chat completion and return (fields, raw text) as early as possible
+
+    The completion is cut off once all of fields are closed, or as soon as
+    stop_on(name, value) returns True for a closed field. Results, including
+    cut-off ones, are memoized by prompt like other chat completions.
+    """
+    started = time.perf_counter()
+    cache = llm_cache.get_llm_cache()
+    if cache is None:
+        text, cancelled = _complete_text(client, fields, stop_on, kwargs)
+    else:
+        key = disk_cache.make_key(
+            "chat-stream",
+            llm_cache.prompt_key(
+                kwargs["model"], kwargs["messages"], kwargs.get("max_tokens")
+            ),
+            fields,
+        )
+        outcome = {}
+
+        def call():
+            outcome["text"], outcome["cancelled"] = _complete_text(
+                client, fields, stop_on, kwargs
+            )
+            return outcome["text"]
+
+        text = cache.get_or_call(key, call)
+        cancelled = outcome.get("cancelled", False)
+
+    parser = FieldParser()
+    parser.feed(text)
+    if cancelled:
+        logger.debug(
+            f"Completion stopped early after {len(text)} chars in {time.perf_counter() - started:.2f}s"
+        )
+    return parser.fields, text.strip()
+
+
+def _benchmark(calls=20, token_delay=0.02):
+    """Streamed vs buffered major topic calls against the SSE stub server"""
+    import credentials
+    import llm_stream
+    import stub_openai
+    import major_topic_detection
+
+    server = stub_openai.serve(0, token_delay=token_delay)
+    client = credentials.OpenAIClient(
+        credentials.Credentials(
+            "sk-stub", api_base=f"http://127.0.0.1:{server.server_port}/v1"
+        )
+    )
+    llm_cache.LLM_CACHE_ENABLED = False  # Measure API calls, not cache hits
+
+    for streaming in (False, True):
+        llm_stream.LLM_STREAMING = streaming
+        state = stub_openai.StubHandler.state
+        state.tokens_sent = 0
+        started = time.perf_counter()
+        for index in range(calls):
+            major_topic_detection.detect_major_topic_change(
+                client,
+                # Every fifth chunk is an explicit transition
+                f"{'Moving on to' if index % 5 == 0 else 'Still on'} bitcoin support levels",
+                "Bitcoin Analysis",
+            )
+        elapsed = (time.perf_counter() - started) / calls
+        print(
+            f"{'streamed' if streaming else 'buffered'}: {elapsed * 1000:.0f} ms per call, "
+            f"{state.tokens_sent / calls:.1f} tokens generated per call"
+        )
+
+    print(f"  stub counters: {stub_openai.StubHandler.state.counts}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    _benchmark()
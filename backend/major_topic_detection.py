@@ -2,290 +2,445 @@
 Major topic detection module for YouTube Livestream Transcriber.
 Analyzes transcription chunks to detect significant topic changes for YouTube content.
 Generates detailed, YouTube-optimized section titles with keywords.
+Prompts carry the entities tagged in each topic (see entities.py) as short
+hints, which stand in for most of the previous topic's transcript excerpt.
 """
 
 import os
 import logging
 import threading
-import queue
 import time
-import openai
 from dotenv import load_dotenv
+import chapter_refinement
+import concurrency
+import overload
+import summaries
+import llm_stream
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load environment variables and set up OpenAI API key
+# Load environment variables
 load_dotenv()
-# First check if a temporary API key is set, otherwise use the one from .env
-openai.api_key = os.environ.get("TEMP_OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
-
-# Global variables
-major_topic_queue = queue.Queue()
-current_major_topic = None
-previous_major_topic = None
-stop_detection_flag = False
-detection_thread = None
-topic_start_timestamp = None
-
-# Two-stage context model
-previous_topic_transcription = []  # Complete transcription for the previous topic
-current_transcription = []  # Current transcription being analyzed
-
-last_topic_change_timestamp = None
-min_topic_duration_chunks = 2  # Minimum chunks before allowing topic change
-socketio_instance = None  # Store socketio instance for use when stopping
-
-# Memory management - max chunks per topic before summarizing
-MAX_CURRENT_CHUNKS = 100  # After this many chunks, start summarizing to save memory
-MAX_PREV_SUMMARY_LENGTH = 5000  # Maximum characters for previous topic summary
-
-
-def start_major_topic_detection(socketio):
-    """Start the major topic detection thread"""
-    global detection_thread, stop_detection_flag, current_major_topic, previous_major_topic
-    global topic_start_timestamp, previous_topic_transcription, current_transcription
-    global last_topic_change_timestamp, socketio_instance
-
-    stop_detection_flag = False
-    current_major_topic = None
-    previous_major_topic = None
-    topic_start_timestamp = None
-    previous_topic_transcription = []
-    current_transcription = []
-    last_topic_change_timestamp = None
-    socketio_instance = socketio  # Store for later use
-
-    detection_thread = threading.Thread(
-        target=major_topic_detection_worker, args=(socketio,)
-    )
-    detection_thread.daemon = True
-    detection_thread.start()
-    logger.info("Major topic detection thread started")
-
-
-def stop_major_topic_detection():
-    """Stop the major topic detection thread"""
-    global stop_detection_flag, current_major_topic, topic_start_timestamp, current_transcription, socketio_instance
-
-    # Before stopping, emit the final topic if we have one
-    if (
-        socketio_instance
-        and current_major_topic
-        and topic_start_timestamp
-        and current_transcription
-    ):
-        try:
-            # Get the last timestamp from the current transcription
-            last_timestamp = current_transcription[-1]["timestamp"]
-            interval = f"{topic_start_timestamp}-{last_timestamp}"
 
-            # Log and emit the completed topic
-            log_message = (
-                f"Final major topic completed: {current_major_topic} ({interval})"
-            )
-            logger.info(log_message)
+# Minimum chunks before allowing topic change
+MIN_TOPIC_DURATION_CHUNKS = 2
 
-            socketio_instance.emit(
-                "debug_log", {"message": log_message, "type": "success"}
-            )
-            socketio_instance.emit(
-                "major_topic_change",
-                {"interval": interval, "topic": current_major_topic},
-            )
-        except Exception as e:
-            logger.error(f"Error emitting final topic: {str(e)}")
+# Memory management - max chunks per topic kept for timestamps
+MAX_CURRENT_CHUNKS = 100  # Prompt context comes from the rolling summaries
 
-    stop_detection_flag = True
-    logger.info("Major topic detection thread stopping")
+# Retrospective chapter refinement over the whole stream
+REFINE_INTERVAL_CHUNKS = int(os.getenv("CHAPTER_REFINE_INTERVAL_CHUNKS", "90"))
+# Analyzed chunks kept for refinement; older chapters are frozen as they are
+CHAPTER_HISTORY_MAX_CHUNKS = int(os.getenv("CHAPTER_HISTORY_MAX_CHUNKS", "1080"))
 
+# Previous topic digest size when its entity hints are in the prompt
+HINTED_PREVIOUS_DIGEST_TOKENS = int(os.getenv("HINTED_PREVIOUS_DIGEST_TOKENS", "100"))
 
-def add_transcription_for_major_analysis(timestamp, text):
-    """Add a transcription chunk to the major topic analysis queue"""
-    global major_topic_queue
-    major_topic_queue.put({"timestamp": timestamp, "text": text})
-    logger.debug(f"Added transcription to major topic detection queue at {timestamp}")
 
+class MajorTopicDetector:
+    """Major topic (chapter) detection worker for one pipeline"""
 
-def major_topic_detection_worker(socketio):
-    """Worker thread that processes transcriptions and detects major topic changes"""
-    global major_topic_queue, current_major_topic, previous_major_topic, stop_detection_flag
-    global topic_start_timestamp, current_transcription, last_topic_change_timestamp
+    def __init__(self, socketio, client):
+        self.socketio = socketio  # Also used when stopping
+        self.client = client  # Per-key OpenAI client for this session
+        self.major_topic_queue = concurrency.DropOldestQueue(
+            overload.DETECTOR_QUEUE_MAX
+        )
+        self.detection_thread = None
+        self.stopped = threading.Event()
+
+        self.current_major_topic = None
+        self.previous_major_topic = None
+        self.topic_start_timestamp = None
+
+        # Two-stage context model, condensed in the background
+        self.summarizer = summaries.Summarizer(client)
+        self.previous_topic_context = None  # Rolling summary of the previous topic
+        self.current_topic_context = summaries.RollingSummary(self.summarizer)
+        self.current_transcription = []  # Current transcription being analyzed
+
+        self.last_topic_change_timestamp = None
+        self.min_topic_duration_chunks = MIN_TOPIC_DURATION_CHUNKS
+        self.budget = None  # accounting.BudgetController, set by the pipeline
+        self.chunks_seen = 0
+
+        # Analyzed chunks with their boundary confidence and title, and the
+        # chapters before them that are no longer refined
+        self.chunk_history = []
+        self.frozen_chapters = []
+        self.analyzed_chunks = 0
+        self.last_refined_at = 0  # analyzed_chunks at the last refinement pass
+
+        # Optional timestamp -> timestamp refinement for chapter boundaries
+        self.snap_boundary = None
+        # Optional (start, end=None) -> hint of the entities mentioned in between
+        self.entity_hint = None
+        self.previous_topic_span = None  # (start, end) of the previous topic
+        # Optional exporters.StreamExport that keeps the chapter file current
+        self.export = None
+
+    def start(self):
+        """Start the major topic detection thread"""
+        self.stopped.clear()
+        self.summarizer.start()
+        self.detection_thread = concurrency.start_worker(
+            self.major_topic_detection_worker, name="major-topic-detection"
+        )
+        logger.info("Major topic detection thread started")
 
-    while not stop_detection_flag:
-        try:
-            # Get transcription from queue with timeout to allow checking stop flag
+    def stop(self, timeout=5.0):
+        """Stop the major topic detection thread and wait for its final chapters"""
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        # Wake the worker; it emits the final chapters once it dequeues this
+        self.major_topic_queue.put(concurrency.STOP)
+        self.summarizer.stop()
+        logger.info("Major topic detection thread stopping")
+        if threading.current_thread() is not self.detection_thread:
+            self.join(timeout)
+
+    def join(self, timeout=None):
+        """Wait for the worker to exit"""
+        if self.detection_thread is not None:
+            self.detection_thread.join(timeout)
+        self.summarizer.join(timeout)
+
+    def emit_final_chapters(self):
+        """Emit the open topic and the refined chapter list (worker thread only)"""
+        if (
+            self.current_major_topic
+            and self.topic_start_timestamp
+            and self.current_transcription
+        ):
             try:
-                transcription = major_topic_queue.get(timeout=1.0)
-            except queue.Empty:
-                # No new transcriptions, just continue
-                continue
+                # Get the last timestamp from the current transcription
+                last_timestamp = self.current_transcription[-1]["timestamp"]
+                interval = f"{self.topic_start_timestamp}-{last_timestamp}"
+
+                # Log and emit the completed topic
+                log_message = f"Final major topic completed: {self.current_major_topic} ({interval})"
+                logger.info(log_message)
+
+                self.socketio.emit(
+                    "debug_log", {"message": log_message, "type": "success"}
+                )
+                self.socketio.emit(
+                    "major_topic_change",
+                    {"interval": interval, "topic": self.current_major_topic},
+                )
+                if self.export:
+                    self.export.add_chapter(interval, self.current_major_topic)
+            except Exception as e:
+                logger.error(f"Error emitting final topic: {str(e)}")
+
+        # Re-optimize all chapter boundaries now that the whole stream is known
+        if self.chunk_history:
+            self.emit_refined_chapters()
+
+    def add_transcription_for_major_analysis(self, timestamp, text):
+        """Add a transcription chunk to the major topic analysis queue"""
+        self.major_topic_queue.put({"timestamp": timestamp, "text": text})
+        logger.debug(
+            f"Added transcription to major topic detection queue at {timestamp}"
+        )
 
-            timestamp = transcription["timestamp"]
-            text = transcription["text"]
+    def major_topic_detection_worker(self):
+        """Worker thread that processes transcriptions and detects major topic changes"""
+        while True:
+            try:
+                # Block until a transcription arrives or stop() wakes us up
+                transcription = self.major_topic_queue.get()
+                if transcription is concurrency.STOP or self.stopped.is_set():
+                    break
+
+                timestamp = transcription["timestamp"]
+                text = transcription["text"]
+
+                # Process the new transcription
+                self.process_transcription(timestamp, text)
+
+                # Periodically correct the chapters emitted so far, whichever
+                # path recorded the chunks
+                if (
+                    REFINE_INTERVAL_CHUNKS
+                    and self.analyzed_chunks - self.last_refined_at
+                    >= REFINE_INTERVAL_CHUNKS
+                ):
+                    self.last_refined_at = self.analyzed_chunks
+                    self.emit_refined_chapters()
+
+            except Exception as e:
+                error_message = f"Error in major topic detection worker: {str(e)}"
+                logger.error(error_message)
+                self.socketio.emit(
+                    "debug_log", {"message": error_message, "type": "error"}
+                )
+
+        # Only this thread touches the topic state, so the final chapters
+        # follow every change it emitted
+        self.emit_final_chapters()
+        logger.info("Major topic detection thread stopped")
 
-            # Process the new transcription
-            process_transcription(socketio, timestamp, text)
+    def record_chunk(self, timestamp, confidence, title):
+        """Record an analyzed chunk for the retrospective refinement pass"""
+        self.chunk_history.append(
+            {"timestamp": timestamp, "confidence": confidence, "title": title}
+        )
+        self.analyzed_chunks += 1
+        if len(self.chunk_history) > CHAPTER_HISTORY_MAX_CHUNKS:
+            self.freeze_old_chapters()
+
+    def freeze_old_chapters(self):
+        """Fix the chapters in the older half of the history and drop their chunks"""
+        segments = chapter_refinement.refine_segments(
+            self.chunk_history, min_chunks=self.min_topic_duration_chunks
+        )
+        # The chapter running at the cut stays open; a single chapter is split
+        cut = len(self.chunk_history) - CHAPTER_HISTORY_MAX_CHUNKS // 2
+        keep_from = max(
+            segment["start"] for segment in segments if segment["start"] <= cut
+        )
+        if keep_from == 0:
+            keep_from = cut
+
+        frozen = [dict(segment) for segment in segments if segment["start"] < keep_from]
+        frozen[-1]["end"] = keep_from
+        self.frozen_chapters = join_chapters(
+            self.frozen_chapters,
+            chapter_refinement.segments_to_chapters(
+                self.chunk_history, frozen, self.snap_boundary
+            ),
+        )
+        del self.chunk_history[:keep_from]
+        logger.info(
+            f"Froze {len(frozen)} chapters, refining the last {len(self.chunk_history)} chunks"
+        )
 
+    def emit_refined_chapters(self):
+        """Run the refinement pass over the chunk history and emit the corrected chapters"""
+        socketio = self.socketio
+        try:
+            start = time.perf_counter()
+            chapters = chapter_refinement.refine_chapters(
+                self.chunk_history,
+                min_chunks=self.min_topic_duration_chunks,
+                snap_boundary=self.snap_boundary,
+            )
+            chapters = join_chapters(self.frozen_chapters, chapters)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            log_message = f"Refined {len(self.chunk_history)} chunks into {len(chapters)} chapters in {elapsed_ms:.1f} ms"
+            logger.info(log_message)
+            socketio.emit("debug_log", {"message": log_message})
+            socketio.emit("major_topics_refined", {"chapters": chapters})
+            if self.export:
+                self.export.set_chapters(chapters)
         except Exception as e:
-            error_message = f"Error in major topic detection worker: {str(e)}"
+            error_message = f"Chapter refinement failed: {str(e)}"
             logger.error(error_message)
             socketio.emit("debug_log", {"message": error_message, "type": "error"})
 
+    def manage_memory_usage(self):
+        """Bound the chunks kept for timestamps; text lives in the rolling summaries"""
+        # If current transcription is too large, keep only the most recent chunks
+        if len(self.current_transcription) > MAX_CURRENT_CHUNKS:
+            # Keep the first chunk (for timestamp), most recent chunks, and middle context
+            start_chunk = self.current_transcription[0]
+            recent_chunks = self.current_transcription[
+                -50:
+            ]  # Keep the 50 most recent chunks
+
+            # Log memory management
+            logger.info(
+                f"Memory management: Reducing current transcription from {len(self.current_transcription)} to 51 chunks"
+            )
 
-def manage_memory_usage():
-    """Manage memory by summarizing if needed"""
-    global current_transcription, previous_topic_transcription
-
-    # If current transcription is too large, keep only the most recent chunks
-    if len(current_transcription) > MAX_CURRENT_CHUNKS:
-        # Keep the first chunk (for timestamp), most recent chunks, and middle context
-        start_chunk = current_transcription[0]
-        recent_chunks = current_transcription[-50:]  # Keep the 50 most recent chunks
+            # Reset with selected chunks
+            self.current_transcription = [start_chunk] + recent_chunks
 
-        # Log memory management
-        logger.info(
-            f"Memory management: Reducing current transcription from {len(current_transcription)} to 51 chunks"
-        )
+    def process_transcription(self, timestamp, text):
+        """Process a single transcription chunk for major topic detection"""
+        socketio = self.socketio
 
-        # Reset with selected chunks
-        current_transcription = [start_chunk] + recent_chunks
+        # Add to current transcription collection
+        self.current_transcription.append({"timestamp": timestamp, "text": text})
+        self.current_topic_context.add(timestamp, text)
 
-    # Ensure previous topic transcription doesn't get too large
-    if previous_topic_transcription:
-        combined_text = " ".join(
-            [item["text"] for item in previous_topic_transcription]
-        )
-        if len(combined_text) > MAX_PREV_SUMMARY_LENGTH:
-            # Keep only start and end timestamps but summarize text
-            first_chunk = previous_topic_transcription[0]
-            last_chunk = previous_topic_transcription[-1]
-
-            # Create a summarized version (keeping important timestamps)
-            previous_topic_transcription = [
-                first_chunk,
-                {
-                    "timestamp": "summary",
-                    "text": combined_text[:MAX_PREV_SUMMARY_LENGTH],
-                },
-                last_chunk,
-            ]
-            logger.info("Memory management: Summarized previous topic transcription")
-
-
-def process_transcription(socketio, timestamp, text):
-    """Process a single transcription chunk for major topic detection"""
-    global current_major_topic, previous_major_topic, topic_start_timestamp
-    global current_transcription, previous_topic_transcription, last_topic_change_timestamp
-
-    # Add to current transcription collection
-    current_transcription.append({"timestamp": timestamp, "text": text})
-
-    # Manage memory if needed
-    manage_memory_usage()
-
-    # Skip if we just had a topic change (enforce minimum topic duration)
-    chunks_since_last_change = 0
-    if last_topic_change_timestamp:
-        for item in current_transcription:
-            if item["timestamp"] > last_topic_change_timestamp:
-                chunks_since_last_change += 1
-
-        if chunks_since_last_change < min_topic_duration_chunks:
-            logger.debug(
-                f"Skipping topic analysis (minimum duration not met): {chunks_since_last_change} chunks since last change"
-            )
-            return
+        # Manage memory if needed
+        self.manage_memory_usage()
 
-    # Log analysis start
-    log_message = f"Analyzing for major topic change at {timestamp}"
-    logger.info(log_message)
-    socketio.emit("debug_log", {"message": log_message})
-
-    try:
-        # Combine current transcription for analysis
-        combined_text = " ".join([item["text"] for item in current_transcription])
-
-        # Get previous topic context if available
-        prev_context = ""
-        if previous_topic_transcription:
-            # Get text from previous topic (limit length to avoid token issues)
-            prev_text = " ".join(
-                [item["text"] for item in previous_topic_transcription]
-            )
-            if len(prev_text) > 1000:  # Limit context length
-                prev_context = prev_text[:1000] + "..."
-            else:
-                prev_context = prev_text
+        # Skip if we just had a topic change (enforce minimum topic duration)
+        chunks_since_last_change = 0
+        if self.last_topic_change_timestamp:
+            for item in self.current_transcription:
+                if item["timestamp"] > self.last_topic_change_timestamp:
+                    chunks_since_last_change += 1
 
-        # Detect if there's a topic change
-        new_topic, is_topic_change, confidence = detect_major_topic_change(
-            combined_text, current_major_topic, prev_context
-        )
+            if chunks_since_last_change < self.min_topic_duration_chunks:
+                logger.debug(
+                    f"Skipping topic analysis (minimum duration not met): {chunks_since_last_change} chunks since last change"
+                )
+                self.record_chunk(timestamp, 0.0, None)
+                return
+
+        # Over budget: analyze every n-th chunk, the rest only add context
+        self.chunks_seen += 1
+        if (
+            self.budget is not None
+            and self.current_major_topic is not None
+            and self.chunks_seen % self.budget.cadence()
+        ):
+            logger.debug("Skipping topic analysis (reduced budget cadence)")
+            self.record_chunk(timestamp, 0.0, None)
+            return
 
-        if current_major_topic is None:
-            # This is the first topic - store it, don't emit yet
-            current_major_topic = new_topic
-            topic_start_timestamp = timestamp
-            last_topic_change_timestamp = timestamp
+        # Log analysis start
+        log_message = f"Analyzing for major topic change at {timestamp}"
+        logger.info(log_message)
+        socketio.emit("debug_log", {"message": log_message})
 
-            # Log detection
-            log_message = f"Initial major topic detected: {new_topic}"
-            logger.info(log_message)
-            socketio.emit("debug_log", {"message": log_message, "type": "success"})
+        try:
+            # Fixed-size digests: recent chunks verbatim, earlier ones summarized
+            combined_text = self.current_topic_context.digest(
+                summaries.CURRENT_DIGEST_TOKENS
+            )
+            entity_hints = previous_entity_hints = ""
+            if self.entity_hint:
+                entity_hints = self.entity_hint(self.topic_start_timestamp or timestamp)
+                if self.previous_topic_span:
+                    previous_entity_hints = self.entity_hint(*self.previous_topic_span)
+            prev_context = ""
+            if self.previous_topic_context:
+                # Entity hints carry most of what the previous topic was about
+                prev_context = self.previous_topic_context.digest(
+                    HINTED_PREVIOUS_DIGEST_TOKENS
+                    if previous_entity_hints
+                    else summaries.PREVIOUS_DIGEST_TOKENS
+                )
 
-        elif (
-            is_topic_change and confidence >= 0.65
-        ):  # Lower threshold to catch more meaningful transitions
-            # Topic has changed - now we can emit the previous topic
-            interval = f"{topic_start_timestamp}-{timestamp}"
+            # Detect if there's a topic change
+            new_topic, is_topic_change, confidence = concurrency.run_blocking(
+                detect_major_topic_change,
+                self.client,
+                combined_text,
+                self.current_major_topic,
+                prev_context,
+                entity_hints,
+                previous_entity_hints,
+            )
+            if self.stopped.is_set():
+                return
 
-            # Log and emit the completed topic
-            log_message = f"Major topic completed: {current_major_topic} ({interval})"
-            logger.info(log_message)
-            socketio.emit("debug_log", {"message": log_message, "type": "success"})
-            socketio.emit(
-                "major_topic_change",
-                {"interval": interval, "topic": current_major_topic},
+            # Keep every decision so boundaries can be revisited later
+            self.record_chunk(
+                timestamp, confidence if is_topic_change else 0.0, new_topic
             )
 
-            # Move current context to previous context
-            previous_major_topic = current_major_topic
-            previous_topic_transcription = current_transcription.copy()
+            if self.current_major_topic is None:
+                # This is the first topic - store it, don't emit yet
+                self.current_major_topic = new_topic
+                self.topic_start_timestamp = timestamp
+                self.last_topic_change_timestamp = timestamp
+
+                # Log detection
+                log_message = f"Initial major topic detected: {new_topic}"
+                logger.info(log_message)
+                socketio.emit("debug_log", {"message": log_message, "type": "success"})
+
+            elif (
+                is_topic_change and confidence >= 0.65
+            ):  # Lower threshold to catch more meaningful transitions
+                # Topic has changed - now we can emit the previous topic
+                if self.snap_boundary:
+                    boundary = self.snap_boundary(timestamp)
+                else:
+                    boundary = timestamp
+                interval = f"{self.topic_start_timestamp}-{boundary}"
+
+                # Log and emit the completed topic
+                log_message = (
+                    f"Major topic completed: {self.current_major_topic} ({interval})"
+                )
+                logger.info(log_message)
+                socketio.emit("debug_log", {"message": log_message, "type": "success"})
+                socketio.emit(
+                    "major_topic_change",
+                    {"interval": interval, "topic": self.current_major_topic},
+                )
+                if self.export:
+                    self.export.add_chapter(interval, self.current_major_topic)
+
+                # Move current context to previous context
+                self.previous_major_topic = self.current_major_topic
+                self.previous_topic_context = self.current_topic_context
+                self.previous_topic_span = (self.topic_start_timestamp, boundary)
+
+                # Update to the new topic and reset current transcription
+                self.current_major_topic = new_topic
+                self.current_transcription = [
+                    {"timestamp": timestamp, "text": text}
+                ]  # Keep the current chunk
+                self.current_topic_context = summaries.RollingSummary(self.summarizer)
+                self.current_topic_context.add(timestamp, text)
+                self.topic_start_timestamp = boundary
+                self.last_topic_change_timestamp = timestamp
+
+                # Log topic change
+                log_message = f"New major topic detected: {new_topic}"
+                logger.info(log_message)
+                socketio.emit("debug_log", {"message": log_message, "type": "success"})
+            else:
+                # No topic change
+                log_message = (
+                    f"No major topic change detected (confidence: {confidence:.2f})"
+                )
+                logger.debug(log_message)
 
-            # Update to the new topic and reset current transcription
-            current_major_topic = new_topic
-            current_transcription = [
-                {"timestamp": timestamp, "text": text}
-            ]  # Keep the current chunk
-            topic_start_timestamp = timestamp
-            last_topic_change_timestamp = timestamp
+        except Exception as e:
+            error_message = f"Major topic detection failed: {str(e)}"
+            logger.error(error_message)
+            socketio.emit("debug_log", {"message": error_message, "type": "error"})
 
-            # Log topic change
-            log_message = f"New major topic detected: {new_topic}"
-            logger.info(log_message)
-            socketio.emit("debug_log", {"message": log_message, "type": "success"})
-        else:
-            # No topic change
-            log_message = (
-                f"No major topic change detected (confidence: {confidence:.2f})"
-            )
-            logger.debug(log_message)
 
-    except Exception as e:
-        error_message = f"Major topic detection failed: {str(e)}"
-        logger.error(error_message)
-        socketio.emit("debug_log", {"message": error_message, "type": "error"})
+def join_chapters(earlier, later):
+    """Concatenate chapter lists; the chapters at the seam merge if they share a title"""
+    if not earlier or not later:
+        return earlier + later
+    seam = earlier[-1]["interval"].split("-")[1]
+    end = later[0]["interval"].split("-")[1]
+    if earlier[-1]["topic"] == later[0]["topic"]:
+        start = earlier[-1]["interval"].split("-")[0]
+        return (
+            earlier[:-1]
+            + [{"interval": f"{start}-{end}", "topic": later[0]["topic"]}]
+            + later[1:]
+        )
+    return (
+        earlier
+        + [{"interval": f"{seam}-{end}", "topic": later[0]["topic"]}]
+        + later[1:]
+    )
 
 
 def call_openai_with_retry(
-    messages, model="gpt-4o-mini-2024-07-18", max_tokens=150, retries=2
+    client,
+    messages,
+    model="gpt-4o-mini-2024-07-18",
+    max_tokens=150,
+    retries=2,
+    fields=(),
+    stop_on=None,
 ):
-    """Call OpenAI API with retry logic"""
+    """Call OpenAI API with retry logic, returning the parsed fields and raw text"""
     for attempt in range(retries + 1):
         try:
-            return openai.ChatCompletion.create(
+            return llm_stream.stream_fields(
+                client,
+                fields,
+                stop_on,
                 model=model,
                 messages=messages,
                 max_tokens=max_tokens,
@@ -306,15 +461,27 @@ def call_openai_with_retry(
                 raise
 
 
-def detect_major_topic_change(current_text, previous_topic, previous_context=""):
+def detect_major_topic_change(
+    client,
+    current_text,
+    previous_topic,
+    previous_context="",
+    entity_hints="",
+    previous_entity_hints="",
+):
     """Use GPT-4o mini to detect significant topic changes and generate detailed topics"""
 
+    # Tagged entities, e.g. "Entities mentioned: BTC x4, RSI x2"
+    hints_info = ""
+    if entity_hints:
+        hints_info = f"\nEntities mentioned: {entity_hints}"
+
     # First topic case
     if previous_topic is None:
         # For the first topic, we just determine what it is
         prompt = f"""You are analyzing a segment of transcription from a crypto YouTube livestream.
         
-Transcription: "{current_text}"
+Transcription: "{current_text}"{hints_info}
 
 Generate a detailed, engaging YouTube-style chapter title that captures the major topic being discussed.
 Include specific crypto assets, technical indicators, or market conditions mentioned in the discussion.
@@ -325,7 +492,8 @@ Return your response in this exact format:
 
         # Call OpenAI API with retry
         try:
-            response = call_openai_with_retry(
+            fields, topic_text = call_openai_with_retry(
+                client,
                 messages=[
                     {
                         "role": "system",
@@ -357,15 +525,11 @@ Always return just the title in this format: [Major Topic: <detailed title>]""",
                     {"role": "user", "content": prompt},
                 ],
                 max_tokens=100,
+                fields=("Major Topic",),
             )
 
-            topic_text = response.choices[0].message.content.strip()
-
             # Extract topic from response format [Major Topic: <topic>]
-            if "[Major Topic:" in topic_text and "]" in topic_text:
-                topic = topic_text.split("[Major Topic:")[1].split("]")[0].strip()
-            else:
-                topic = topic_text
+            topic = fields.get("Major Topic") or topic_text
 
             return topic, True, 1.0  # For first topic, always return high confidence
 
@@ -378,14 +542,16 @@ Always return just the title in this format: [Major Topic: <detailed title>]""",
         # Include previous context in the prompt if available
         context_info = ""
         if previous_context:
-            # Limit context length to avoid token issues
-            context_info = f'\nPrevious topic context: "{previous_context[:500]}..."'
+            # Already a fixed-size digest of the previous topic
+            context_info = f'\nPrevious topic context: "{previous_context}"'
+        if previous_entity_hints:
+            context_info += f"\nEntities in the previous topic: {previous_entity_hints}"
 
         prompt = f"""You are analyzing a segment of transcription from a crypto YouTube livestream.
 
 Current major topic: "{previous_topic}"{context_info}
 
-New transcription segment: "{current_text}"
+New transcription segment: "{current_text}"{hints_info}
 
 Your task is to:
 1) Determine if this represents a SIGNIFICANT shift to a new topic deserving of a YouTube chapter marker
@@ -405,7 +571,8 @@ Return your response in this exact format:
 
         # Call OpenAI API with retry
         try:
-            response = call_openai_with_retry(
+            fields, _ = call_openai_with_retry(
+                client,
                 messages=[
                     {
                         "role": "system",
@@ -453,37 +620,26 @@ Return your response in this exact format without additional commentary:
                     {"role": "user", "content": prompt},
                 ],
                 max_tokens=150,
+                fields=("Topic Change", "Confidence", "New Major Topic"),
+                # "No" decides the chunk; stop generating right there
+                stop_on=lambda name, value: name == "Topic Change"
+                and llm_stream.is_no(value),
             )
 
-            response_text = response.choices[0].message.content.strip()
-
             # Parse the response
-            is_topic_change = False
+            is_topic_change = fields.get("Topic Change", "").lower() == "yes"
             confidence = 0.0
             new_topic = previous_topic  # Default to keeping the same topic
 
-            if "[Topic Change:" in response_text:
-                change_part = (
-                    response_text.split("[Topic Change:")[1].split("]")[0].strip()
-                )
-                is_topic_change = change_part.lower() == "yes"
-
-            if "[Confidence:" in response_text:
-                confidence_part = (
-                    response_text.split("[Confidence:")[1].split("]")[0].strip()
-                )
+            if "Confidence" in fields:
                 try:
-                    confidence = float(confidence_part)
+                    confidence = float(fields["Confidence"])
                 except ValueError:
                     # If we can't parse confidence, default to 0.5
                     confidence = 0.5
 
-            if "[New Major Topic:" in response_text:
-                new_topic_part = (
-                    response_text.split("[New Major Topic:")[1].split("]")[0].strip()
-                )
-                if new_topic_part.strip():  # Only update if we got a non-empty topic
-                    new_topic = new_topic_part
+            if is_topic_change and fields.get("New Major Topic"):
+                new_topic = fields["New Major Topic"]
 
             return new_topic, is_topic_change, confidence
 
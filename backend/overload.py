@@ -0,0 +1,134 @@
+"""
+Overload module for YouTube Livestream Transcriber.
+Keeps a pipeline close to live when transcription or analysis falls behind.
+
+Lag is how far the next chunk to extract trails the live edge of the stream
+(wall-clock time since transcription began). While lag stays above
+OVERLOAD_LAG_SECONDS the controller activates one more action from
+OVERLOAD_POLICY per chunk, and releases them one at a time once lag falls below
+half the threshold. Available actions:
+
+- shed_topics: stop feeding fine-grained topic detection (transcription continues)
+- drop_oldest: discard queued detector work except the newest items
+- widen_chunks: extract longer chunks, so fewer API calls cover the same audio
+- skip_to_live: jump over the backlog straight to the live edge
+
+overload_check.py runs a full pipeline against a slow backend with and without
+the controller.
+"""
+
+import os
+import logging
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+POLICIES = ("shed_topics", "drop_oldest", "widen_chunks", "skip_to_live")
+
+# Actions in escalation order; an empty value disables the controller
+OVERLOAD_POLICY = os.getenv("OVERLOAD_POLICY", ",".join(POLICIES))
+OVERLOAD_LAG_SECONDS = float(os.getenv("OVERLOAD_LAG_SECONDS", "60"))
+RECOVER_RATIO = 0.5  # Release an action once lag is below this share of the threshold
+
+# widen_chunks multiplies the chunk duration, up to a cap
+WIDEN_FACTOR = 2
+MAX_CHUNK_DURATION = 60  # seconds
+
+# Detector queues are bounded; drop_oldest trims them further
+DETECTOR_QUEUE_MAX = int(os.getenv("DETECTOR_QUEUE_MAX", "30"))
+DROP_OLDEST_KEEP = 2
+
+
+def parse_policy(value):
+    """Turn a comma-separated policy string into a validated action list"""
+    actions = [action.strip() for action in value.split(",") if action.strip()]
+    for action in actions:
+        if action not in POLICIES:
+            raise ValueError(
+                f"Unknown overload action '{action}', expected one of {', '.join(POLICIES)}"
+            )
+    return actions
+
+
+class OverloadController:
+    """Lag-driven degradation state for one pipeline"""
+
+    def __init__(self, emitter, policy=None, lag_threshold=None):
+        self.emitter = emitter
+        self.actions = parse_policy(OVERLOAD_POLICY if policy is None else policy)
+        self.lag_threshold = (
+            OVERLOAD_LAG_SECONDS if lag_threshold is None else lag_threshold
+        )
+        self.level = 0  # Number of actions currently active
+        self.lag = 0.0
+        self.skipped_seconds = 0.0
+        self.shed_chunks = 0
+        self.dropped_items = 0
+
+    @property
+    def active_actions(self):
+        return self.actions[: self.level]
+
+    def is_active(self, action):
+        return action in self.active_actions
+
+    @property
+    def is_lagging(self):
+        return self.lag > self.lag_threshold
+
+    def update(self, lag):
+        """Record the current lag and escalate or relax by one step"""
+        self.lag = max(0.0, lag)
+        if self.is_lagging and self.level < len(self.actions):
+            self.level += 1
+            self._report("degraded", f"activated {self.actions[self.level - 1]}")
+        elif self.lag < self.lag_threshold * RECOVER_RATIO and self.level > 0:
+            self.level -= 1
+            self._report("recovered", f"released {self.actions[self.level]}")
+
+    def chunk_duration(self, base_duration):
+        """Chunk length to extract next"""
+        if self.is_active("widen_chunks"):
+            return min(base_duration * WIDEN_FACTOR, MAX_CHUNK_DURATION)
+        return base_duration
+
+    def skip_to_live(self, current_time, live_time):
+        """New extraction offset if skipping is active and lag is too high"""
+        if not (self.is_active("skip_to_live") and self.is_lagging):
+            return current_time
+
+        skipped = live_time - current_time
+        self.skipped_seconds += skipped
+        self.lag = 0.0
+        self._report("skipped", f"skipped {skipped:.0f}s of audio to catch up")
+        return live_time
+
+    def record_shed_chunk(self):
+        """Count a chunk kept out of topic analysis"""
+        self.shed_chunks += 1
+
+    def record_dropped(self, count):
+        """Count queued detector items discarded by drop_oldest"""
+        self.dropped_items += count
+
+    def stats(self):
+        return {
+            "level": self.level,
+            "lag": round(self.lag, 1),
+            "actions": self.active_actions,
+            "skipped_seconds": round(self.skipped_seconds, 1),
+            "shed_chunks": self.shed_chunks,
+            "dropped_items": self.dropped_items,
+        }
+
+    def _report(self, state, detail):
+        """Tell clients the pipeline changed its degradation state"""
+        message = f"Overload {state} (lag {self.lag:.0f}s): {detail}"
+        logger.warning(message)
+        self.emitter.emit("debug_log", {"message": message, "type": "warning"})
+        self.emitter.emit("overload", dict(self.stats(), state=state))
@@ -0,0 +1,184 @@
+"""
+Overload check for YouTube Livestream Transcriber.
+Runs a full pipeline against a transcription backend slower than realtime, once
+without the overload controller and once with it, and fails when the controller
+does not keep lag bounded or never sheds and drops detector work.
+
+Only the edges are stubbed: extraction returns each chunk once it has aired,
+as ffmpeg does at the live edge, and API calls go over HTTP to the stub OpenAI
+server, slowed so that transcribing a chunk takes longer than the chunk lasts
+and topic replies take longer still. Chunks and the lag threshold are scaled
+down so the run takes seconds of wall time per controller step instead of
+minutes.
+
+Run `python overload_check.py [seconds]` (default: 30 seconds per run); the
+exit status is 1 when any check failed.
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import credentials
+import disk_cache
+import exporters
+import overload
+import pipeline
+import resilience
+import stub_openai
+import transcription
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Scaled-down stream: 1 s chunks, 1.5 s per API call, a 3 s lag threshold
+OVERLOAD_CHUNK_SECONDS = 1
+OVERLOAD_API_DELAY = 1.5
+OVERLOAD_TOKEN_DELAY = 0.1  # Topic replies also stream slowly
+OVERLOAD_LAG_THRESHOLD = 3.0
+# Highest lag allowed with the controller, which escalates one step per chunk
+OVERLOAD_MAX_LAG = 2 * OVERLOAD_LAG_THRESHOLD
+
+
+class _LiveSource:
+    """Returns each chunk once its audio has aired, like ffmpeg at the live edge"""
+
+    def __init__(self):
+        self.started = None
+        self.chunks = 0
+
+    def extract(
+        self,
+        audio_url,
+        chunk_duration=15,
+        start_time=0,
+        register_process=None,
+        temp_dir=None,
+    ):
+        if self.started is None:
+            self.started = time.monotonic()
+        aired = self.started + start_time + chunk_duration
+        time.sleep(max(0.0, aired - time.monotonic()))
+        temp_file = tempfile.NamedTemporaryFile(
+            suffix=".mp3", delete=False, dir=temp_dir
+        )
+        with temp_file:
+            temp_file.write(os.urandom(2048))
+        self.chunks += 1
+        return temp_file.name, (start_time, chunk_duration)
+
+
+class _NullEmitter:
+    def emit(self, event, data=None, **kwargs):
+        pass
+
+
+def replay(policy, seconds, session_credentials):
+    """Run a pipeline for the given wall time; returns (lags, controller)"""
+    source = _LiveSource()
+    transcription.extract_audio_chunk = source.extract
+    livestream = pipeline.LivestreamPipeline(
+        "https://www.youtube.com/watch?v=overloadchk",
+        _NullEmitter(),
+        session_credentials,
+    )
+    controller = overload.OverloadController(
+        livestream.emitter, policy=policy, lag_threshold=OVERLOAD_LAG_THRESHOLD
+    )
+    livestream.overload = controller
+
+    # Lag as measured before each chunk
+    lags = []
+    update = controller.update
+
+    def record_lag(lag):
+        lags.append(lag)
+        update(lag)
+
+    controller.update = record_lag
+    livestream.start()
+    time.sleep(seconds)
+    livestream.stop(timeout=5.0)
+
+    dropped = (
+        livestream.topic_detector.topic_queue.dropped
+        + livestream.major_topic_detector.major_topic_queue.dropped
+    )
+    print(f"policy: {policy or '(disabled)'}")
+    print(
+        f"  {source.chunks} chunks, final lag {lags[-1]:.1f}s, max lag {max(lags):.1f}s, "
+        f"{dropped} items dropped from full queues"
+    )
+    print(f"  {controller.stats()}")
+    return lags, controller
+
+
+def overload_check(seconds=30.0):
+    """Replay the slow backend and return True when every check passed"""
+    logging.getLogger().setLevel(logging.ERROR)
+    scratch = tempfile.mkdtemp(prefix="overload-check-")
+    server = stub_openai.serve(
+        0, delay=OVERLOAD_API_DELAY, token_delay=OVERLOAD_TOKEN_DELAY
+    )
+
+    pipeline.CHUNK_TEMP_DIR = scratch
+    pipeline.CHUNK_DURATION = OVERLOAD_CHUNK_SECONDS
+    exporters.EXPORT_DIR = os.path.join(scratch, "exports")
+    resilience.DEAD_LETTER_DIR = os.path.join(scratch, "dead-letters")
+    disk_cache.RESULT_CACHE_ENABLED = False  # Fingerprinting needs ffmpeg
+    transcription.get_audio_stream_url = lambda url: (
+        "overload://audio",
+        {"title": "Overload Check Stream", "channel": "Overload", "viewers": "0"},
+    )
+    session_credentials = credentials.Credentials(
+        "sk-overload", api_base=f"http://127.0.0.1:{server.server_port}/v1"
+    )
+
+    failures = []
+
+    def check(passed, message):
+        print(f"{'ok  ' if passed else 'FAIL'} {message}")
+        if not passed:
+            failures.append(message)
+
+    # Without the controller the backend keeps falling behind
+    lags, _ = replay("", seconds, session_credentials)
+    check(
+        max(lags) > OVERLOAD_MAX_LAG,
+        f"without the controller lag grew past {OVERLOAD_MAX_LAG:.1f}s ({max(lags):.1f}s)",
+    )
+
+    lags, controller = replay(",".join(overload.POLICIES), seconds, session_credentials)
+    check(
+        max(lags) <= OVERLOAD_MAX_LAG,
+        f"with the controller lag stayed within {OVERLOAD_MAX_LAG:.1f}s ({max(lags):.1f}s)",
+    )
+    check(
+        lags[-1] <= OVERLOAD_LAG_THRESHOLD,
+        f"lag ended below the threshold ({lags[-1]:.1f}s)",
+    )
+    check(
+        controller.shed_chunks > 0,
+        f"chunks were kept out of topic detection ({controller.shed_chunks})",
+    )
+    check(
+        controller.dropped_items > 0,
+        f"queued detector work was dropped ({controller.dropped_items})",
+    )
+
+    if failures:
+        print(f"FAIL: {len(failures)} check(s) failed")
+    else:
+        print("PASS: the controller kept a slow backend close to live")
+
+    server.shutdown()
+    shutil.rmtree(scratch, ignore_errors=True)
+    return not failures
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 30.0
+    sys.exit(0 if overload_check(seconds) else 1)
@@ -0,0 +1,670 @@
+"""
+Pipeline module for YouTube Livestream Transcriber.
+Runs ingest, transcription and both topic detectors for one livestream.
+Used in-process by the web server or from a separate worker process (worker.py),
+publishing every event through the emitter it is given.
+"""
+
+import os
+import shutil
+import logging
+import datetime
+import tempfile
+import threading
+import collections
+import transcription
+import whisper_backends
+import topic_detection
+import major_topic_detection
+import concurrency
+import credentials
+import seam_merge
+import disk_cache
+import llm_cache
+import overload
+import resilience
+import segments
+import exporters
+import wire_format
+import accounting
+import entities
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Chunking
+CHUNK_DURATION = 20  # seconds
+# Audio repeated from the end of the previous chunk; 0 disables overlap mode
+OVERLAP_SECONDS = float(os.getenv("CHUNK_OVERLAP_SECONDS", "0"))
+
+# Chunks averaged in the reported end-to-end latency
+LATENCY_WINDOW_CHUNKS = 30
+
+# Audio chunks are written to a per-pipeline directory under CHUNK_TEMP_DIR
+# (default: the system temp directory), removed with everything in it on exit
+CHUNK_TEMP_DIR = os.getenv("CHUNK_TEMP_DIR") or None
+CHUNK_TEMP_PREFIX = "livestream-chunks-"
+# Chunks between entity timeline snapshots sent to clients
+ENTITY_TIMELINE_EMIT_CHUNKS = 15
+# Segment timing kept for snapping chapter boundaries, by media time
+SEGMENT_TIMELINE_MAX_SECONDS = float(
+    os.getenv("SEGMENT_TIMELINE_MAX_SECONDS", str(6 * 3600))
+)
+
+
+class LivestreamPipeline:
+    """Ingest, transcription and topic detection workers for one livestream"""
+
+    def __init__(self, url, emitter, session_credentials=None):
+        self.url = url
+        self.emitter = emitter
+        self.credentials = (
+            session_credentials or credentials.Credentials.from_environment()
+        )
+        # The pooled key client, counting what this stream spends
+        self.client = accounting.MeteredClient(credentials.get_client(self.credentials))
+        self.stop_event = threading.Event()
+        self.topic_detector = topic_detection.TopicDetector(emitter, self.client)
+        self.major_topic_detector = major_topic_detection.MajorTopicDetector(
+            emitter, self.client
+        )
+        self.overload = overload.OverloadController(emitter)
+        self.budget = accounting.BudgetController(
+            emitter, self.client.usage, self.client.key_usage
+        )
+        self.topic_detector.budget = self.budget
+        self.major_topic_detector.budget = self.budget
+        self.source_breaker = resilience.CircuitBreaker("source", self.report_breaker)
+        self.api_breaker = resilience.CircuitBreaker("api", self.report_breaker)
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW_CHUNKS)
+
+        # Recent segment timing (SEGMENT_TIMELINE_MAX_SECONDS), used to place
+        # chapter boundaries
+        self.segment_timeline = segments.SegmentTable(keep_text=False)
+        if segments.TRANSCRIPTION_VERBOSE:
+            self.major_topic_detector.snap_boundary = self.snap_boundary
+        # Entities tagged in each chunk, by media time
+        self.tagger = entities.get_tagger()
+        self.entity_timeline = entities.EntityTimeline()
+        self.major_topic_detector.entity_hint = self.entity_hint
+        self.export = None  # Caption/chapter files, created once the stream is known
+        self.temp_dir = None  # Directory of this pipeline's audio chunks
+        self.ingest_thread = None
+        self._ffmpeg_process = None
+
+    def start(self):
+        """Start the pipeline in the background"""
+        self.ingest_thread = concurrency.start_worker(self.run, name="ingest")
+
+    def run(self):
+        """Run topic detection and transcription until stopped or the stream ends"""
+        # Start topic detection thread
+        self.topic_detector.start()
+        self.emitter.emit("debug_log", {"message": "Topic detection thread started"})
+
+        # Start major topic detection thread
+        self.major_topic_detector.start()
+        self.emitter.emit(
+            "debug_log", {"message": "Major topic detection thread started"}
+        )
+
+        self.transcribe_livestream()
+
+    def stop(self, timeout=5.0):
+        """Stop every worker of this pipeline and wait for them to exit"""
+        self.stop_event.set()
+
+        # Abort an in-flight chunk extraction instead of waiting for it to finish
+        process = self._ffmpeg_process
+        if process is not None and process.poll() is None:
+            process.terminate()
+
+        self.topic_detector.stop()
+        self.major_topic_detector.stop(timeout)
+        self.join(timeout)
+
+    def join(self, timeout=None):
+        """Wait for the ingest and detector workers to exit"""
+        if self.ingest_thread is not None:
+            self.ingest_thread.join(timeout)
+        self.topic_detector.join(timeout)
+        self.major_topic_detector.join(timeout)
+
+    def is_alive(self):
+        """Whether the ingest worker is still running"""
+        return self.ingest_thread is not None and self.ingest_thread.is_alive()
+
+    def _set_ffmpeg_process(self, process):
+        self._ffmpeg_process = process
+
+    def run_stage(self, stage, breaker, func, *args, **kwargs):
+        """Run one ingest stage with its retry policy and record the outcome"""
+        policy = resilience.RETRY_POLICIES[stage]
+        if breaker.state == "half_open":
+            # A probe gets a single attempt so a dead dependency is not retried
+            policy = resilience.RetryPolicy(1, policy.base_delay, policy.max_delay)
+        try:
+            result = policy.run(
+                func, *args, stop_event=self.stop_event, description=stage, **kwargs
+            )
+        except Exception:
+            if not self.stop_event.is_set():
+                breaker.record_failure()
+            raise
+        breaker.record_success()
+        return result
+
+    def wait_for_breakers(self):
+        """Sleep until every open circuit may be probed; True if stopped meanwhile"""
+        for breaker in (self.source_breaker, self.api_breaker):
+            delay = breaker.time_until_probe()
+            if delay > 0 and self.stop_event.wait(delay):
+                return True
+            # Move the breaker to half-open once its pause is over
+            breaker.time_until_probe()
+        return self.stop_event.is_set()
+
+    def report_breaker(self, breaker):
+        """Tell clients a circuit breaker changed state"""
+        message = f"Circuit breaker '{breaker.name}' is {breaker.state}"
+        if breaker.state == "open":
+            message += f", pausing ingest for {breaker.reset_seconds:.0f}s"
+        self.emitter.emit(
+            "debug_log",
+            {
+                "message": message,
+                "type": "success" if breaker.state == "closed" else "error",
+            },
+        )
+        self.emitter.emit(
+            "circuit_breaker",
+            {
+                "name": breaker.name,
+                "state": breaker.state,
+                "retry_in": (
+                    round(breaker.reset_seconds) if breaker.state == "open" else 0
+                ),
+            },
+        )
+
+    def dead_letter(
+        self, stage, error, timestamp, seek_offset, duration, audio_file=None
+    ):
+        """Move a chunk that failed for good to the dead-letter store"""
+        store = resilience.get_dead_letters()
+        store.add(self.url, stage, error, timestamp, seek_offset, duration, audio_file)
+        self.emitter.emit(
+            "debug_log",
+            {
+                "message": f"Chunk at {timestamp} failed after retries and was saved for re-transcription",
+                "type": "error",
+            },
+        )
+        self.emitter.emit("dead_letters", store.summary(self.url))
+
+    def snap_boundary(self, timestamp):
+        """Move a chunk-precision chapter boundary to the most likely segment start"""
+        seconds = wire_format.parse_timestamp(timestamp)
+        start = self.segment_timeline.best_boundary(
+            seconds - CHUNK_DURATION / 2, seconds + CHUNK_DURATION
+        )
+        return timestamp if start is None else transcription.format_timestamp(start)
+
+    def entity_hint(self, start_timestamp, end_timestamp=None):
+        """Prompt hint of the entities mentioned between two timestamps"""
+        end = float("inf")
+        if end_timestamp is not None:
+            end = wire_format.parse_timestamp(end_timestamp)
+        return entities.format_hint(
+            self.entity_timeline.counts(
+                wire_format.parse_timestamp(start_timestamp), end
+            )
+        )
+
+    def record_latency(self, latency, media_time):
+        """Track and report emit time minus media time for the latest chunk"""
+        self.latencies.append(latency)
+        self.emitter.emit(
+            "latency",
+            {
+                "media_time": round(media_time, 2),
+                "latency": round(latency, 2),
+                "mean": round(sum(self.latencies) / len(self.latencies), 2),
+                "max": round(max(self.latencies), 2),
+            },
+        )
+
+    def finish_chunk(self):
+        """Per-chunk bookkeeping: trim detector queues and report caches and spending"""
+        # Keep only the newest detector work while overloaded
+        if self.overload.is_active("drop_oldest"):
+            dropped = self.topic_detector.topic_queue.trim(
+                overload.DROP_OLDEST_KEEP
+            ) + self.major_topic_detector.major_topic_queue.trim(
+                overload.DROP_OLDEST_KEEP
+            )
+            if dropped:
+                self.overload.record_dropped(dropped)
+
+        # Report result and LLM cache effectiveness
+        result_cache = disk_cache.get_result_cache()
+        cache_stats = result_cache.stats() if result_cache else {}
+        response_cache = llm_cache.get_llm_cache()
+        if response_cache:
+            cache_stats["llm"] = response_cache.stats()
+        if cache_stats:
+            self.emitter.emit("cache_stats", cache_stats)
+
+        # Report spending and degrade further or recover if needed
+        self.budget.update()
+        self.emitter.emit(
+            "usage",
+            {
+                "stream": self.client.usage.stats(),
+                "key": self.client.key_usage.stats(),
+                "budget": self.budget.stats(),
+            },
+        )
+
+    def transcribe_livestream(self):
+        """Main function to transcribe a YouTube livestream"""
+        url, emitter, stop_event = self.url, self.emitter, self.stop_event
+        transcription_start_time = None
+
+        try:
+            # Get the direct audio stream URL
+            log_message = f"Extracting audio stream URL from: {url}"
+            emitter.emit("debug_log", {"message": log_message})
+
+            audio_url, stream_info = transcription.get_audio_stream_url(url)
+
+            # Send livestream info to frontend
+            emitter.emit("livestream_info", stream_info)
+            emitter.emit(
+                "debug_log",
+                {
+                    "message": "Successfully extracted audio stream URL",
+                    "type": "success",
+                },
+            )
+
+            if not audio_url:
+                error_message = "Failed to get audio stream URL"
+                logger.error(error_message)
+                emitter.emit("debug_log", {"message": error_message, "type": "error"})
+                emitter.emit("livestream_error", {"message": error_message})
+                return
+
+            # Captions and chapters are written to disk as they are produced
+            self.export = exporters.StreamExport(
+                exporters.make_stream_id(stream_info.get("title", "stream")), url
+            )
+            self.major_topic_detector.export = self.export
+            emitter.emit(
+                "export_ready",
+                {"stream_id": self.export.stream_id, "urls": self.export.urls()},
+            )
+
+            # Initialize timestamp reference point - the moment transcription begins
+            transcription_start_time = datetime.datetime.now()
+            logger.info(f"Transcription started at: {transcription_start_time}")
+            emitter.emit(
+                "debug_log",
+                {
+                    "message": f"Transcription started at: {transcription_start_time.strftime('%H:%M:%S')}"
+                },
+            )
+
+            # Chunks that never reach transcription are removed with the directory
+            self.temp_dir = tempfile.mkdtemp(
+                prefix=CHUNK_TEMP_PREFIX, dir=CHUNK_TEMP_DIR
+            )
+
+            # Start transcribing chunks sequentially
+            current_time = 0  # Seek offset for ffmpeg extraction
+            stream_origin_pts = None  # PTS of the first chunk's start
+            # Where ingest joins the broadcast: the live stream has been running
+            # since its start time, while VODs (and streams whose start yt-dlp
+            # does not report) are timed from the first extracted chunk
+            started_at = stream_info.get("started_at")
+            stream_offset = 0.0
+            if started_at:
+                stream_offset = max(
+                    transcription_start_time.timestamp() - started_at, 0.0
+                )
+            media_position = stream_offset  # End of the last extracted chunk
+            previous_raw_text = ""  # Unmerged text of the previous chunk
+            transcribed_chunks = 0
+
+            while not stop_event.is_set():
+                try:
+                    # Measure lag behind the newest complete chunk and degrade if needed
+                    chunk_duration = self.overload.chunk_duration(CHUNK_DURATION)
+                    live_time = (
+                        datetime.datetime.now() - transcription_start_time
+                    ).total_seconds() - chunk_duration
+                    self.overload.update(live_time - current_time)
+                    skip_time = self.overload.skip_to_live(current_time, live_time)
+                    if skip_time != current_time:
+                        current_time = skip_time
+                        previous_raw_text = ""  # Nothing to merge across a skip
+                    chunk_duration = self.overload.chunk_duration(CHUNK_DURATION)
+
+                    # Pause while the source or API circuit is open
+                    if self.wait_for_breakers():
+                        break
+
+                    # Extract audio chunk
+                    log_message = f"Extracting audio chunk at {transcription.format_timestamp(current_time)}"
+                    emitter.emit("debug_log", {"message": log_message})
+
+                    # In overlap mode, start a little before the seam
+                    overlap = min(OVERLAP_SECONDS, current_time)
+                    try:
+                        audio_file, (chunk_pts, extracted) = self.run_stage(
+                            "extract",
+                            self.source_breaker,
+                            transcription.extract_audio_chunk,
+                            audio_url,
+                            chunk_duration + overlap,
+                            current_time - overlap,
+                            register_process=self._set_ffmpeg_process,
+                            temp_dir=self.temp_dir,
+                        )
+                    except Exception as e:
+                        if not stop_event.is_set():
+                            self.dead_letter(
+                                "extract",
+                                e,
+                                transcription.format_timestamp(
+                                    stream_offset + current_time
+                                ),
+                                current_time - overlap,
+                                chunk_duration + overlap,
+                            )
+                        raise
+
+                    # Place the chunk on the broadcast's timeline (PTS relative to
+                    # the first chunk plus the join offset), falling back to the
+                    # requested offset
+                    if chunk_pts is not None and stream_origin_pts is None:
+                        stream_origin_pts = chunk_pts - (current_time - overlap)
+                    if chunk_pts is not None:
+                        chunk_start = max(chunk_pts - stream_origin_pts, 0.0)
+                    else:
+                        chunk_start = current_time - overlap
+                    chunk_start += stream_offset
+                    if extracted is None:
+                        extracted = chunk_duration + overlap
+                    media_position = chunk_start + extracted
+
+                    # Transcribe the audio chunk
+                    log_message = "Transcribing chunk..."
+                    emitter.emit("debug_log", {"message": log_message})
+
+                    # Identify the audio so repeated chunks reuse earlier results
+                    fingerprint = None
+                    if disk_cache.get_result_cache():
+                        fingerprint = transcription.fingerprint_audio(audio_file)
+
+                    # Over budget, transcribe locally instead of with the API
+                    backend = None
+                    if self.budget.is_active("local_transcription"):
+                        backend = whisper_backends.get_local_backend()
+
+                    hosted_calls = self.client.usage.transcriptions
+                    try:
+                        transcription_text = self.run_stage(
+                            "transcribe",
+                            self.api_breaker,
+                            transcription.transcribe_audio_chunk,
+                            audio_file,
+                            self.client,
+                            fingerprint,
+                            delete_file=False,
+                            verbose=segments.TRANSCRIPTION_VERBOSE,
+                            backend=backend,
+                        )
+                    except Exception as e:
+                        if not stop_event.is_set():
+                            # Keep the audio so the chunk can be re-transcribed later
+                            self.dead_letter(
+                                "transcribe",
+                                e,
+                                transcription.format_timestamp(chunk_start + overlap),
+                                current_time - overlap,
+                                chunk_duration + overlap,
+                                audio_file,
+                            )
+                        raise
+                    finally:
+                        if os.path.exists(audio_file):
+                            os.remove(audio_file)
+                        # Every hosted call is billed for the whole chunk
+                        self.client.record_audio(
+                            (self.client.usage.transcriptions - hosted_calls)
+                            * extracted
+                        )
+
+                    # Drop late results so a stopped pipeline never emits
+                    if stop_event.is_set():
+                        break
+
+                    if segments.TRANSCRIPTION_VERBOSE:
+                        # Segments in the overlap were added with the previous chunk
+                        chunk_segments = transcription_text
+                        self.segment_timeline.extend(
+                            chunk_segments.shifted(chunk_start, min_start=overlap)
+                        )
+                        self.segment_timeline.trim_before(
+                            chunk_start - SEGMENT_TIMELINE_MAX_SECONDS
+                        )
+                        # Drop silence (and what Whisper hallucinates over it)
+                        transcription_text = chunk_segments.speech_text()
+                        if not transcription_text:
+                            emitter.emit("debug_log", {"message": "No speech in chunk"})
+                            # Silent chunks are billed like any other
+                            self.finish_chunk()
+                            current_time += chunk_duration
+                            continue
+
+                    # Remove the words transcribed twice at the seam
+                    if overlap:
+                        raw_text = transcription_text
+                        transcription_text = seam_merge.merge_seam(
+                            previous_raw_text, raw_text, overlap
+                        )
+                        previous_raw_text = raw_text
+                    else:
+                        previous_raw_text = transcription_text
+
+                    # Timestamp where the new audio starts, after any overlap
+                    timestamp = transcription.format_timestamp(chunk_start + overlap)
+
+                    # Tag the assets, indicators and events mentioned
+                    entity_counts = self.tagger.count(transcription_text)
+                    self.entity_timeline.add(chunk_start + overlap, entity_counts)
+                    self.entity_timeline.trim_before(
+                        chunk_start - entities.ENTITY_TIMELINE_MAX_SECONDS
+                    )
+
+                    # Send transcription to frontend
+                    log_message = (
+                        f"Transcription sent to frontend: {transcription_text}"
+                    )
+                    logger.info(log_message)
+                    emitter.emit(
+                        "debug_log", {"message": log_message, "type": "success"}
+                    )
+
+                    # Emit transcription event to all clients
+                    emitter.emit(
+                        "transcription",
+                        {
+                            "timestamp": timestamp,
+                            "text": transcription_text,
+                            "entities": list(entity_counts),
+                        },
+                        broadcast=True,
+                    )
+                    logger.info(
+                        f"Emitted transcription event with timestamp: {timestamp}"
+                    )
+
+                    # Append caption cues, per speech segment when timing is known
+                    if segments.TRANSCRIPTION_VERBOSE:
+                        for index in range(len(chunk_segments)):
+                            if chunk_segments.starts[
+                                index
+                            ] >= overlap and chunk_segments.is_speech(index):
+                                self.export.add_caption(
+                                    chunk_start + chunk_segments.starts[index],
+                                    chunk_start + chunk_segments.ends[index],
+                                    chunk_segments.texts[index],
+                                )
+                    else:
+                        self.export.add_caption(
+                            chunk_start + overlap, media_position, transcription_text
+                        )
+
+                    # End-to-end latency: how long after airing the chunk was emitted
+                    self.record_latency(
+                        (
+                            datetime.datetime.now() - transcription_start_time
+                        ).total_seconds()
+                        - (media_position - stream_offset),
+                        media_position,
+                    )
+
+                    # Send transcription for topic change detection, unless shed
+                    if self.overload.is_active("shed_topics"):
+                        self.overload.record_shed_chunk()
+                    else:
+                        self.topic_detector.add_transcription_for_analysis(
+                            timestamp,
+                            transcription_text,
+                            fingerprint,
+                            entities.format_hint(entity_counts),
+                        )
+
+                    # Send transcription for major topic detection
+                    self.major_topic_detector.add_transcription_for_major_analysis(
+                        timestamp, transcription_text
+                    )
+
+                    # Mention ranges of every entity, for late joiners too
+                    transcribed_chunks += 1
+                    if transcribed_chunks % ENTITY_TIMELINE_EMIT_CHUNKS == 0:
+                        emitter.emit(
+                            "entity_timeline",
+                            {"entities": self.entity_timeline.snapshot()},
+                        )
+
+                    self.finish_chunk()
+
+                    # Move to next chunk (still needed for ffmpeg extraction)
+                    current_time += chunk_duration
+
+                except Exception as e:
+                    if stop_event.is_set():
+                        break
+                    error_message = f"Error processing chunk: {str(e)}"
+                    logger.error(error_message)
+                    emitter.emit(
+                        "debug_log", {"message": error_message, "type": "error"}
+                    )
+                    # Continue to next chunk even if this one fails
+                    current_time += chunk_duration
+                    continue
+
+        except Exception as e:
+            error_message = f"Transcription error: {str(e)}"
+            logger.error(error_message)
+            emitter.emit("debug_log", {"message": error_message, "type": "error"})
+            emitter.emit("livestream_error", {"message": error_message})
+        finally:
+            # Clean up and mark as inactive
+            if not stop_event.is_set() and transcription_start_time:
+                # Final timestamp at the end of the last extracted audio
+                final_timestamp = transcription.format_timestamp(media_position)
+
+                emitter.emit(
+                    "transcription",
+                    {
+                        "timestamp": final_timestamp,
+                        "text": "Transcription ended due to an error.",
+                    },
+                    broadcast=True,
+                )
+
+            self.topic_detector.stop()  # Stop the topic detection thread
+            self.major_topic_detector.stop()  # Stop the major topic detection thread
+
+            if self.temp_dir is not None:
+                shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+def retry_dead_letters(emitter, session_credentials=None, to=None, url=None):
+    """Re-transcribe the dead-lettered chunks of one stream URL (every stream when
+    url is None) and send the recovered text to the requesting client (to) only"""
+    store = resilience.get_dead_letters()
+    # Retries count towards the key's spending
+    client = accounting.MeteredClient(
+        credentials.get_client(
+            session_credentials or credentials.Credentials.from_environment()
+        )
+    )
+    entries = store.list_entries(url)
+    emitter.emit(
+        "debug_log", {"message": f"Retrying {len(entries)} failed chunk(s)"}, to=to
+    )
+
+    recovered = 0
+    for entry in entries:
+        try:
+            if entry["audio_file"]:
+                audio_file = entry["audio_file"]
+            else:
+                # Extraction failed, so fetch the audio again (VODs, or live
+                # streams still within their DVR window)
+                audio_url, _ = transcription.get_audio_stream_url(entry["url"])
+                audio_file, _ = transcription.extract_audio_chunk(
+                    audio_url, entry["duration"], entry["seek_offset"]
+                )
+            hosted_calls = client.usage.transcriptions
+            text = transcription.transcribe_audio_chunk(
+                audio_file, client, delete_file=not entry["audio_file"]
+            )
+            client.record_audio(
+                (client.usage.transcriptions - hosted_calls) * entry["duration"]
+            )
+        except Exception as e:
+            store.record_attempt(entry["id"], e)
+            emitter.emit(
+                "debug_log",
+                {
+                    "message": f"Retry of chunk at {entry['timestamp']} failed: {str(e)}",
+                    "type": "error",
+                },
+                to=to,
+            )
+            continue
+
+        store.remove(entry["id"])
+        recovered += 1
+        emitter.emit(
+            "dead_letter_recovered",
+            {"timestamp": entry["timestamp"], "text": text, "url": entry["url"]},
+            to=to,
+        )
+
+    emitter.emit(
+        "debug_log",
+        {
+            "message": f"Recovered {recovered} of {len(entries)} failed chunk(s)",
+            "type": "success" if recovered == len(entries) else "error",
+        },
+        to=to,
+    )
+    emitter.emit("dead_letters", store.summary(url), to=to)
@@ -0,0 +1,262 @@
+"""
+Resilience module for YouTube Livestream Transcriber.
+Failure handling for the ingest loop:
+
+- RetryPolicy: per-stage retries with exponential backoff and jitter.
+- CircuitBreaker: pauses a stage after repeated failures and lets a single probe
+  through once the pause is over, doubling the pause while probes keep failing.
+- DeadLetterStore: chunks that failed for good, kept on disk (with their audio
+  when it was extracted) so they can be re-transcribed later. The index is
+  shared by the web node and its worker processes, so every change re-reads it
+  under a file lock.
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import shutil
+import logging
+import threading
+import contextlib
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are serialized
+    fcntl = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Circuit breakers open after this many chunks fail in a row at one stage
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+BREAKER_MAX_RESET_SECONDS = 300.0
+
+# Dead-letter storage
+DEAD_LETTER_DIR = os.getenv(
+    "DEAD_LETTER_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "dead_letters"),
+)
+DEAD_LETTER_MAX_ENTRIES = int(os.getenv("DEAD_LETTER_MAX_ENTRIES", "100"))
+
+
+class RetryPolicy:
+    """Retry a call with exponential backoff"""
+
+    def __init__(self, attempts, base_delay, max_delay):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """Backoff before the given retry (1-based), with +/-20% jitter"""
+        delay = min(self.base_delay * 2 ** (attempt - 1), self.max_delay)
+        return delay * random.uniform(0.8, 1.2)
+
+    def run(self, func, *args, stop_event=None, description="call", **kwargs):
+        """Call func until it succeeds, attempts run out or stop_event is set"""
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                stopped = stop_event is not None and stop_event.is_set()
+                if attempt == self.attempts or stopped:
+                    raise
+                delay = self.delay(attempt)
+                logger.warning(
+                    f"{description} failed (attempt {attempt}/{self.attempts}), retrying in {delay:.1f}s: {str(e)}"
+                )
+                if stop_event is not None:
+                    if stop_event.wait(delay):
+                        raise
+                else:
+                    time.sleep(delay)
+
+
+# Retry policies per ingest stage
+RETRY_POLICIES = {
+    "extract": RetryPolicy(
+        int(os.getenv("RETRY_EXTRACT_ATTEMPTS", "3")), base_delay=1.0, max_delay=8.0
+    ),
+    "transcribe": RetryPolicy(
+        int(os.getenv("RETRY_TRANSCRIBE_ATTEMPTS", "3")), base_delay=2.0, max_delay=20.0
+    ),
+}
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open probe -> closed"""
+
+    def __init__(
+        self,
+        name,
+        on_change=None,
+        failure_threshold=BREAKER_FAILURE_THRESHOLD,
+        reset_seconds=BREAKER_RESET_SECONDS,
+    ):
+        self.name = name
+        self.on_change = on_change  # Called with the breaker after each state change
+        self.failure_threshold = failure_threshold
+        self.base_reset_seconds = reset_seconds
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def time_until_probe(self):
+        """Seconds to wait before the stage may run again (0 when allowed)"""
+        if self.state != "open":
+            return 0.0
+        remaining = self.opened_at + self.reset_seconds - time.monotonic()
+        if remaining > 0:
+            return remaining
+        self._set_state("half_open")
+        return 0.0
+
+    def record_success(self):
+        self.failures = 0
+        self.reset_seconds = self.base_reset_seconds
+        if self.state != "closed":
+            self._set_state("closed")
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open":
+            # Probe failed, stay open longer
+            self.reset_seconds = min(self.reset_seconds * 2, BREAKER_MAX_RESET_SECONDS)
+            self._open()
+        elif self.state == "closed" and self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self._set_state("open")
+
+    def _set_state(self, state):
+        self.state = state
+        logger.warning(f"Circuit breaker '{self.name}' is now {state}")
+        if self.on_change:
+            self.on_change(self)
+
+
+class DeadLetterStore:
+    """Permanently failed chunks, persisted with their audio for re-transcription"""
+
+    def __init__(self, directory, max_entries):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.index_path = os.path.join(directory, "index.json")
+        self.lock_path = os.path.join(directory, "index.lock")
+
+        os.makedirs(directory, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Current entries, read under a lock that other processes also take"""
+        with self.lock, open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)  # Released on close
+            yield self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as index_file:
+                return json.load(index_file)
+        except (OSError, ValueError):
+            return []
+
+    def _save(self, entries):
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as index_file:
+            json.dump(entries, index_file)
+        os.replace(temp_path, self.index_path)
+
+    def _remove_audio(self, entry):
+        if entry["audio_file"] and os.path.exists(entry["audio_file"]):
+            os.remove(entry["audio_file"])
+
+    def add(self, url, stage, error, timestamp, seek_offset, duration, audio_file=None):
+        """Record a failed chunk, taking ownership of its audio file if any"""
+        entry_id = uuid.uuid4().hex[:12]
+        stored_audio = None
+        if audio_file and os.path.exists(audio_file):
+            stored_audio = os.path.join(
+                self.directory, entry_id + os.path.splitext(audio_file)[1]
+            )
+            shutil.move(audio_file, stored_audio)
+
+        entry = {
+            "id": entry_id,
+            "url": url,
+            "stage": stage,
+            "error": str(error),
+            "timestamp": timestamp,
+            "seek_offset": seek_offset,
+            "duration": duration,
+            "audio_file": stored_audio,
+            "failed_at": time.time(),
+            "attempts": 1,
+        }
+        with self._locked() as entries:
+            entries.append(entry)
+            while len(entries) > self.max_entries:
+                self._remove_audio(entries.pop(0))
+            self._save(entries)
+        logger.warning(f"Chunk at {timestamp} moved to dead letters ({stage}): {error}")
+        return entry
+
+    def list_entries(self, url=None):
+        """Stored entries, only those of one stream URL if given"""
+        with self._locked() as entries:
+            return [entry for entry in entries if url is None or entry["url"] == url]
+
+    def remove(self, entry_id):
+        """Forget a recovered chunk and delete its audio"""
+        with self._locked() as entries:
+            for entry in entries:
+                if entry["id"] == entry_id:
+                    entries.remove(entry)
+                    self._remove_audio(entry)
+                    self._save(entries)
+                    return
+
+    def record_attempt(self, entry_id, error):
+        """Note another failed re-transcription attempt"""
+        with self._locked() as entries:
+            for entry in entries:
+                if entry["id"] == entry_id:
+                    entry["attempts"] += 1
+                    entry["error"] = str(error)
+                    self._save(entries)
+                    return
+
+    def summary(self, url=None):
+        """Small payload for the dead_letters event, for one stream URL if given"""
+        entries = self.list_entries(url)
+        return {
+            "count": len(entries),
+            "timestamps": [entry["timestamp"] for entry in entries[-20:]],
+        }
+
+
+# Shared dead-letter store for this process
+_dead_letters = None
+_dead_letters_lock = threading.Lock()
+
+
+def get_dead_letters():
+    """Return the process-wide dead-letter store"""
+    global _dead_letters
+
+    with _dead_letters_lock:
+        if _dead_letters is None:
+            _dead_letters = DeadLetterStore(DEAD_LETTER_DIR, DEAD_LETTER_MAX_ENTRIES)
+        return _dead_letters
@@ -0,0 +1,150 @@
+"""
+Restart check for YouTube Livestream Transcriber.
+Starts and stops a full pipeline several times, as repeated connect_livestream
+calls do, and fails when stop() is slow or a worker outlives its pipeline.
+
+Only the edges are stubbed: each chunk extraction registers a fake ffmpeg
+process that blocks like a live stream waiting for new audio until it is
+terminated, and API calls go over HTTP to the stub OpenAI server. Each cycle
+stops the pipeline while an extraction is in flight and a topic call may be
+running.
+
+Run `python restart_check.py [restarts]`; the exit status is 1 when a stop took
+longer than RESTART_MAX_STOP_SECONDS or any worker was still running after it.
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import concurrency
+import credentials
+import disk_cache
+import exporters
+import pipeline
+import resilience
+import stub_openai
+import transcription
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RESTART_MAX_STOP_SECONDS = 1.0
+# Chunks each cycle transcribes before extraction blocks at the live edge
+RESTART_CHUNKS_PER_CYCLE = 3
+
+
+class _FakeFfmpeg:
+    """Stands in for an ffmpeg process blocked on a live stream"""
+
+    def __init__(self):
+        self.terminated = threading.Event()
+
+    def poll(self):
+        return 0 if self.terminated.is_set() else None
+
+    def terminate(self):
+        self.terminated.set()
+
+
+class _StubSource:
+    """Serves a few chunks, then blocks like ffmpeg waiting for live audio"""
+
+    def __init__(self, chunks_before_blocking):
+        self.chunks_before_blocking = chunks_before_blocking
+        self.chunks = 0
+        self.blocked = threading.Event()  # An extraction is waiting at the live edge
+
+    def extract(
+        self,
+        audio_url,
+        chunk_duration=15,
+        start_time=0,
+        register_process=None,
+        temp_dir=None,
+    ):
+        process = _FakeFfmpeg()
+        if register_process is not None:
+            register_process(process)
+        if self.chunks >= self.chunks_before_blocking:
+            self.blocked.set()
+            # Only termination ends it, as with a stream that stopped sending
+            process.terminated.wait()
+            raise RuntimeError("ffmpeg terminated")
+        temp_file = tempfile.NamedTemporaryFile(
+            suffix=".mp3", delete=False, dir=temp_dir
+        )
+        with temp_file:
+            temp_file.write(os.urandom(2048))
+        self.chunks += 1
+        return temp_file.name, (start_time, chunk_duration)
+
+
+class _NullEmitter:
+    def emit(self, event, data=None, **kwargs):
+        pass
+
+
+def restart_check(restarts=5):
+    """Run the restart cycles and return True when every stop was fast and clean"""
+    logging.getLogger().setLevel(logging.WARNING)
+    scratch = tempfile.mkdtemp(prefix="restart-check-")
+    server = stub_openai.serve(0, delay=0.05)  # Calls are in flight when stopping
+
+    pipeline.CHUNK_TEMP_DIR = scratch
+    exporters.EXPORT_DIR = os.path.join(scratch, "exports")
+    resilience.DEAD_LETTER_DIR = os.path.join(scratch, "dead-letters")
+    disk_cache.RESULT_CACHE_ENABLED = False  # Fingerprinting needs ffmpeg
+    transcription.get_audio_stream_url = lambda url: (
+        "restart://audio",
+        {"title": "Restart Check Stream", "channel": "Restart", "viewers": "0"},
+    )
+    session_credentials = credentials.Credentials(
+        "sk-restart", api_base=f"http://127.0.0.1:{server.server_port}/v1"
+    )
+
+    failures = []
+    for cycle in range(1, restarts + 1):
+        source = _StubSource(RESTART_CHUNKS_PER_CYCLE)
+        transcription.extract_audio_chunk = source.extract
+        livestream = pipeline.LivestreamPipeline(
+            "https://www.youtube.com/watch?v=restartchk0",
+            _NullEmitter(),
+            session_credentials,
+        )
+        livestream.start()
+        if not source.blocked.wait(30):
+            failures.append(f"cycle {cycle}: ingest never reached the live edge")
+
+        started = time.perf_counter()
+        livestream.stop(timeout=5.0)
+        elapsed = time.perf_counter() - started
+        leaked = concurrency.active_workers()
+        print(
+            f"cycle {cycle}: {source.chunks} chunks, stop() took {elapsed * 1000:.0f} ms, "
+            f"workers left: {', '.join(leaked) or 'none'}"
+        )
+        if elapsed > RESTART_MAX_STOP_SECONDS:
+            failures.append(
+                f"cycle {cycle}: stop() took {elapsed:.2f}s (limit {RESTART_MAX_STOP_SECONDS}s)"
+            )
+        if leaked:
+            failures.append(f"cycle {cycle}: workers still running: {leaked}")
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+    else:
+        print(f"PASS: {restarts} restarts, every stop was fast and left no workers")
+
+    server.shutdown()
+    shutil.rmtree(scratch, ignore_errors=True)
+    return not failures
+
+
+if __name__ == "__main__":
+    restarts = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    sys.exit(0 if restart_check(restarts) else 1)
@@ -0,0 +1,173 @@
+"""
+Seam merge module for YouTube Livestream Transcriber.
+Removes text duplicated at chunk seams when audio chunks overlap.
+The overlap region is transcribed twice, once at the end of the previous chunk and
+once at the start of the current one; the longest common run of tokens between the
+two marks where the new text really starts. Only as many tokens as the overlap can
+hold are compared, and a run that does not reach both ends of the overlap is
+ignored, so phrases that merely repeat near the seam never cut into new speech.
+
+Run `python seam_merge.py` for a cost/accuracy benchmark on synthetic transcripts.
+"""
+
+import re
+import math
+import time
+import random
+
+# At most this many tokens at each side of the seam are compared
+MAX_SEAM_TOKENS = 40
+# Fast speech; sizes the compared windows to what the overlap can hold
+MAX_WORDS_PER_SECOND = 4.5
+# Words at either end of the overlap that may be mis-transcribed at the cut
+SEAM_SLACK_TOKENS = 2
+# Shorter common runs are treated as coincidence, not overlap
+MIN_MATCH_TOKENS = 3
+
+_TOKEN_PATTERN = re.compile(r"\S+")
+_NORMALIZE_PATTERN = re.compile(r"[^\w']+")
+
+
+def _tokens(text):
+    """Split text into (normalized token, start, end) tuples"""
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text):
+        normalized = _NORMALIZE_PATTERN.sub("", match.group().lower())
+        if normalized:
+            tokens.append((normalized, match.start(), match.end()))
+    return tokens
+
+
+def longest_common_run(first, second):
+    """Longest common contiguous run between two token lists.
+
+    Returns (length, end index in first, end index in second).
+    """
+    best = (0, 0, 0)
+    previous_row = [0] * (len(second) + 1)
+    for i in range(1, len(first) + 1):
+        row = [0] * (len(second) + 1)
+        token = first[i - 1]
+        for j in range(1, len(second) + 1):
+            if token == second[j - 1]:
+                row[j] = previous_row[j - 1] + 1
+                if row[j] > best[0]:
+                    best = (row[j], i, j)
+        previous_row = row
+    return best
+
+
+def seam_window(overlap_seconds):
+    """Tokens at each side of the seam that can belong to the overlap"""
+    words = math.ceil(overlap_seconds * MAX_WORDS_PER_SECOND) + SEAM_SLACK_TOKENS
+    return min(words, MAX_SEAM_TOKENS)
+
+
+def merge_seam(
+    previous_text,
+    current_text,
+    overlap_seconds=None,
+    min_match=MIN_MATCH_TOKENS,
+    slack=SEAM_SLACK_TOKENS,
+):
+    """Return current_text without the words already present at the end of previous_text"""
+    if not previous_text or not current_text:
+        return current_text
+
+    max_tokens = MAX_SEAM_TOKENS
+    if overlap_seconds is not None:
+        max_tokens = seam_window(overlap_seconds)
+    previous_tail = _tokens(previous_text)[-max_tokens:]
+    current_tokens = _tokens(current_text)
+    current_head = current_tokens[:max_tokens]
+
+    length, previous_end, current_end = longest_common_run(
+        [token[0] for token in previous_tail], [token[0] for token in current_head]
+    )
+    if length < min_match:
+        return current_text
+
+    # The overlap ends the previous chunk and starts the current one; a run
+    # anywhere else is a repeated phrase, so leave the text uncut
+    if len(previous_tail) - previous_end > slack or current_end - length > slack:
+        return current_text
+
+    # Words after the run in the previous chunk are the same audio, possibly
+    # mis-transcribed at the cut, so skip as many words in the current chunk
+    current_end = min(
+        current_end + len(previous_tail) - previous_end, len(current_head)
+    )
+
+    # Everything up to the end of the overlap was already emitted
+    cut = current_head[current_end - 1][2]
+    return current_text[cut:].lstrip(" ,.;:-")
+
+
+def _benchmark(samples=2000, seed=7, overlap_seconds=2.0):
+    """Measure merge cost and accuracy on synthetic overlapping transcripts"""
+    vocabulary = (
+        "bitcoin eth support resistance breakout the a to is we are looking at "
+        "this chart weekly daily level volume funding rate liquidation long short "
+        "market price target move trend higher lower range fomc cpi rsi macd"
+    ).split()
+    # Said again and again on a stream, so it shows up on both sides of seams
+    phrase = "you know what the price of".split()
+    rng = random.Random(seed)
+
+    def noisy(words):
+        # Whisper often mangles the first and last word of a cut
+        words = list(words)
+        if words and rng.random() < 0.5:
+            words[0] = rng.choice(vocabulary)
+        if words and rng.random() < 0.5:
+            words[-1] = rng.choice(vocabulary)
+        return words
+
+    def run(repeated_phrase):
+        exact = 0
+        duplicated = 0
+        lost = 0
+        elapsed = 0.0
+        for _ in range(samples):
+            chunk_words = rng.randint(40, 70)  # ~20 s of speech
+            overlap_words = rng.randint(4, 9)  # 2 s overlap at 2-4.5 words/s
+            stream = [rng.choice(vocabulary) for _ in range(2 * chunk_words)]
+            if repeated_phrase:
+                # Once well before the seam and once well after it
+                before = rng.randint(15, 25)
+                after = chunk_words + rng.randint(15, 25)
+                stream[chunk_words - before : chunk_words - before + len(phrase)] = (
+                    phrase
+                )
+                stream[after : after + len(phrase)] = phrase
+            previous = noisy(stream[:chunk_words])
+            current = noisy(stream[chunk_words - overlap_words :])
+            expected = " ".join(current[overlap_words:])
+
+            start = time.perf_counter()
+            merged = merge_seam(" ".join(previous), " ".join(current), overlap_seconds)
+            elapsed += time.perf_counter() - start
+
+            merged_count = len(merged.split())
+            expected_count = len(expected.split())
+            if merged == expected:
+                exact += 1
+            elif merged_count > expected_count:
+                duplicated += 1
+            else:
+                lost += 1
+
+        print(f"mean merge cost: {elapsed / samples * 1e6:.1f} us")
+        print(f"exact seams: {exact / samples:.1%}")
+        print(f"seams with duplicated words: {duplicated / samples:.1%}")
+        print(f"seams with lost words: {lost / samples:.1%}")
+
+    print(f"samples: {samples}, overlap: {overlap_seconds:g} s")
+    print("random speech:")
+    run(repeated_phrase=False)
+    print(f"with '{' '.join(phrase)}' repeated before and after the seam:")
+    run(repeated_phrase=True)
+
+
+if __name__ == "__main__":
+    _benchmark()
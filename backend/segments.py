@@ -0,0 +1,214 @@
+"""
+Segments module for YouTube Livestream Transcriber.
+Compact storage for verbose transcription output (TRANSCRIPTION_VERBOSE=true).
+Segment start/end times and no-speech probabilities are kept in typed arrays
+instead of one dict per segment, so a whole stream's segment timeline stays small.
+The timeline is used to drop no-speech segments before topic analysis and to place
+chapter boundaries at segment precision instead of chunk precision.
+
+Run `python segments.py` for a parser benchmark over large verbose responses
+served by the stub OpenAI server.
+"""
+
+import os
+import json
+import time
+import bisect
+import tracemalloc
+import urllib.request
+from array import array
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Keep segment timing from the transcription backend
+TRANSCRIPTION_VERBOSE = os.getenv("TRANSCRIPTION_VERBOSE", "false").lower() == "true"
+# Segments more likely silence than speech are dropped (Whisper's own default)
+NO_SPEECH_THRESHOLD = float(os.getenv("NO_SPEECH_THRESHOLD", "0.6"))
+
+
+class SegmentTable:
+    """Column-oriented segments: start/end seconds, no-speech probability, text"""
+
+    def __init__(self, keep_text=True):
+        self.starts = array("d")
+        self.ends = array("d")
+        self.no_speech = array("f")
+        self.texts = [] if keep_text else None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def append(self, start, end, no_speech_prob=0.0, text=""):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.no_speech.append(no_speech_prob)
+        if self.texts is not None:
+            self.texts.append(text)
+
+    @classmethod
+    def from_segments(cls, segments):
+        """Parse the "segments" list of a verbose_json transcription response"""
+        table = cls()
+        starts, ends, no_speech, texts = (
+            table.starts,
+            table.ends,
+            table.no_speech,
+            table.texts,
+        )
+        for segment in segments:
+            starts.append(segment["start"])
+            ends.append(segment["end"])
+            no_speech.append(segment.get("no_speech_prob", 0.0))
+            texts.append(segment["text"])
+        return table
+
+    def to_json(self):
+        """Plain-JSON form for the result cache"""
+        return {
+            "starts": self.starts.tolist(),
+            "ends": self.ends.tolist(),
+            "no_speech": self.no_speech.tolist(),
+            "texts": self.texts,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        table = cls()
+        table.starts.extend(data["starts"])
+        table.ends.extend(data["ends"])
+        table.no_speech.extend(data["no_speech"])
+        table.texts.extend(data["texts"])
+        return table
+
+    def is_speech(self, index, threshold=NO_SPEECH_THRESHOLD):
+        return self.no_speech[index] < threshold
+
+    def text(self):
+        """Full text of every segment"""
+        return "".join(self.texts).strip()
+
+    def speech_text(self, threshold=NO_SPEECH_THRESHOLD):
+        """Text of the segments that are likely speech"""
+        return " ".join(
+            self.texts[index].strip()
+            for index in range(len(self))
+            if self.no_speech[index] < threshold
+        ).strip()
+
+    def shifted(self, offset, min_start=0.0, keep_text=False):
+        """Copy of the segments starting at or after min_start, moved by offset"""
+        table = SegmentTable(keep_text)
+        for index in range(len(self)):
+            if self.starts[index] >= min_start:
+                table.append(
+                    self.starts[index] + offset,
+                    self.ends[index] + offset,
+                    self.no_speech[index],
+                    self.texts[index] if keep_text else "",
+                )
+        return table
+
+    def extend(self, other):
+        self.starts.extend(other.starts)
+        self.ends.extend(other.ends)
+        self.no_speech.extend(other.no_speech)
+        if self.texts is not None:
+            self.texts.extend(other.texts or [""] * len(other))
+
+    def trim_before(self, seconds):
+        """Drop the segments that start before seconds, returning how many"""
+        count = bisect.bisect_left(self.starts, seconds)
+        if count:
+            del self.starts[:count]
+            del self.ends[:count]
+            del self.no_speech[:count]
+            if self.texts is not None:
+                del self.texts[:count]
+        return count
+
+    def best_boundary(self, window_start, window_end, threshold=NO_SPEECH_THRESHOLD):
+        """Start of the speech segment in the window that follows the longest pause
+
+        Topic changes usually begin after a pause, so this is the most likely
+        precise start of a chapter detected somewhere in the window. Returns
+        None when the window holds no speech segments.
+        """
+        first = bisect.bisect_left(self.starts, window_start)
+        last = bisect.bisect_right(self.starts, window_end)
+
+        best_start = None
+        best_gap = -1.0
+        previous_end = None
+        for index in range(max(first - 1, 0), last):
+            if not self.is_speech(index, threshold):
+                continue  # Silence counts as part of the pause
+            if index >= first:
+                gap = (
+                    self.starts[index] - previous_end
+                    if previous_end is not None
+                    else 0.0
+                )
+                if gap > best_gap:
+                    best_gap = gap
+                    best_start = self.starts[index]
+            previous_end = self.ends[index]
+        return best_start
+
+
+def _benchmark(segment_counts=(1000, 10000, 50000), repeats=5):
+    """Parse large verbose responses from the stub server into SegmentTables"""
+    import stub_openai
+
+    server = stub_openai.serve(0)
+    url = f"http://127.0.0.1:{server.server_port}/v1/audio/transcriptions"
+
+    for count in segment_counts:
+        stub_openai.StubHandler.state.verbose_segments = count
+        request = urllib.request.Request(
+            url, data=b"response_format=verbose_json", method="POST"
+        )
+        body = urllib.request.urlopen(request).read()
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            response = json.loads(body)
+        decode_time = (time.perf_counter() - started) / repeats
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            table = SegmentTable.from_segments(response["segments"])
+        parse_time = (time.perf_counter() - started) / repeats
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            table.speech_text()
+        filter_time = (time.perf_counter() - started) / repeats
+
+        # Memory of the timing columns vs keeping the decoded dicts
+        tracemalloc.start()
+        timeline = table.shifted(0.0)
+        table_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        tracemalloc.start()
+        decoded = json.loads(body)["segments"]
+        dict_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del decoded, timeline
+
+        print(f"{count} segments ({len(body) / 1048576:.1f} MB response)")
+        print(f"  json decode:        {decode_time * 1000:.1f} ms")
+        print(
+            f"  table parse:        {parse_time * 1000:.1f} ms ({parse_time / count * 1e6:.2f} us/segment)"
+        )
+        print(f"  no-speech filter:   {filter_time * 1000:.1f} ms")
+        print(
+            f"  timeline memory:    {table_bytes / 1024:.0f} KB vs {dict_bytes / 1024:.0f} KB as dicts"
+        )
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    _benchmark()
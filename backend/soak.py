@@ -0,0 +1,267 @@
+"""
+Soak module for YouTube Livestream Transcriber.
+Drives a simulated long stream through a full pipeline at accelerated speed and
+fails when memory, file descriptors, threads or temp files keep growing.
+
+Only the edges are stubbed: audio chunks are random bytes written where ffmpeg
+would write them, and transcription, topic and summary calls go over HTTP to
+the stub OpenAI server. Everything in between (retries, caches, detectors,
+rolling summaries, chapter refinement, exports, replay history) is the real
+code with its default caps.
+
+Resource usage is sampled every SOAK_SAMPLE_MINUTES of stream time. Caches and
+histories fill up during the first half of the run, so growth is measured
+between the middle and the end; a bounded backend stays flat there. On failure
+the allocation sites that grew the most are printed.
+
+Run `python soak.py [hours] [speedup]` (default: 24 hours at 2000x); the exit
+status is 1 when any resource grew past its limit.
+"""
+
+import os
+import sys
+import glob
+import time
+import random
+import shutil
+import logging
+import tempfile
+import threading
+import tracemalloc
+import collections
+import credentials
+import disk_cache
+import exporters
+import pipeline
+import resilience
+import streams
+import stub_openai
+import transcription
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SOAK_SAMPLE_MINUTES = 30
+# Share of the run spent warming up (caches and histories filling up)
+SOAK_WARMUP_SHARE = 0.5
+# Growth allowed between the end of the warm-up and the end of the run
+SOAK_MAX_TRACED_GROWTH_MB = 2.0
+SOAK_MAX_RSS_GROWTH_MB = 32.0
+SOAK_MAX_FD_GROWTH = 4
+SOAK_MAX_THREAD_GROWTH = 2
+# Audio chunks on disk at any time: the one just extracted
+SOAK_MAX_TEMP_FILES = 1
+# Chunks whose extraction fails (and is retried)
+SOAK_EXTRACT_FAILURE_RATE = 0.005
+
+
+def rss_mb():
+    """Resident set size of this process"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Peak only
+
+
+def open_fds():
+    """Open file descriptors of this process, or None where unknown"""
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def temp_usage(directory):
+    """(files, bytes) in the pipelines' chunk directories under directory"""
+    files = 0
+    size = 0
+    pattern = os.path.join(directory, pipeline.CHUNK_TEMP_PREFIX + "*")
+    for chunk_dir in glob.glob(pattern):
+        for name in os.listdir(chunk_dir):
+            files += 1
+            size += os.path.getsize(os.path.join(chunk_dir, name))
+    return files, size
+
+
+class _StubSource:
+    """Stands in for ffmpeg: paces chunks and writes random audio bytes"""
+
+    def __init__(self, speedup, on_chunk, failure_rate=SOAK_EXTRACT_FAILURE_RATE):
+        self.speedup = speedup
+        self.on_chunk = on_chunk  # Called with the chunk count once it is written
+        self.failure_rate = failure_rate
+        self.random = random.Random(0)
+        self.chunks = 0
+
+    def extract(
+        self,
+        audio_url,
+        chunk_duration=15,
+        start_time=0,
+        register_process=None,
+        temp_dir=None,
+    ):
+        time.sleep(chunk_duration / self.speedup)
+        temp_file = tempfile.NamedTemporaryFile(
+            suffix=".mp3", delete=False, dir=temp_dir
+        )
+        with temp_file:
+            temp_file.write(os.urandom(2048))
+        self.chunks += 1
+        self.on_chunk(self.chunks)
+        if self.random.random() < self.failure_rate:
+            os.remove(temp_file.name)
+            raise RuntimeError("Simulated ffmpeg failure")
+        return temp_file.name, (start_time, chunk_duration)
+
+
+class _CountingEmitter:
+    """Client stand-in that only counts the events it receives"""
+
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def emit(self, event, data=None, **kwargs):
+        self.counts[event] += 1
+
+
+def soak(hours=24.0, speedup=2000.0):
+    """Run the soak test and return True when every resource stayed bounded"""
+    logging.getLogger().setLevel(logging.WARNING)  # Per-chunk logs would dominate
+    scratch = tempfile.mkdtemp(prefix="soak-")
+    server = stub_openai.serve(0)
+
+    # Keep everything the run writes in the scratch directory, at stream speed
+    pipeline.CHUNK_TEMP_DIR = scratch
+    exporters.EXPORT_DIR = os.path.join(scratch, "exports")
+    resilience.DEAD_LETTER_DIR = os.path.join(scratch, "dead-letters")
+    disk_cache.RESULT_CACHE_ENABLED = False  # Fingerprinting needs ffmpeg
+    resilience.RETRY_POLICIES = {
+        stage: resilience.RetryPolicy(
+            policy.attempts, policy.base_delay / speedup, policy.max_delay / speedup
+        )
+        for stage, policy in resilience.RETRY_POLICIES.items()
+    }
+
+    total_chunks = int(hours * 3600 / pipeline.CHUNK_DURATION)
+    sample_every = max(int(SOAK_SAMPLE_MINUTES * 60 / pipeline.CHUNK_DURATION), 1)
+    warmup_chunks = int(total_chunks * SOAK_WARMUP_SHARE)
+    samples = []
+    snapshots = {}
+    done = threading.Event()
+
+    def sample(chunks):
+        files, size = temp_usage(scratch)
+        samples.append(
+            {
+                "chunks": chunks,
+                "hours": chunks * pipeline.CHUNK_DURATION / 3600,
+                "rss": rss_mb(),
+                "traced": tracemalloc.get_traced_memory()[0] / 1048576,
+                "fds": open_fds(),
+                "threads": threading.active_count(),
+                "temp_files": files,
+                "temp_kb": size / 1024,
+            }
+        )
+        s = samples[-1]
+        print(
+            f"{s['hours']:5.1f}h  rss {s['rss']:6.1f} MB  traced {s['traced']:5.1f} MB  "
+            f"fds {s['fds']}  threads {s['threads']}  temp {s['temp_files']} files/{s['temp_kb']:.0f} KB"
+        )
+
+    def on_chunk(chunks):
+        if chunks % sample_every == 0:
+            sample(chunks)
+        if chunks == warmup_chunks:
+            snapshots["warm"] = tracemalloc.take_snapshot()
+        if chunks >= total_chunks:
+            done.set()
+
+    source = _StubSource(speedup, on_chunk)
+    transcription.extract_audio_chunk = source.extract
+    transcription.get_audio_stream_url = lambda url: (
+        "soak://audio",
+        {"title": "Soak Test Stream", "channel": "Soak", "viewers": "0"},
+    )
+
+    emitter = _CountingEmitter()
+    history = streams.StreamHistory()
+    livestream = pipeline.LivestreamPipeline(
+        streams.canonical_url("soaksoak000"),
+        streams.RoomEmitter(emitter, streams.room_name("soaksoak000"), history),
+        credentials.Credentials(
+            "sk-soak", api_base=f"http://127.0.0.1:{server.server_port}/v1"
+        ),
+    )
+
+    print(f"Soaking {hours:g} hours of stream ({total_chunks} chunks) at {speedup:g}x")
+    tracemalloc.start()
+    started = time.perf_counter()
+    livestream.start()
+    done.wait()
+    livestream.stop(timeout=5.0)
+    elapsed = time.perf_counter() - started
+    final = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    leftover_dirs = glob.glob(os.path.join(scratch, pipeline.CHUNK_TEMP_PREFIX + "*"))
+    dropped = (
+        livestream.topic_detector.topic_queue.dropped
+        + livestream.major_topic_detector.major_topic_queue.dropped
+    )
+    print(f"  {elapsed:.0f}s wall time, {source.chunks} chunks")
+    print(
+        f"  events: {emitter.counts['transcription']} transcriptions, "
+        f"{emitter.counts['major_topic_change']} chapters, "
+        f"{len(history)} in replay history, {dropped} detector items dropped"
+    )
+    print(f"  stub requests: {stub_openai.StubHandler.state.counts}")
+
+    # Growth after the warm-up; a bounded backend is flat here
+    warm = next(s for s in samples if s["chunks"] >= warmup_chunks)
+    last = samples[-1]
+    failures = []
+    checks = (
+        ("traced", SOAK_MAX_TRACED_GROWTH_MB, "MB traced"),
+        ("rss", SOAK_MAX_RSS_GROWTH_MB, "MB RSS"),
+        ("fds", SOAK_MAX_FD_GROWTH, "file descriptors"),
+        ("threads", SOAK_MAX_THREAD_GROWTH, "threads"),
+    )
+    for name, limit, unit in checks:
+        if warm[name] is None:
+            continue
+        growth = last[name] - warm[name]
+        print(f"  growth after warm-up: {growth:+.1f} {unit} (limit {limit})")
+        if growth > limit:
+            failures.append(f"{unit} grew by {growth:.1f}")
+    most_temp_files = max(s["temp_files"] for s in samples)
+    if most_temp_files > SOAK_MAX_TEMP_FILES:
+        failures.append(f"{most_temp_files} audio chunks were on disk at once")
+    if leftover_dirs:
+        failures.append(f"chunk directories left behind: {leftover_dirs}")
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        print("  top growing allocation sites:")
+        for stat in final.compare_to(snapshots["warm"], "lineno")[:8]:
+            print(f"    {stat}")
+    else:
+        print("PASS: every resource stayed bounded")
+
+    server.shutdown()
+    shutil.rmtree(scratch, ignore_errors=True)
+    return not failures
+
+
+if __name__ == "__main__":
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 24.0
+    speedup = float(sys.argv[2]) if len(sys.argv) > 2 else 2000.0
+    sys.exit(0 if soak(hours, speedup) else 1)
@@ -0,0 +1,309 @@
+"""
+Streams module for YouTube Livestream Transcriber.
+One shared pipeline per livestream. Requests are keyed by canonical video ID, so
+watch, youtu.be and /live/ URLs of the same stream end up on the same pipeline.
+Each client that requests a stream subscribes to its Socket.IO room. Later
+subscribers get the history so far replayed to them, and the pipeline stops when
+its last subscriber leaves.
+"""
+
+import os
+import re
+import logging
+import itertools
+import threading
+import collections
+from urllib.parse import urlparse, parse_qs
+from dotenv import load_dotenv
+import broker
+import concurrency
+import pipeline
+import transcription
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Events replayed to clients that join a stream that is already running
+HISTORY_EVENTS = (
+    "livestream_info",
+    "export_ready",
+    "transcription",
+    "topic_change",
+    "major_topic_change",
+    "major_topics_refined",
+    "entity_timeline",
+)
+STREAM_HISTORY_MAX_EVENTS = int(os.getenv("STREAM_HISTORY_MAX_EVENTS", "5000"))
+# Events that carry the full state, so only the newest one is replayed
+SNAPSHOT_EVENTS = ("major_topics_refined", "entity_timeline")
+
+_VIDEO_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{11}$")
+# Path prefixes that are followed by the video ID on youtube.com
+_VIDEO_PATH_PREFIXES = ("live", "embed", "shorts", "v")
+
+
+def _parse_youtube_url(url):
+    """(host without www., path parts, query) of a URL with or without scheme"""
+    parsed = urlparse(url.strip() if "://" in url else f"https://{url.strip()}")
+    host = parsed.netloc.lower().split(":")[0]
+    if host.startswith("www."):
+        host = host[4:]
+    return host, [part for part in parsed.path.split("/") if part], parsed.query
+
+
+def _is_youtube_host(host):
+    return host in ("youtube.com", "youtu.be") or host.endswith(".youtube.com")
+
+
+def canonical_video_id(url):
+    """The 11-character video ID of a YouTube URL, or None if there is none"""
+    host, path_parts, query = _parse_youtube_url(url)
+
+    video_id = None
+    if host == "youtu.be" and path_parts:
+        video_id = path_parts[0]
+    elif host == "youtube.com" or host.endswith(".youtube.com"):
+        if path_parts[:1] == ["watch"]:
+            video_id = parse_qs(query).get("v", [None])[0]
+        elif len(path_parts) >= 2 and path_parts[0] in _VIDEO_PATH_PREFIXES:
+            video_id = path_parts[1]
+
+    if video_id and _VIDEO_ID_PATTERN.match(video_id):
+        return video_id
+    return None
+
+
+def stream_key(url):
+    """Registry key of a YouTube URL: its video ID, or the channel path for
+    URLs like youtube.com/@channel/live that only resolve to a video at ingest"""
+    video_id = canonical_video_id(url)
+    if video_id:
+        return video_id
+    host, path_parts, _ = _parse_youtube_url(url)
+    video_paths = ("watch",) + _VIDEO_PATH_PREFIXES
+    if _is_youtube_host(host) and host != "youtu.be" and path_parts:
+        if path_parts[0] in video_paths:
+            return None  # A video URL without a valid ID
+        return "youtube.com/" + "/".join(path_parts)
+    return None
+
+
+def resolve_stream_key(url):
+    """stream_key, with channel pages resolved to the video ID live on them
+
+    A channel's /live URL, the watch URL of the same broadcast and the channel
+    watcher (which keys by video ID) then share one pipeline. The resolved audio
+    URL is pre-warmed so an in-process ingest skips yt-dlp. Channel pages that
+    cannot be resolved keep their path key.
+    """
+    key = stream_key(url)
+    if key is None or _VIDEO_ID_PATTERN.match(key):
+        return key
+    try:
+        resolved = concurrency.run_blocking(
+            transcription.resolve_video, canonical_url(key)
+        )
+    except Exception as e:
+        logger.warning(f"Could not resolve {key} to a video: {str(e)}")
+        return key
+    if resolved is None:
+        return key
+
+    video_id, audio_url, stream_info = resolved
+    if not broker.uses_worker_processes():
+        transcription.prewarm_stream_url(
+            canonical_url(video_id), audio_url, stream_info
+        )
+    logger.info(f"{key} is live as {video_id}")
+    return video_id
+
+
+def canonical_url(key):
+    """URL the shared pipeline ingests for a registry key"""
+    if _VIDEO_ID_PATTERN.match(key):
+        return f"https://www.youtube.com/watch?v={key}"
+    return f"https://www.{key}"
+
+
+def room_name(key):
+    """Socket.IO room of a stream's subscribers"""
+    return f"stream:{key}"
+
+
+class StreamHistory:
+    """Events replayed to late subscribers, bounded by STREAM_HISTORY_MAX_EVENTS
+
+    Snapshot events only keep their newest copy and are replayed last. Recording
+    never iterates the log, so pipeline threads can record concurrently.
+    """
+
+    def __init__(self, max_events=STREAM_HISTORY_MAX_EVENTS):
+        self.events = collections.deque(maxlen=max_events)
+        self.snapshots = {}  # event -> newest data
+
+    def __len__(self):
+        return len(self.events) + len(self.snapshots)
+
+    def record(self, event, data):
+        if event in SNAPSHOT_EVENTS:
+            self.snapshots[event] = data
+        elif event in HISTORY_EVENTS:
+            self.events.append((event, data))
+
+    def replay(self):
+        """Copy of the recorded events, oldest first"""
+        return list(self.events) + list(self.snapshots.items())
+
+
+class RoomEmitter:
+    """Emitter that sends a pipeline's events to its room and records history"""
+
+    def __init__(self, emitter, room, history=None, sequence=None):
+        self.emitter = emitter
+        self.room = room
+        self.history = history
+        # Compact event ids of this room
+        self.sequence = itertools.count(1) if sequence is None else sequence
+
+    def emit(self, event, data=None, **kwargs):
+        kwargs.pop("broadcast", None)
+        kwargs.pop("to", None)
+        if self.history is not None:
+            self.history.record(event, data)
+        return self.emitter.emit(
+            event, data, to=self.room, sequence=self.sequence, **kwargs
+        )
+
+
+class StreamSession:
+    """A livestream's pipeline (or worker process) and its subscribers"""
+
+    def __init__(self, key):
+        self.key = key
+        self.url = canonical_url(key)
+        self.room = room_name(key)
+        self.subscribers = set()
+        self.history = StreamHistory()
+        self.sequence = itertools.count(1)  # Compact event ids of the room
+        self.pipeline = None  # In-process pipeline when no broker is configured
+        self.worker_process = None  # Pipeline worker when a broker is configured
+        self.started = False
+
+    def start(self, emitter, session_credentials=None):
+        """Start ingest for this stream, in this process or in a worker"""
+        self.started = True
+        if broker.uses_worker_processes():
+            # The worker emits to the room itself; see SubscriberRelay for history
+            self.worker_process = broker.spawn_worker(self.url, session_credentials)
+        else:
+            self.pipeline = pipeline.LivestreamPipeline(
+                self.url,
+                RoomEmitter(emitter, self.room, self.history, self.sequence),
+                session_credentials,
+            )
+            self.pipeline.start()
+
+    def is_running(self):
+        if self.worker_process is not None:
+            return self.worker_process.poll() is None
+        return self.pipeline is not None and self.pipeline.is_alive()
+
+    def stop(self):
+        if self.worker_process is not None:
+            broker.stop_worker(self.worker_process)
+            self.worker_process = None
+        if self.pipeline is not None:
+            self.pipeline.stop(timeout=1.0)  # Stops ingest and both topic workers
+            self.pipeline = None
+
+    def replay(self):
+        """Copy of the recorded history, oldest first"""
+        return self.history.replay()
+
+
+class StreamRegistry:
+    """Shared stream sessions and the sids subscribed to them"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}  # stream key -> StreamSession
+        self.memberships = {}  # sid -> stream key
+
+    def subscribe(self, sid, key):
+        """Attach a client to a stream
+
+        Returns (session, created, left): created is True when the caller has to
+        start the session, and left is the (session, orphaned) pair of the stream
+        the client was watching before, if any.
+        """
+        with self.lock:
+            left = None
+            if self.memberships.get(sid) not in (None, key):
+                left = self._detach(sid)
+
+            session = self.sessions.get(key)
+            # Restart a stream whose previous ingest ended on its own
+            created = session is None or (session.started and not session.is_running())
+            if created:
+                previous = session
+                session = StreamSession(key)
+                if previous is not None:
+                    session.subscribers.update(previous.subscribers)
+                self.sessions[key] = session
+            session.subscribers.add(sid)
+            self.memberships[sid] = key
+            return session, created, left
+
+    def unsubscribe(self, sid):
+        """Detach a client; returns (session, orphaned) or None"""
+        with self.lock:
+            return self._detach(sid)
+
+    def _detach(self, sid):
+        key = self.memberships.pop(sid, None)
+        session = self.sessions.get(key)
+        if session is None:
+            return None
+        session.subscribers.discard(sid)
+        orphaned = not session.subscribers
+        if orphaned:
+            del self.sessions[key]
+        return session, orphaned
+
+    def stream_of(self, sid):
+        """Key of the stream a client is subscribed to, or None"""
+        with self.lock:
+            return self.memberships.get(sid)
+
+    def session_for_room(self, room):
+        with self.lock:
+            return self.sessions.get(room.split(":", 1)[-1])
+
+    def stats(self):
+        with self.lock:
+            return {
+                key: len(session.subscribers) for key, session in self.sessions.items()
+            }
+
+
+class SubscriberRelay:
+    """Relay target for worker events that records each stream's history and
+    numbers its compact events"""
+
+    def __init__(self, registry, emitter):
+        self.registry = registry
+        self.emitter = emitter
+
+    def emit(self, event, data=None, to=None, **kwargs):
+        if to is not None:
+            kwargs["to"] = to
+            session = self.registry.session_for_room(to)
+            if session is not None:
+                if event in HISTORY_EVENTS:
+                    session.history.record(event, data)
+                kwargs["sequence"] = session.sequence
+        return self.emitter.emit(event, data, **kwargs)
@@ -0,0 +1,237 @@
+"""
+Stub OpenAI server for YouTube Livestream Transcriber.
+A local stand-in for the OpenAI API, used to exercise caching, retries and load
+without a key or network access. Point the backend at it with
+OPENAI_API_BASE=http://127.0.0.1:8089/v1.
+
+Chat completions return deterministic replies in the formats the topic detectors
+parse, and transcriptions return text derived from the uploaded audio bytes (one
+in 16 opens with an explicit topic transition).
+GET /stats reports how many requests reached the stub.
+
+Run `python stub_openai.py [port] [delay_seconds]`.
+"""
+
+import re
+import sys
+import json
+import time
+import hashlib
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8089
+
+# Rough tokenizer for streamed replies: up to 4 characters with leading space
+_TOKEN_PATTERN = re.compile(r"\s*[^\s]{1,4}|\s+")
+
+STUB_TOPICS = [
+    "Bitcoin Price Action Analysis",
+    "Altcoin Technical Analysis",
+    "Market Sentiment Overview",
+    "Risk Management Techniques",
+]
+
+
+def _pick_topic(text):
+    """Stable topic for a piece of text"""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return STUB_TOPICS[digest[0] % len(STUB_TOPICS)]
+
+
+def stub_reply(messages):
+    """Reply text in the format the calling prompt asks for"""
+    prompt = messages[-1]["content"]
+    topic = _pick_topic(prompt)
+    # Explicit transitions are changes, everything else continues the topic
+    changed = "moving on" in prompt.lower()
+    if "[Topic Change: Yes/No]" in prompt and "[Confidence:" in prompt:
+        if changed:
+            return f"[Topic Change: Yes]\n[Confidence: 0.9]\n[New Major Topic: {topic}]"
+        return f"[Topic Change: No]\n[Confidence: 0.2]\n[New Major Topic: {topic}]"
+    if "[Topic Change: Yes/No]" in prompt:
+        return f"[Topic Change: {'Yes' if changed else 'No'}]\n[New Topic: {topic}]"
+    if "[Summary:" in prompt:
+        return f"[Summary: The hosts discussed {topic} and what it means for prices.]"
+    if "[Major Topic:" in prompt:
+        return f"[Major Topic: {topic}]"
+    return f"[Topic: {topic}]"
+
+
+def stub_verbose_transcription(text, state, segment_seconds=2.5):
+    """verbose_json reply with evenly spaced segments, every 7th one silent"""
+    segments = []
+    for index in range(state.verbose_segments):
+        silent = index % 7 == 6
+        segments.append(
+            {
+                "id": index,
+                "seek": 0,
+                "start": index * segment_seconds,
+                "end": (index + 1) * segment_seconds,
+                "text": " Thank you." if silent else f" {text}",
+                "tokens": [50364, 1468, 50464],
+                "temperature": 0.0,
+                "avg_logprob": -0.3,
+                "compression_ratio": 1.2,
+                "no_speech_prob": 0.92 if silent else 0.02,
+            }
+        )
+    return {
+        "task": "transcribe",
+        "language": "english",
+        "duration": state.verbose_segments * segment_seconds,
+        "text": "".join(segment["text"] for segment in segments).strip(),
+        "segments": segments,
+    }
+
+
+class StubState:
+    """Request counters shared by the handler threads"""
+
+    def __init__(self, delay=0.0, verbose_segments=8, token_delay=0.0):
+        self.delay = delay
+        self.token_delay = token_delay  # Pause between streamed tokens
+        self.tokens_sent = 0
+        self.verbose_segments = verbose_segments  # Segments per verbose_json reply
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def count(self, endpoint):
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible endpoints"""
+
+    state = StubState()
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_reply(self, model, reply):
+        """Send a reply as SSE chat.completion.chunk events, one token each"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        tokens = _TOKEN_PATTERN.findall(reply)
+        try:
+            for token in tokens + [None]:
+                delta = {"content": token} if token is not None else {}
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": delta,
+                            "finish_reason": None if token is not None else "stop",
+                        }
+                    ],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if token is not None:
+                    with self.state.lock:
+                        self.state.tokens_sent += 1
+                    time.sleep(self.state.token_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the completion
+            self.state.count("chat_cancelled")
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with self.state.lock:
+                self._send_json(dict(self.state.counts))
+            return
+        self._send_json({"error": {"message": "Not found"}}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        time.sleep(self.state.delay)
+
+        if self.path.endswith("/chat/completions"):
+            self.state.count("chat")
+            request = json.loads(body)
+            reply = stub_reply(request["messages"])
+            if request.get("stream"):
+                self._stream_reply(request["model"], reply)
+                return
+            # Generation time of the whole reply, as with a real model
+            tokens = len(_TOKEN_PATTERN.findall(reply))
+            time.sleep(self.state.token_delay * tokens)
+            with self.state.lock:
+                self.state.tokens_sent += tokens
+            self._send_json(
+                {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": reply},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": len(body) // 4,
+                        "completion_tokens": len(reply) // 4,
+                        "total_tokens": (len(body) + len(reply)) // 4,
+                    },
+                }
+            )
+        elif self.path.endswith("/audio/transcriptions"):
+            self.state.count("transcription")
+            digest = hashlib.sha256(body).hexdigest()[:8]
+            text = f"Stub transcript {digest} about {_pick_topic(digest)}."
+            if digest.startswith("0"):
+                text = f"Moving on to {_pick_topic(digest)}. {text}"  # 1 in 16
+            if b"verbose_json" in body:
+                self._send_json(stub_verbose_transcription(text, self.state))
+            else:
+                self._send_json({"text": text})
+        else:
+            self._send_json({"error": {"message": "Not found"}}, status=404)
+
+
+def serve(port=DEFAULT_PORT, delay=0.0, token_delay=0.0):
+    """Start the stub server in a background thread and return it"""
+    StubHandler.state = StubState(delay, token_delay=token_delay)
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, name="stub-openai")
+    thread.daemon = True
+    thread.start()
+    logger.info(f"Stub OpenAI server on http://127.0.0.1:{server.server_port}/v1")
+    return server
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    server = serve(port, delay)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,285 @@
+"""
+Summaries module for YouTube Livestream Transcriber.
+Hierarchical rolling summaries that give the topic prompts a fixed-size view of
+a topic however long it runs.
+
+Chunks are kept verbatim until enough of them pile up; the oldest group is then
+condensed into one summary by a background worker, and groups of summaries are
+condensed again into higher-level summaries. A digest takes the newest verbatim
+chunks, then the newest summaries of each level, until its token budget is full.
+
+Run `python summaries.py` to compare prompt sizes with and without digests over a
+long simulated stream.
+"""
+
+import os
+import queue
+import logging
+import threading
+from dotenv import load_dotenv
+import concurrency
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Items condensed into one summary, per level
+SUMMARY_GROUP_CHUNKS = int(os.getenv("SUMMARY_GROUP_CHUNKS", "6"))
+# Summary levels above the verbatim chunks; the top level is never condensed
+SUMMARY_MAX_LEVELS = int(os.getenv("SUMMARY_MAX_LEVELS", "3"))
+# Digest budgets for the current and the previous topic
+CURRENT_DIGEST_TOKENS = int(os.getenv("CURRENT_DIGEST_TOKENS", "1000"))
+PREVIOUS_DIGEST_TOKENS = int(os.getenv("PREVIOUS_DIGEST_TOKENS", "250"))
+# Items kept per level while condensing falls behind (e.g. the API is down)
+SUMMARY_MAX_PENDING = int(os.getenv("SUMMARY_MAX_PENDING", "60"))
+# Condensing jobs waiting for the worker; further groups wait in their level
+SUMMARY_QUEUE_MAX = int(os.getenv("SUMMARY_QUEUE_MAX", "10"))
+
+SUMMARY_MODEL = "gpt-4o-mini-2024-07-18"
+SUMMARY_MAX_TOKENS = 120
+# Rough size of a token in English text, for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def summarize_text(client, texts, level):
+    """Condense consecutive transcript pieces (or summaries) into one summary"""
+    source = "transcript chunks" if level == 0 else "summaries"
+    prompt = f"""Condense these consecutive {source} from a crypto YouTube livestream into one summary of at most 60 words.
+Keep the crypto assets, numbers, events and opinions that were discussed, in order.
+
+{chr(10).join(texts)}
+
+Return your response in this exact format:
+[Summary: <summary>]"""
+
+    response = client.chat_completion(
+        model=SUMMARY_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": "You summarize livestream transcripts into short, factual context for later analysis.",
+            },
+            {"role": "user", "content": prompt},
+        ],
+        max_tokens=SUMMARY_MAX_TOKENS,
+        timeout=30,
+    )
+    summary = response.choices[0].message.content.strip()
+    if "[Summary:" in summary:
+        summary = summary.split("[Summary:")[1].rsplit("]", 1)[0]
+    return summary.strip()
+
+
+class RollingSummary:
+    """Verbatim chunks and summaries of one topic, oldest condensed first"""
+
+    def __init__(
+        self,
+        summarizer,
+        group_size=SUMMARY_GROUP_CHUNKS,
+        max_levels=SUMMARY_MAX_LEVELS,
+        max_pending=SUMMARY_MAX_PENDING,
+    ):
+        self.summarizer = summarizer
+        self.group_size = group_size
+        self.max_pending = max_pending
+        # levels[0] holds chunks, levels[n] summaries of groups from levels[n - 1];
+        # within and across levels, items run from oldest (top level) to newest
+        self.levels = [[] for _ in range(max_levels + 1)]
+        self.lock = threading.Lock()
+
+    def add(self, timestamp, text):
+        """Add a chunk; may queue the oldest chunks for condensing"""
+        with self.lock:
+            self.levels[0].append({"start": timestamp, "end": timestamp, "text": text})
+            self._drop_backlog(0)
+            group = self._take_group(0)
+        if group:
+            self.summarizer.submit(self, 0, group)
+
+    def _drop_backlog(self, level):
+        """Forget the oldest items of a level beyond max_pending"""
+        del self.levels[level][: -self.max_pending]
+
+    def _take_group(self, level):
+        """Oldest group of a level once the newest group_size items are covered"""
+        if level >= len(self.levels) - 1:
+            return None
+        ready = [item for item in self.levels[level] if not item.get("condensing")]
+        if len(ready) < 2 * self.group_size:
+            return None
+        group = ready[: self.group_size]
+        for item in group:
+            item["condensing"] = True
+        return group
+
+    def complete(self, level, group, text):
+        """Replace a condensed group with its summary one level up"""
+        with self.lock:
+            done = {id(item) for item in group}
+            self.levels[level] = [
+                item for item in self.levels[level] if id(item) not in done
+            ]
+            self.levels[level + 1].append(
+                {"start": group[0]["start"], "end": group[-1]["end"], "text": text}
+            )
+            self._drop_backlog(level + 1)
+            # The top level only needs enough summaries to fill a digest
+            del self.levels[-1][: -2 * self.group_size]
+            next_group = self._take_group(level + 1)
+        if next_group:
+            self.summarizer.submit(self, level + 1, next_group)
+
+    def release(self, level, group):
+        """Make a group available again after condensing it failed"""
+        with self.lock:
+            for item in group:
+                item.pop("condensing", None)
+
+    def digest(self, max_tokens, verbatim_share=0.5):
+        """Recent chunks verbatim plus the newest summaries, within max_tokens
+
+        Up to verbatim_share of the budget goes to the newest chunks, and the
+        rest to summaries of what came before them, finest level first.
+        """
+        budget = max_tokens * CHARS_PER_TOKEN
+        with self.lock:
+            summary_levels = self.levels[1:]
+            if any(summary_levels):
+                verbatim_budget = int(budget * verbatim_share)
+            else:
+                verbatim_budget = budget
+            recent = _take_newest(
+                [item["text"] for item in self.levels[0]], verbatim_budget
+            )
+            earlier = _take_newest(
+                [
+                    f"[Summary {item['start']}-{item['end']}] {item['text']}"
+                    for items in reversed(summary_levels)
+                    for item in items
+                ],
+                budget - sum(len(piece) + 1 for piece in recent),
+            )
+        return " ".join(earlier + recent)
+
+
+def _take_newest(pieces, budget):
+    """Newest consecutive pieces that fit in budget characters, oldest first
+
+    The newest piece is cut from the start when even it does not fit.
+    """
+    taken = []
+    used = 0
+    for piece in reversed(pieces):
+        if used + len(piece) + 1 > budget:
+            if not taken and budget > 0:
+                taken.append(piece[-budget:])  # Keep the newest words
+            break
+        taken.append(piece)
+        used += len(piece) + 1
+    return taken[::-1]
+
+
+class Summarizer:
+    """Background worker that condenses rolling summary groups"""
+
+    def __init__(self, client):
+        self.client = client
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.condensed = 0
+
+    def start(self):
+        self.thread = concurrency.start_worker(self.worker, name="summarizer")
+
+    def stop(self):
+        self.jobs.put(concurrency.STOP)
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def submit(self, rolling_summary, level, group):
+        if SUMMARY_QUEUE_MAX and self.jobs.qsize() >= SUMMARY_QUEUE_MAX:
+            # Picked up again by a later add once the worker catches up
+            rolling_summary.release(level, group)
+            return
+        self.jobs.put((rolling_summary, level, group))
+
+    def worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is concurrency.STOP:
+                break
+            rolling_summary, level, group = job
+            try:
+                text = concurrency.run_blocking(
+                    summarize_text,
+                    self.client,
+                    [item["text"] for item in group],
+                    level,
+                )
+                rolling_summary.complete(level, group, text)
+                self.condensed += 1
+            except Exception as e:
+                logger.warning(f"Summarizing level {level} group failed: {str(e)}")
+                rolling_summary.release(level, group)
+            finally:
+                self.jobs.task_done()
+
+
+def _simulate(chunks=1080, words_per_chunk=50):
+    """Prompt context size over a 6-hour topic, truncation vs digest"""
+    import stub_openai
+
+    class _StubClient:
+        def chat_completion(self, messages, **kwargs):
+            class _Message:
+                content = stub_openai.stub_reply(messages)
+
+            class _Choice:
+                message = _Message()
+
+            class _Response:
+                choices = [_Choice()]
+
+            return _Response()
+
+    summarizer = Summarizer(_StubClient())
+    summarizer.start()
+    rolling_summary = RollingSummary(summarizer)
+    current_transcription = []
+
+    for index in range(chunks):
+        seconds = index * 20
+        timestamp = f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+        text = " ".join(f"word{index}_{word}" for word in range(words_per_chunk))
+        rolling_summary.add(timestamp, text)
+        summarizer.jobs.join()  # A live stream leaves 20 s per chunk to condense
+
+        # The old context: every chunk of the topic, capped at the last 51
+        current_transcription.append(text)
+        if len(current_transcription) > 100:
+            current_transcription = (
+                current_transcription[:1] + current_transcription[-50:]
+            )
+
+        if (index + 1) in (10, 100, 360, chunks):
+            old_chars = len(" ".join(current_transcription))
+            new_chars = len(rolling_summary.digest(CURRENT_DIGEST_TOKENS))
+            print(
+                f"after {index + 1:4d} chunks: full text {old_chars:6d} chars, digest {new_chars:5d} chars"
+            )
+
+    summarizer.stop()
+    summarizer.join()
+    print(
+        f"  {summarizer.condensed} summaries, items per level: {[len(items) for items in rolling_summary.levels]}"
+    )
+
+
+if __name__ == "__main__":
+    _simulate()
@@ -2,137 +2,294 @@
 Topic detection module for YouTube Livestream Transcriber.
 Analyzes transcription chunks to detect topic changes using OpenAI's GPT-4o mini.
 Runs in parallel with the main transcription process.
+
+While a stream is over its cost budget (see accounting.py), topics can instead
+be detected locally from keyword overlap and transition phrases, or analyzed on
+fewer chunks.
 """
 
-import os
+import re
 import logging
 import threading
-import queue
-import openai
+import collections
 from dotenv import load_dotenv
+import concurrency
+import overload
+import disk_cache
+import llm_stream
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load environment variables and set up OpenAI API key
+# Load environment variables
 load_dotenv()
-# First check if a temporary API key is set, otherwise use the one from .env
-openai.api_key = os.environ.get("TEMP_OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
-
-# Global variables
-topic_queue = queue.Queue()
-current_topic = None
-stop_detection_flag = False
-detection_thread = None
-
-
-def start_topic_detection(socketio):
-    """Start the topic detection thread"""
-    global detection_thread, stop_detection_flag
-
-    stop_detection_flag = False
-    detection_thread = threading.Thread(target=topic_detection_worker, args=(socketio,))
-    detection_thread.daemon = True
-    detection_thread.start()
-    logger.info("Topic detection thread started")
-
-
-def stop_topic_detection():
-    """Stop the topic detection thread"""
-    global stop_detection_flag
-
-    stop_detection_flag = True
-    logger.info("Topic detection thread stopping")
-
-
-def add_transcription_for_analysis(timestamp, text):
-    """Add a transcription chunk to the analysis queue"""
-    global topic_queue
 
-    topic_queue.put({"timestamp": timestamp, "text": text})
-    logger.info(f"Added transcription to topic detection queue at {timestamp}")
-
-
-def topic_detection_worker(socketio):
-    """Worker thread that processes transcriptions and detects topic changes"""
-    global topic_queue, current_topic, stop_detection_flag
-
-    while not stop_detection_flag:
-        try:
-            # Get transcription from queue with timeout to allow checking stop flag
-            try:
-                transcription = topic_queue.get(timeout=1.0)
-            except queue.Empty:
-                continue
-
-            timestamp = transcription["timestamp"]
-            text = transcription["text"]
+# Model used for fine-grained topic detection
+TOPIC_MODEL = "gpt-4o-mini-2024-07-18"
+
+# Local detection: chunks of the current topic its keywords come from, and the
+# share of a chunk's keywords that must be among them to stay on the topic
+LOCAL_TOPIC_WINDOW_CHUNKS = 6
+LOCAL_TOPIC_MIN_OVERLAP = 0.15
+LOCAL_TOPIC_TITLE_WORDS = 3
+
+# Phrases hosts use to announce a new topic
+TRANSITION_PHRASES = (
+    "moving on",
+    "next topic",
+    "let's talk about",
+    "switching gears",
+    "let's look at",
+    "on to the next",
+)
+
+_WORD_PATTERN = re.compile(r"[a-z][a-z']{3,}")
+_STOP_WORDS = frozenset(
+    """about after again also because been before being could does doing down
+    from going gonna have here into just know like look looking make more much
+    only other over really right some still that thats their them then there
+    these they thing things think this those through very want were what when
+    where which while will with would yeah your""".split()
+)
+
+
+class TopicDetector:
+    """Fine-grained topic detection worker for one pipeline"""
+
+    def __init__(self, socketio, client):
+        self.socketio = socketio
+        self.client = client  # Per-key OpenAI client for this session
+        self.topic_queue = concurrency.DropOldestQueue(overload.DETECTOR_QUEUE_MAX)
+        self.current_topic = None
+        self.detection_thread = None
+        self.stopped = threading.Event()
+        self.keywords = KeywordTopics()  # Local fallback, kept up to date
+        self.budget = None  # accounting.BudgetController, set by the pipeline
+        self.chunks_seen = 0
+
+    def start(self):
+        """Start the topic detection thread"""
+        self.stopped.clear()
+        self.detection_thread = concurrency.start_worker(
+            self.topic_detection_worker, name="topic-detection"
+        )
+        logger.info("Topic detection thread started")
+
+    def stop(self):
+        """Stop the topic detection thread"""
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        # Wake the worker if it is waiting for a transcription
+        self.topic_queue.put(concurrency.STOP)
+        logger.info("Topic detection thread stopping")
+
+    def join(self, timeout=None):
+        """Wait for the worker to exit"""
+        if self.detection_thread is not None:
+            self.detection_thread.join(timeout)
+
+    def add_transcription_for_analysis(
+        self, timestamp, text, fingerprint=None, entity_hints=""
+    ):
+        """Add a transcription chunk to the analysis queue"""
+        self.topic_queue.put(
+            {
+                "timestamp": timestamp,
+                "text": text,
+                "fingerprint": fingerprint,
+                "entity_hints": entity_hints,
+            }
+        )
+        logger.info(f"Added transcription to topic detection queue at {timestamp}")
 
-            # Log analysis start
-            log_message = f"Analyzing transcription for topic change at {timestamp}"
-            logger.info(log_message)
-            socketio.emit("debug_log", {"message": log_message})
+    def topic_detection_worker(self):
+        """Worker thread that processes transcriptions and detects topic changes"""
+        socketio = self.socketio
 
-            # Detect if there's a topic change
+        while True:
             try:
-                new_topic, is_topic_change = detect_topic_change(text, current_topic)
-
-                if is_topic_change:
-                    # Log topic change
-                    log_message = f"Topic change detected: {new_topic} at {timestamp}"
-                    logger.info(log_message)
-                    socketio.emit(
-                        "debug_log", {"message": log_message, "type": "success"}
+                # Block until a transcription arrives or stop() wakes us up
+                transcription = self.topic_queue.get()
+                if transcription is concurrency.STOP or self.stopped.is_set():
+                    break
+
+                timestamp = transcription["timestamp"]
+                text = transcription["text"]
+
+                # Log analysis start
+                log_message = f"Analyzing transcription for topic change at {timestamp}"
+                logger.info(log_message)
+                socketio.emit("debug_log", {"message": log_message})
+
+                # Detect if there's a topic change
+                try:
+                    new_topic, is_topic_change = self.detect_with_cache(
+                        text,
+                        transcription.get("fingerprint"),
+                        transcription.get("entity_hints", ""),
                     )
+                    if self.stopped.is_set():
+                        break
 
-                    # Update current topic
-                    current_topic = new_topic
+                    if is_topic_change:
+                        # Log topic change
+                        log_message = (
+                            f"Topic change detected: {new_topic} at {timestamp}"
+                        )
+                        logger.info(log_message)
+                        socketio.emit(
+                            "debug_log", {"message": log_message, "type": "success"}
+                        )
 
-                    # Send topic change to frontend
-                    socketio.emit(
-                        "topic_change", {"timestamp": timestamp, "topic": new_topic}
-                    )
-                else:
-                    # Log no topic change
-                    log_message = "No topic change detected"
-                    logger.info(log_message)
-                    socketio.emit("debug_log", {"message": log_message})
-
-                    # If this is the first transcription, set it as the current topic
-                    if current_topic is None:
-                        current_topic = new_topic
+                        # Update current topic
+                        self.current_topic = new_topic
+
+                        # Send topic change to frontend
                         socketio.emit(
                             "topic_change", {"timestamp": timestamp, "topic": new_topic}
                         )
+                    else:
+                        # Log no topic change
+                        log_message = "No topic change detected"
+                        logger.info(log_message)
+                        socketio.emit("debug_log", {"message": log_message})
+
+                        # If this is the first transcription, set it as the current topic
+                        if self.current_topic is None:
+                            self.current_topic = new_topic
+                            socketio.emit(
+                                "topic_change",
+                                {"timestamp": timestamp, "topic": new_topic},
+                            )
+
+                except Exception as e:
+                    error_message = f"LLM analysis failed: {str(e)}"
+                    logger.error(error_message)
+                    socketio.emit(
+                        "debug_log", {"message": error_message, "type": "error"}
+                    )
 
             except Exception as e:
-                error_message = f"LLM analysis failed: {str(e)}"
+                error_message = f"Error in topic detection worker: {str(e)}"
                 logger.error(error_message)
                 socketio.emit("debug_log", {"message": error_message, "type": "error"})
 
-        except Exception as e:
-            error_message = f"Error in topic detection worker: {str(e)}"
-            logger.error(error_message)
-            socketio.emit("debug_log", {"message": error_message, "type": "error"})
+        logger.info("Topic detection thread stopped")
 
+    def detect_with_cache(self, text, fingerprint, entity_hints=""):
+        """Detect a topic change, reusing the result for previously seen audio"""
+        cache = disk_cache.get_result_cache() if fingerprint else None
+        cache_key = disk_cache.make_key(
+            "topic", TOPIC_MODEL, self.current_topic, fingerprint
+        )
+        if cache:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                logger.info("Topic detection cache hit")
+                return cached["topic"], cached["is_topic_change"]
+
+        # Over budget: detect locally, or keep the topic between analyzed chunks
+        self.chunks_seen += 1
+        if self.budget is not None and self.current_topic is not None:
+            if self.budget.is_active("local_topics"):
+                return self.keywords.detect(text, self.current_topic)
+            if self.chunks_seen % self.budget.cadence():
+                self.keywords.observe(text, False)
+                return self.current_topic, False
+
+        new_topic, is_topic_change = concurrency.run_blocking(
+            detect_topic_change,
+            self.client,
+            text,
+            self.current_topic,
+            entity_hints,
+        )
+        self.keywords.observe(text, is_topic_change)
 
-def detect_topic_change(current_text, previous_topic):
+        if cache:
+            cache.set(
+                cache_key, {"topic": new_topic, "is_topic_change": is_topic_change}
+            )
+        return new_topic, is_topic_change
+
+
+def keywords(text):
+    """Content words of a transcript, lowercased"""
+    return [
+        word for word in _WORD_PATTERN.findall(text.lower()) if word not in _STOP_WORDS
+    ]
+
+
+class KeywordTopics:
+    """Topic change detection from keyword overlap, without LLM calls"""
+
+    def __init__(self):
+        self.recent = collections.deque(maxlen=LOCAL_TOPIC_WINDOW_CHUNKS)
+
+    def observe(self, text, is_topic_change):
+        """Track the keywords of a chunk whose topic was decided elsewhere"""
+        if is_topic_change:
+            self.recent.clear()
+        self.recent.append(set(keywords(text)))
+
+    def detect(self, text, current_topic):
+        """Return (topic, is_topic_change) for a chunk"""
+        words = keywords(text)
+        lowered = text.lower()
+        transitions = [
+            lowered.index(phrase) + len(phrase)
+            for phrase in TRANSITION_PHRASES
+            if phrase in lowered
+        ]
+        if current_topic is None or transitions:
+            is_topic_change = True
+        elif words and len(self.recent) == self.recent.maxlen:
+            topic_words = set().union(*self.recent)
+            overlap = sum(word in topic_words for word in set(words)) / len(set(words))
+            is_topic_change = overlap < LOCAL_TOPIC_MIN_OVERLAP
+        else:
+            is_topic_change = False
+
+        self.observe(text, is_topic_change)
+        # Title from the most frequent keywords, after an announced transition
+        if transitions:
+            words = keywords(text[min(transitions) :]) or words
+        if not is_topic_change or not words:
+            return current_topic, False
+        top = collections.Counter(words).most_common(LOCAL_TOPIC_TITLE_WORDS)
+        top = {word for word, _ in top}
+        title = []
+        for word in words:
+            if word in top and word not in title:
+                title.append(word)
+        return " ".join(word.capitalize() for word in title), True
+
+
+def detect_topic_change(client, current_text, previous_topic, entity_hints=""):
     """Use GPT-4o mini to detect topic changes"""
 
+    # Tagged entities, e.g. "Entities mentioned: BTC x2, FOMC x1"
+    hints_info = ""
+    if entity_hints:
+        hints_info = f"\nEntities mentioned: {entity_hints}"
+
     # Prepare the prompt for the LLM
     if previous_topic is None:
         # First transcript - determine the initial topic
         prompt = f"""Analyze this transcript from a crypto YouTube livestream and determine the main topic. 
         
-Transcript: "{current_text}"
+Transcript: "{current_text}"{hints_info}
 
 Return your response in this exact format - just the topic name, no explanations:
 [Topic: <brief topic name>]"""
 
-        # Call OpenAI API
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini-2024-07-18",
+        # Call OpenAI API, returning as soon as the title closes
+        fields, topic_text = llm_stream.stream_fields(
+            client,
+            ("Topic",),
+            model=TOPIC_MODEL,
             messages=[
                 {
                     "role": "system",
@@ -168,13 +325,8 @@ Example titles:
             max_tokens=50,
         )
 
-        topic_text = response.choices[0].message.content.strip()
-
         # Extract topic from response format [Topic: <topic>]
-        if "[Topic:" in topic_text and "]" in topic_text:
-            topic = topic_text.split("[Topic:")[1].split("]")[0].strip()
-        else:
-            topic = topic_text
+        topic = fields.get("Topic") or topic_text
 
         return topic, True  # First topic is always a "change"
 
@@ -184,16 +336,19 @@ Example titles:
 
 Previous topic: "{previous_topic}"
 
-Current transcript: "{current_text}"
+Current transcript: "{current_text}"{hints_info}
 
 Note that there may be some overlap between transcripts due to how they're processed.
 Return your response in this exact format:
 [Topic Change: Yes/No]
 [New Topic: <brief topic name>]"""
 
-        # Call OpenAI API
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini-2024-07-18",
+        # Call OpenAI API, stopping right away when the answer is "No"
+        fields, _ = llm_stream.stream_fields(
+            client,
+            ("Topic Change", "New Topic"),
+            lambda name, value: name == "Topic Change" and llm_stream.is_no(value),
+            model=TOPIC_MODEL,
             messages=[
                 {
                     "role": "system",
@@ -231,14 +386,8 @@ Example titles:
             max_tokens=100,
         )
 
-        result_text = response.choices[0].message.content.strip()
-
         # Parse the response
-        is_topic_change = "Yes" in result_text.split("[Topic Change:")[1].split("]")[0]
-
-        if "[New Topic:" in result_text and "]" in result_text.split("[New Topic:")[1]:
-            new_topic = result_text.split("[New Topic:")[1].split("]")[0].strip()
-        else:
-            new_topic = previous_topic
+        is_topic_change = "Yes" in fields.get("Topic Change", "")
+        new_topic = fields.get("New Topic") or previous_topic
 
         return new_topic, is_topic_change
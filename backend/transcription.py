@@ -4,31 +4,107 @@ Handles extracting audio from YouTube livestreams and transcribing it using Open
 """
 
 import os
+import re
+import time
+import threading
 import tempfile
 import subprocess
 import datetime
+import hashlib
 import logging
 import yt_dlp
-import openai
-import multiprocessing
 from dotenv import load_dotenv
+import disk_cache
+import whisper_backends
+from segments import SegmentTable
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load environment variables and set up OpenAI API key
+# Load environment variables
 load_dotenv()
-# First check if a temporary API key is set, otherwise use the one from .env
-openai.api_key = os.environ.get("TEMP_OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
-logger.info(
-    "Using OpenAI API key from: "
-    + ("Frontend" if "TEMP_OPENAI_API_KEY" in os.environ else ".env file")
-)
+
+
+# Stream URLs resolved ahead of ingest by the channel watcher, used once
+PREWARM_TTL_SECONDS = 300
+_prewarmed = {}
+_prewarmed_lock = threading.Lock()
+
+
+def _evict_prewarmed(now):
+    """Forget pre-warmed URLs no ingest picked up in time (caller holds the lock)"""
+    expired = [
+        youtube_url
+        for youtube_url, (resolved_at, _, _) in _prewarmed.items()
+        if now - resolved_at >= PREWARM_TTL_SECONDS
+    ]
+    for youtube_url in expired:
+        del _prewarmed[youtube_url]
+
+
+def prewarm_stream_url(youtube_url, audio_url, stream_info):
+    """Remember an already resolved audio URL so the next ingest can skip yt-dlp"""
+    now = time.monotonic()
+    with _prewarmed_lock:
+        _evict_prewarmed(now)
+        _prewarmed[youtube_url] = (now, audio_url, stream_info)
+
+
+def stream_from_info(info):
+    """Pick the audio URL and build the stream info from a yt-dlp info dict"""
+    # Get stream info
+    title = info.get("title", "Unknown Stream")
+    channel = info.get("uploader", "Unknown Channel")
+    viewers = info.get("view_count", 0)
+
+    # Prepare stream info to return
+    stream_info = {
+        "title": title,
+        "channel": channel,
+        "viewers": str(viewers),
+        # Unix time the live broadcast began, so offsets match its VOD
+        "started_at": info.get("release_timestamp") if info.get("is_live") else None,
+    }
+
+    # Get the audio URL
+    for format in info["formats"]:
+        if format.get("acodec") != "none" and format.get("vcodec") == "none":
+            logger.info("Successfully extracted audio stream URL")
+            return format["url"], stream_info
+
+    # If no audio-only format is found, use the best available format
+    logger.warning("No audio-only format found, using best available format")
+    return info["formats"][0]["url"], stream_info
+
+
+def resolve_video(youtube_url):
+    """(video ID, audio URL, stream info) of the video a URL points to, or None
+
+    A channel's /live page resolves to the broadcast currently live on it.
+    """
+    ydl_opts = {
+        "format": "bestaudio/best",
+        "quiet": True,
+        "no_warnings": True,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(youtube_url, download=False)
+    if not info or info.get("_type", "video") != "video":
+        return None  # A channel page or playlist, not a single video
+    audio_url, stream_info = stream_from_info(info)
+    return info["id"], audio_url, stream_info
 
 
 def get_audio_stream_url(youtube_url):
     """Extract the direct audio stream URL from a YouTube livestream URL using yt-dlp"""
+    with _prewarmed_lock:
+        _evict_prewarmed(time.monotonic())
+        prewarmed = _prewarmed.pop(youtube_url, None)
+    if prewarmed:
+        logger.info(f"Using pre-warmed audio stream URL for: {youtube_url}")
+        return prewarmed[1], prewarmed[2]
+
     try:
         logger.info(f"Extracting audio stream URL from: {youtube_url}")
 
@@ -40,39 +116,51 @@ def get_audio_stream_url(youtube_url):
 
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(youtube_url, download=False)
+            return stream_from_info(info)
+
+    except Exception as e:
+        logger.error(f"Failed to extract audio stream URL: {str(e)}")
+        raise
 
-            # Get stream info
-            title = info.get("title", "Unknown Stream")
-            channel = info.get("uploader", "Unknown Channel")
-            viewers = info.get("view_count", 0)
 
-            # Prepare stream info to return
-            stream_info = {
-                "title": title,
-                "channel": channel,
-                "viewers": str(viewers),
-            }
+# Input start PTS and progress time as printed in ffmpeg's log
+_FFMPEG_START_PATTERN = re.compile(r"Duration: [^,]+, start: (-?\d+(?:\.\d+)?)")
+_FFMPEG_TIME_PATTERN = re.compile(r"time=(\d+):(\d+):(\d+(?:\.\d+)?)")
 
-            # Get the audio URL
-            for format in info["formats"]:
-                if format.get("acodec") != "none" and format.get("vcodec") == "none":
-                    logger.info("Successfully extracted audio stream URL")
-                    return format["url"], stream_info
 
-            # If no audio-only format is found, use the best available format
-            logger.warning("No audio-only format found, using best available format")
-            return info["formats"][0]["url"], stream_info
+def parse_ffmpeg_timing(log):
+    """Return (input start PTS, extracted duration) in seconds from an ffmpeg log
+
+    Either value is None when ffmpeg did not report it.
+    """
+    start_match = _FFMPEG_START_PATTERN.search(log)
+    time_matches = _FFMPEG_TIME_PATTERN.findall(log)
+
+    input_start = float(start_match.group(1)) if start_match else None
+    duration = None
+    if time_matches:
+        hours, minutes, seconds = time_matches[-1]
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    return input_start, duration
 
-    except Exception as e:
-        logger.error(f"Failed to extract audio stream URL: {str(e)}")
-        raise
 
+def extract_audio_chunk(
+    audio_url, chunk_duration=15, start_time=0, register_process=None, temp_dir=None
+):
+    """Extract a chunk of audio from the livestream using ffmpeg
 
-def extract_audio_chunk(audio_url, chunk_duration=15, start_time=0):
-    """Extract a chunk of audio from the livestream using ffmpeg"""
+    Returns the audio file path and (start PTS, extracted duration) of the chunk,
+    taken from ffmpeg's log; the PTS is the input's start PTS plus the seek offset.
+    register_process, if given, receives the ffmpeg process so a stopping
+    pipeline can terminate it instead of waiting for the chunk to finish.
+    The chunk is written to temp_dir, or the system temp directory.
+    """
+    temp_filename = None
     try:
         # Create a temporary file for the audio chunk
-        temp_file = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False)
+        temp_file = tempfile.NamedTemporaryFile(
+            suffix=".mp3", delete=False, dir=temp_dir
+        )
         temp_filename = temp_file.name
         temp_file.close()
 
@@ -102,66 +190,116 @@ def extract_audio_chunk(audio_url, chunk_duration=15, start_time=0):
         process = subprocess.Popen(
             ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
-        stdout, stderr = process.communicate()
+        if register_process:
+            register_process(process)
+        try:
+            stdout, stderr = process.communicate()
+        finally:
+            if register_process:
+                register_process(None)
 
         if process.returncode != 0:
             error_message = f"ffmpeg error: {stderr.decode()}"
             logger.error(error_message)
             raise Exception(error_message)
 
-        return temp_filename
+        input_start, duration = parse_ffmpeg_timing(
+            stderr.decode("utf-8", errors="replace")
+        )
+        chunk_pts = None if input_start is None else input_start + start_time
+        return temp_filename, (chunk_pts, duration)
 
     except Exception as e:
         logger.error(f"Failed to extract audio chunk: {str(e)}")
+        # Don't leave the partial chunk behind
+        if temp_filename and os.path.exists(temp_filename):
+            os.remove(temp_filename)
         raise
 
 
-def _run_transcription(audio_file_path, result_queue):
-    """Run transcription in a separate process to avoid gevent conflicts"""
-    try:
-        with open(audio_file_path, "rb") as audio_file:
-            transcript = openai.Audio.transcribe(model="whisper-1", file=audio_file)
-            result_queue.put({"text": transcript["text"]})
-    except Exception as e:
-        result_queue.put({"error": str(e)})
+def fingerprint_audio(audio_file_path):
+    """Hash the decoded PCM of an audio file, independent of container and encoder"""
+    ffmpeg_cmd = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-i",
+        audio_file_path,
+        "-f",
+        "s16le",  # Raw 16-bit PCM
+        "-ar",
+        "16000",
+        "-ac",
+        "1",
+        "-",
+    ]
 
+    try:
+        process = subprocess.Popen(
+            ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        digest = hashlib.sha256()
+        for block in iter(lambda: process.stdout.read(65536), b""):
+            digest.update(block)
+        process.stdout.close()
+        if process.wait() != 0:
+            raise Exception(f"ffmpeg exited with code {process.returncode}")
+        return digest.hexdigest()
 
-def transcribe_audio_chunk(audio_file_path):
-    """Transcribe an audio chunk using OpenAI's Whisper API"""
+    except Exception as e:
+        # Without a fingerprint the chunk is simply not cached
+        logger.warning(f"Failed to fingerprint audio chunk: {str(e)}")
+        return None
+
+
+def transcribe_audio_chunk(
+    audio_file_path,
+    client,
+    fingerprint=None,
+    delete_file=True,
+    verbose=False,
+    backend=None,
+):
+    """Transcribe an audio chunk with the configured Whisper backend
+
+    Returns the text, or a SegmentTable with segment timing when verbose is set.
+    A backend can be given to override the configured one for this chunk.
+    When the chunk's audio fingerprint is given, a cached transcript for the same
+    audio and model is returned instead of transcribing it again. With
+    delete_file=False the caller keeps the audio, e.g. to retry it later.
+    """
     try:
         logger.info("Transcribing chunk...")
+        backend = backend or whisper_backends.get_backend()
 
-        # Use multiprocessing to isolate from gevent patching
-        ctx = multiprocessing.get_context("spawn")
-        result_queue = ctx.Queue()
-
-        # Run transcription in a separate process
-        process = ctx.Process(
-            target=_run_transcription, args=(audio_file_path, result_queue)
+        cache = disk_cache.get_result_cache() if fingerprint else None
+        cache_key = disk_cache.make_key(
+            "whisper-verbose" if verbose else "whisper", backend.model_id, fingerprint
         )
-
-        process.start()
-        process.join(timeout=30)  # Set a timeout for the process
-
-        if process.is_alive():
-            process.terminate()
-            process.join()
-            raise Exception("Transcription process timed out")
-
-        if not result_queue.empty():
-            result = result_queue.get()
-            if "error" in result:
-                raise Exception(result["error"])
-            return result["text"]
-        else:
-            raise Exception("Transcription process failed with no result")
+        if cache:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                logger.info("Transcript cache hit")
+                if verbose:
+                    return SegmentTable.from_json(cached["segments"])
+                return cached["text"]
+
+        # Backends offload blocking work so other workers keep running
+        result = backend.transcribe(client, audio_file_path, verbose=verbose)
+
+        if cache:
+            if verbose:
+                cache.set(cache_key, {"segments": result.to_json()})
+            else:
+                cache.set(cache_key, {"text": result})
+        return result
 
     except Exception as e:
         logger.error(f"Failed to transcribe audio: {str(e)}")
         raise
     finally:
         # Clean up the temporary file
-        if os.path.exists(audio_file_path):
+        if delete_file and os.path.exists(audio_file_path):
             os.remove(audio_file_path)
 
 
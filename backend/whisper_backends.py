@@ -0,0 +1,429 @@
+"""
+Whisper backends module for YouTube Livestream Transcriber.
+Speech-to-text engines behind one interface, selected with WHISPER_BACKEND:
+
+- "openai" (default): the hosted Whisper API, through the session's pooled client.
+- "faster-whisper": in-process CTranslate2 inference on CPU (int8 by default).
+- "whisper-cpp": in-process whisper.cpp inference through pywhispercpp.
+
+Local engines are loaded once per process and shared by every pipeline in it.
+Streams over their cost budget switch to an installed local engine even when
+the hosted API is selected (see accounting.py).
+Chunks submitted while the engine is busy are queued and run as one batch, so a
+worker serving several streams (or catching up on one) keeps every core busy.
+
+Run `python whisper_backends.py <audio-file> [repeats] [reference.txt]` to compare
+the throughput of the local engines with the hosted API, and their word error
+rate when a reference transcript is given.
+"""
+
+import os
+import sys
+import time
+import queue
+import logging
+import threading
+import subprocess
+import importlib.util
+from dotenv import load_dotenv
+import concurrency
+from segments import SegmentTable
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Engine selection and tuning
+WHISPER_BACKEND = os.getenv("WHISPER_BACKEND", "openai").lower()
+WHISPER_LOCAL_MODEL = os.getenv("WHISPER_LOCAL_MODEL", "small")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", "0")) or os.cpu_count() or 1
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "4"))
+WHISPER_BATCH_WINDOW = float(os.getenv("WHISPER_BATCH_WINDOW_MS", "50")) / 1000
+
+# Hosted model, also the cache namespace of hosted transcripts
+HOSTED_MODEL = "whisper-1"
+
+
+class HostedWhisperBackend:
+    """OpenAI's hosted Whisper API"""
+
+    name = "openai"
+    model_id = HOSTED_MODEL
+
+    def _transcribe(self, client, audio_file_path, verbose):
+        """Call the Whisper API for one audio file (blocking)"""
+        with open(audio_file_path, "rb") as audio_file:
+            if verbose:
+                transcript = client.transcribe(
+                    model=HOSTED_MODEL,
+                    file=audio_file,
+                    response_format="verbose_json",
+                    request_timeout=30,
+                )
+                return SegmentTable.from_segments(transcript["segments"])
+            transcript = client.transcribe(
+                model=HOSTED_MODEL, file=audio_file, request_timeout=30
+            )
+            return transcript["text"]
+
+    def transcribe(self, client, audio_file_path, verbose=False):
+        """Transcribe one file without blocking other workers
+
+        Returns the text, or a SegmentTable when verbose is set.
+        """
+        return concurrency.run_blocking(
+            self._transcribe, client, audio_file_path, verbose
+        )
+
+
+class _Request:
+    """One chunk waiting for a local engine batch"""
+
+    def __init__(self, audio_file_path):
+        self.audio_file_path = audio_file_path
+        self.done = threading.Event()
+        self.segments = None
+        self.error = None
+
+
+class LocalWhisperBackend:
+    """Base for in-process engines: lazy one-time load plus request batching"""
+
+    name = "local"
+
+    def __init__(
+        self,
+        model=WHISPER_LOCAL_MODEL,
+        threads=WHISPER_THREADS,
+        batch_size=WHISPER_BATCH_SIZE,
+    ):
+        self.model_name = model
+        self.threads = threads
+        self.batch_size = max(1, batch_size)
+        self.model = None
+        self.load_lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.batcher = None
+        self.batches = 0
+        self.batched_chunks = 0
+
+    @property
+    def model_id(self):
+        return f"{self.name}:{self.model_name}"
+
+    def _load_model(self):
+        """Load the engine's model (blocking)"""
+        raise NotImplementedError
+
+    def _transcribe_batch(self, audio_file_paths):
+        """Transcribe several files, returning a SegmentTable or exception per file"""
+        raise NotImplementedError
+
+    def load(self):
+        """Load the model once and start the batcher"""
+        with self.load_lock:
+            if self.model is None:
+                started = time.time()
+                self.model = concurrency.run_blocking(self._load_model)
+                logger.info(
+                    f"Loaded {self.model_id} with {self.threads} threads in {time.time() - started:.1f}s"
+                )
+                self.batcher = concurrency.start_worker(
+                    self._batch_worker, name=f"{self.name}-batcher"
+                )
+
+    def _batch_worker(self):
+        """Group queued chunks into batches for the engine"""
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + WHISPER_BATCH_WINDOW
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(
+                        self.requests.get(timeout=max(0.0, deadline - time.monotonic()))
+                    )
+                except queue.Empty:
+                    break
+
+            try:
+                results = self._transcribe_batch(
+                    [request.audio_file_path for request in batch]
+                )
+            except Exception as e:
+                results = [e] * len(batch)
+
+            self.batches += 1
+            self.batched_chunks += len(batch)
+            for request, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    request.error = result
+                else:
+                    request.segments = result
+                request.done.set()
+
+    def transcribe(self, client, audio_file_path, verbose=False):
+        """Queue one file for the next batch and wait for its text or segments"""
+        self.load()
+        request = _Request(audio_file_path)
+        self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.segments if verbose else request.segments.text()
+
+
+class FasterWhisperBackend(LocalWhisperBackend):
+    """CTranslate2 Whisper on CPU, int8-quantized by default"""
+
+    name = "faster-whisper"
+
+    def __init__(self, compute_type=WHISPER_COMPUTE_TYPE, **kwargs):
+        super().__init__(**kwargs)
+        self.compute_type = compute_type
+
+    @property
+    def model_id(self):
+        return f"{self.name}:{self.model_name}:{self.compute_type}"
+
+    def _load_model(self):
+        from faster_whisper import WhisperModel
+
+        # One CTranslate2 replica per batch slot, sharing the CPU threads
+        return WhisperModel(
+            self.model_name,
+            device="cpu",
+            compute_type=self.compute_type,
+            cpu_threads=max(1, self.threads // self.batch_size),
+            num_workers=self.batch_size,
+        )
+
+    def _transcribe_one(self, audio_file_path):
+        """Transcribe one file (blocking)"""
+        try:
+            segments, _ = self.model.transcribe(
+                audio_file_path, beam_size=1, vad_filter=True
+            )
+            table = SegmentTable()
+            for segment in segments:
+                table.append(
+                    segment.start, segment.end, segment.no_speech_prob, segment.text
+                )
+            return table
+        except Exception as e:
+            return e
+
+    def _transcribe_batch(self, audio_file_paths):
+        # Files in a batch run concurrently on the model's worker replicas
+        return concurrency.map_blocking(
+            self._transcribe_one, audio_file_paths, self.batch_size
+        )
+
+
+class WhisperCppBackend(LocalWhisperBackend):
+    """whisper.cpp through the pywhispercpp bindings"""
+
+    name = "whisper-cpp"
+
+    def _load_model(self):
+        from pywhispercpp.model import Model
+
+        return Model(self.model_name, n_threads=self.threads, print_progress=False)
+
+    def _transcribe_sequential(self, audio_file_paths):
+        """Transcribe files one after another (blocking)"""
+        results = []
+        for audio_file_path in audio_file_paths:
+            try:
+                table = SegmentTable()
+                for segment in self.model.transcribe(audio_file_path):
+                    # whisper.cpp times are in centiseconds, without no-speech scores
+                    table.append(segment.t0 / 100, segment.t1 / 100, 0.0, segment.text)
+                results.append(table)
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _transcribe_batch(self, audio_file_paths):
+        # whisper.cpp parallelizes within a file, so the batch runs back to back
+        return concurrency.run_blocking(self._transcribe_sequential, audio_file_paths)
+
+
+BACKENDS = {
+    "openai": HostedWhisperBackend,
+    "faster-whisper": FasterWhisperBackend,
+    "whisper-cpp": WhisperCppBackend,
+}
+
+# Local engines with the module each needs, in order of preference
+LOCAL_ENGINES = (("faster-whisper", "faster_whisper"), ("whisper-cpp", "pywhispercpp"))
+
+# Engine shared by every pipeline in this process
+_backend = None
+_local_backend = None  # Fallback engine when the hosted API is selected
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the process-wide transcription backend"""
+    global _backend
+
+    with _backend_lock:
+        if _backend is None:
+            if WHISPER_BACKEND not in BACKENDS:
+                raise ValueError(
+                    f"Unknown WHISPER_BACKEND '{WHISPER_BACKEND}', expected one of {', '.join(BACKENDS)}"
+                )
+            _backend = BACKENDS[WHISPER_BACKEND]()
+            logger.info(f"Using {_backend.name} transcription backend")
+        return _backend
+
+
+def local_backend_name():
+    """Name of the local engine streams can fall back to, or None if none is installed"""
+    if WHISPER_BACKEND != "openai":
+        return WHISPER_BACKEND
+    for name, module in LOCAL_ENGINES:
+        if importlib.util.find_spec(module) is not None:
+            return name
+    return None
+
+
+def get_local_backend():
+    """Return the process-wide local engine, or None if none is installed"""
+    global _local_backend
+
+    if WHISPER_BACKEND != "openai":
+        return get_backend()
+    name = local_backend_name()
+    if name is None:
+        return None
+    with _backend_lock:
+        if _local_backend is None:
+            _local_backend = BACKENDS[name]()
+            logger.info(f"Using {_local_backend.name} as local transcription backend")
+        return _local_backend
+
+
+def _audio_duration(audio_file_path):
+    """Length of an audio file in seconds, via ffprobe"""
+    output = subprocess.check_output(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_entries",
+            "format=duration",
+            "-of",
+            "csv=p=0",
+            audio_file_path,
+        ]
+    )
+    return float(output.strip())
+
+
+def _word_error_rate(reference, hypothesis):
+    """Word-level edit distance between two transcripts over the reference length"""
+    reference_words = _normalize_words(reference)
+    hypothesis_words = _normalize_words(hypothesis)
+    if not reference_words:
+        return 0.0 if not hypothesis_words else 1.0
+    distances = list(range(len(hypothesis_words) + 1))
+    for i, reference_word in enumerate(reference_words, 1):
+        previous, distances[0] = distances[0], i
+        for j, hypothesis_word in enumerate(hypothesis_words, 1):
+            previous, distances[j] = distances[j], min(
+                distances[j] + 1,
+                distances[j - 1] + 1,
+                previous + (reference_word != hypothesis_word),
+            )
+    return distances[-1] / len(reference_words)
+
+
+def _normalize_words(text):
+    """Lowercase words without punctuation, for comparing transcripts"""
+    return "".join(
+        character if character.isalnum() or character.isspace() else " "
+        for character in text.lower()
+    ).split()
+
+
+def _benchmark(audio_file_path, repeats=8, reference=None):
+    """Compare the local engines with the hosted API on one sample chunk
+
+    Reports throughput as a multiple of realtime for every installed local engine
+    at batch size 1 and WHISPER_BATCH_SIZE, and for the hosted API; with a
+    reference transcript, also each engine's word error rate.
+    """
+    import credentials
+
+    duration = _audio_duration(audio_file_path)
+    audio_seconds = duration * repeats
+    print(f"sample: {audio_file_path} ({duration:.1f}s), {repeats} chunks")
+    print(f"cpu threads: {WHISPER_THREADS}")
+
+    def run(backend, client, concurrent):
+        texts = []
+
+        def transcribe():
+            texts.append(backend.transcribe(client, audio_file_path))
+
+        threads = [threading.Thread(target=transcribe) for _ in range(repeats)]
+        started = time.perf_counter()
+        if concurrent:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            for thread in threads:
+                thread.start()
+                thread.join()
+        elapsed = time.perf_counter() - started
+        return elapsed, audio_seconds / elapsed, texts
+
+    def report(label, elapsed, speed, texts):
+        line = f"{label}: {elapsed:.1f}s, {speed:.1f}x realtime"
+        if reference is not None and texts:
+            line += f", WER {_word_error_rate(reference, texts[0]):.1%}"
+        print(line)
+
+    for name, module in LOCAL_ENGINES:
+        if importlib.util.find_spec(module) is None:
+            print(f"{name}: skipped ({module} not installed)")
+            continue
+        for batch_size in sorted({1, WHISPER_BATCH_SIZE}):
+            backend = BACKENDS[name](batch_size=batch_size)
+            backend.load()
+            backend.transcribe(None, audio_file_path)  # Warm-up
+            elapsed, speed, texts = run(backend, None, concurrent=True)
+            report(
+                f"{backend.model_id} batch={batch_size} ({backend.batches} batches)",
+                elapsed,
+                speed,
+                texts,
+            )
+
+    session_credentials = credentials.Credentials.from_environment()
+    if session_credentials.api_key:
+        client = credentials.get_client(session_credentials)
+        elapsed, speed, texts = run(HostedWhisperBackend(), client, concurrent=False)
+        report(f"hosted {HOSTED_MODEL}", elapsed, speed, texts)
+    else:
+        print("hosted: skipped (OPENAI_API_KEY not set)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(
+            "Usage: python whisper_backends.py <audio-file> [repeats] [reference.txt]"
+        )
+        sys.exit(1)
+    reference = None
+    if len(sys.argv) > 3:
+        with open(sys.argv[3], encoding="utf-8") as reference_file:
+            reference = reference_file.read()
+    _benchmark(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 8, reference)
@@ -0,0 +1,93 @@
+"""
+Wire format module for YouTube Livestream Transcriber.
+Optional compact encoding for high-frequency Socket.IO events.
+Events are packed as msgpack arrays with numeric timestamps and sequence ids and
+sent as Socket.IO binary frames; the frontend decodes them back into the usual dicts.
+Sequence ids count up per stream room. Events sent to a single client (history
+replays, dead-letter retries) get id 0 and are not checked for gaps.
+"""
+
+import os
+import logging
+import threading
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, events fall back to JSON
+    msgpack = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# "json" keeps the original dict events, "compact" enables binary frames
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "json").lower()
+
+# Field layout of each compact event: [type code, sequence id, *fields]
+EVENT_CODES = {
+    "transcription": 1,
+    "topic_change": 2,
+    "major_topic_change": 3,
+    "debug_log": 4,
+}
+DEBUG_TYPE_CODES = {"info": 0, "success": 1, "error": 2, "warning": 3}
+
+
+def parse_timestamp(timestamp):
+    """Convert an HH:MM:SS timestamp into seconds"""
+    seconds = 0
+    for part in str(timestamp).split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def encode_event(event, data, sequence):
+    """Pack a supported event into a compact msgpack payload"""
+    code = EVENT_CODES[event]
+
+    if event == "transcription":
+        fields = [
+            parse_timestamp(data["timestamp"]),
+            data["text"],
+            data.get("entities", []),
+        ]
+    elif event == "topic_change":
+        fields = [parse_timestamp(data["timestamp"]), data["topic"]]
+    elif event == "major_topic_change":
+        start, end = data["interval"].split("-")
+        fields = [parse_timestamp(start), parse_timestamp(end), data["topic"]]
+    else:
+        fields = [data["message"], DEBUG_TYPE_CODES.get(data.get("type", "info"), 0)]
+
+    return msgpack.packb([code, sequence] + fields, use_bin_type=True)
+
+
+class CompactEmitter:
+    """Drop-in replacement for socketio.emit that packs high-frequency events"""
+
+    def __init__(self, socketio, enabled=None):
+        self.socketio = socketio
+        if enabled is None:
+            enabled = WIRE_FORMAT == "compact"
+        if enabled and msgpack is None:
+            logger.warning("msgpack is not installed, falling back to JSON events")
+            enabled = False
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def emit(self, event, data=None, sequence=None, **kwargs):
+        """Emit an event, packing it when compact mode applies
+
+        sequence is the id counter of the room the event goes to, if any.
+        """
+        if self.enabled and event in EVENT_CODES:
+            try:
+                number = 0
+                if sequence is not None:
+                    with self._lock:
+                        number = next(sequence)
+                data = encode_event(event, data, number)
+            except (KeyError, ValueError) as e:
+                # Unexpected shape, send the original dict instead
+                logger.debug(f"Sending {event} uncompressed: {str(e)}")
+        return self.socketio.emit(event, data, **kwargs)
@@ -0,0 +1,72 @@
+"""
+Worker process for YouTube Livestream Transcriber.
+Runs the ingest/transcription/topic pipeline for one livestream outside the web
+server and publishes its events through the configured broker (BROKER_URL).
+
+Usage: python worker.py <youtube-url>
+"""
+
+import os
+import sys
+import signal
+import logging
+import threading
+from dotenv import load_dotenv
+import broker
+import pipeline
+import credentials
+import streams
+import whisper_backends
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+
+def main():
+    """Run one pipeline until it ends or the process is asked to stop"""
+    if len(sys.argv) != 2:
+        print("Usage: python worker.py <youtube-url>")
+        return 1
+
+    url = sys.argv[1]
+    publisher = broker.create_publisher()
+    session_api_key = os.environ.pop(broker.SESSION_API_KEY_ENV, None)
+    if session_api_key:
+        session_credentials = credentials.Credentials(
+            session_api_key, source="frontend"
+        )
+    else:
+        session_credentials = credentials.Credentials.from_environment()
+    # Events go to the room of the stream's subscribers on the web tier
+    key = streams.stream_key(url)
+    if key:
+        publisher = streams.RoomEmitter(publisher, streams.room_name(key))
+    livestream_pipeline = pipeline.LivestreamPipeline(
+        url, publisher, session_credentials
+    )
+
+    def handle_signal(signum, frame):
+        logger.info(f"Worker received signal {signum}, stopping pipeline")
+        livestream_pipeline.stop_event.set()
+        # Stop from another thread so the signal handler returns immediately
+        threading.Thread(target=livestream_pipeline.stop).start()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    # Load a local Whisper engine before the first chunk arrives
+    backend = whisper_backends.get_backend()
+    if isinstance(backend, whisper_backends.LocalWhisperBackend):
+        backend.load()
+
+    livestream_pipeline.run()
+    livestream_pipeline.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
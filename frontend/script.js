@@ -6,6 +6,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const connectionStatus = document.getElementById('connection-status');
     const streamStatus = document.getElementById('stream-status');
     const clientsCount = document.getElementById('clients-count');
+    const streamCost = document.getElementById('stream-cost');
     const transcriptionWindow = document.getElementById('transcription-window');
     const topicWindow = document.getElementById('topic-window');
     const majorTopicWindow = document.getElementById('major-topic-window');
@@ -20,6 +21,12 @@ document.addEventListener('DOMContentLoaded', () => {
     const copyBtn = document.getElementById('copy-btn');
     const saveBtn = document.getElementById('save-btn');
     const clearBtn = document.getElementById('clear-btn');
+    const retryFailedBtn = document.getElementById('retry-failed-btn');
+    const exportButtons = {
+        srt: document.getElementById('export-srt-btn'),
+        vtt: document.getElementById('export-vtt-btn'),
+        chapters: document.getElementById('export-chapters-btn')
+    };
     const themeToggleBtn = document.getElementById('theme-toggle-btn');
     const statsToggleBtn = document.getElementById('stats-toggle-btn');
     const copyAllFineTopicsBtn = document.getElementById('copy-all-fine-topics');
@@ -28,9 +35,17 @@ document.addEventListener('DOMContentLoaded', () => {
     // State
     let isConnected = false;
     let isTranscribing = false;
-    let transcriptionText = '';
     let isDebugVisible = true; // Start with debug visible
     let apiKey = localStorage.getItem('openai-api-key') || '';
+    let exportUrls = null; // Download paths of the current stream's exports
+
+    // Full history lives in compact arrays; the DOM only holds a bounded window
+    const transcriptHistory = new EventHistory(['timestamp', 'text', 'entities']);
+    const topicHistory = new EventHistory(['timestamp', 'topic']);
+    const majorTopicHistory = new EventHistory(['interval', 'topic']);
+    const debugHistory = new EventHistory(['time', 'message', 'type'], 5000);
+
+    const debugList = new VirtualList(debugContent, debugHistory, renderDebugRow);
 
     // Initialize API key input
     if (apiKey) {
@@ -84,15 +99,20 @@ document.addEventListener('DOMContentLoaded', () => {
     // Log function for debug console
     function logToConsole(message, type = 'info') {
         const timestamp = new Date().toLocaleTimeString();
-        const logEntry = document.createElement('div');
-        logEntry.className = type === 'error' ? 'error-message' :
-            type === 'success' ? 'success-message' : '';
-        logEntry.innerHTML = `<span class="timestamp">[${timestamp}]</span> ${message}`;
-        debugContent.appendChild(logEntry);
-        debugContent.scrollTop = debugContent.scrollHeight;
+        debugHistory.push({ time: timestamp, message, type });
+        debugList.notify();
         console.log(`[${type.toUpperCase()}] ${message}`);
     }
 
+    // Render a single debug console row
+    function renderDebugRow(record) {
+        const logEntry = document.createElement('div');
+        logEntry.className = record.type === 'error' ? 'error-message' :
+            record.type === 'success' ? 'success-message' : '';
+        logEntry.innerHTML = `<span class="timestamp">[${record.time}]</span> ${record.message}`;
+        return logEntry;
+    }
+
     // Add initial debug message
     logToConsole('Initializing YouTube Livestream Transcriber...', 'info');
     logToConsole('Debug console is now visible for troubleshooting', 'info');
@@ -110,6 +130,48 @@ document.addEventListener('DOMContentLoaded', () => {
             timeout: 20000
         });
 
+        // Compact wire format (msgpack binary frames) decoding
+        const DEBUG_TYPES = ['info', 'success', 'error', 'warning'];
+        let lastSequence = 0;
+
+        function formatSeconds(totalSeconds) {
+            const hours = Math.floor(totalSeconds / 3600);
+            const minutes = Math.floor(totalSeconds / 60) % 60;
+            const seconds = totalSeconds % 60;
+            return [hours, minutes, seconds].map(part => part.toString().padStart(2, '0')).join(':');
+        }
+
+        // Turn a compact event back into the dict shape the handlers expect
+        function decodeEvent(data) {
+            if (!(data instanceof ArrayBuffer)) {
+                return data;
+            }
+
+            const [code, sequence, ...fields] = MessagePack.decode(new Uint8Array(data));
+            // Id 0 marks events outside the stream's sequence (history replays, retries)
+            if (sequence) {
+                if (lastSequence && sequence > lastSequence + 1) {
+                    console.warn(`Missed ${sequence - lastSequence - 1} compact events`);
+                }
+                lastSequence = sequence;
+            }
+
+            switch (code) {
+                case 1:
+                    return { timestamp: formatSeconds(fields[0]), text: fields[1], entities: fields[2] || [], seq: sequence };
+                case 2:
+                    return { timestamp: formatSeconds(fields[0]), topic: fields[1], seq: sequence };
+                case 3:
+                    return {
+                        interval: `${formatSeconds(fields[0])}-${formatSeconds(fields[1])}`,
+                        topic: fields[2],
+                        seq: sequence
+                    };
+                default:
+                    return { message: fields[0], type: DEBUG_TYPES[fields[1]] || 'info', seq: sequence };
+            }
+        }
+
         // Debug all socket events
         socket.onAny((event, ...args) => {
             console.log(`[Socket Event] ${event}:`, args);
@@ -118,7 +180,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
         // Clear debug console
         function clearDebugConsole() {
-            debugContent.innerHTML = '';
+            debugHistory.clear();
+            debugList.reset();
             logToConsole('Debug console cleared');
         }
 
@@ -157,7 +220,7 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
         // Add transcription entry
-        function addTranscription(timestamp, text) {
+        function addTranscription(timestamp, text, entities = []) {
             console.log('Received transcription:', timestamp, text);
 
             // Clear waiting message if present
@@ -166,23 +229,39 @@ document.addEventListener('DOMContentLoaded', () => {
                 transcriptionWindow.removeChild(waitingMsg);
             }
 
+            // Add to full transcription history and render on the next frame
+            transcriptHistory.push({ timestamp, text, entities });
+            transcriptList.notify();
+
+            // Also log to debug console
+            logToConsole(`Transcription: ${timestamp} - ${text}`, 'success');
+        }
+
+        // Render a single transcription row
+        function renderTranscriptionRow(record) {
             const entry = document.createElement('div');
 
             // Format the text with better spacing and punctuation
-            let formattedText = text;
-            if (!text.match(/[.!?]$/)) {
+            let formattedText = record.text;
+            if (!record.text.match(/[.!?]$/)) {
                 formattedText += '.';
             }
 
-            entry.innerHTML = `<span class="timestamp">${timestamp}</span> ${formattedText}`;
-            transcriptionWindow.appendChild(entry);
-            transcriptionWindow.scrollTop = transcriptionWindow.scrollHeight;
+            entry.innerHTML = `<span class="timestamp">${record.timestamp}</span> ${formattedText}`;
 
-            // Add to full transcription text
-            transcriptionText += `[${timestamp}] ${text}\n`;
+            // Assets, indicators and events tagged by the server
+            (record.entities || []).forEach(name => {
+                const tag = document.createElement('span');
+                tag.className = 'entity-tag';
+                tag.textContent = name;
+                entry.appendChild(tag);
+            });
+            return entry;
+        }
 
-            // Also log to debug console
-            logToConsole(`Transcription: ${timestamp} - ${text}`, 'success');
+        // Full transcription text, used by copy and save
+        function getTranscriptionText() {
+            return transcriptHistory.toText(record => `[${record.timestamp}] ${record.text}\n`);
         }
 
         // Format timestamp for copying
@@ -204,19 +283,31 @@ document.addEventListener('DOMContentLoaded', () => {
             return timestamp;
         }
 
+        // Capitalize the first letter of a topic
+        function formatTopic(topic) {
+            return topic.charAt(0).toUpperCase() + topic.slice(1);
+        }
+
         // Add topic change entry
         function addTopicChange(timestamp, topic) {
             // Clear no topics message if present
             const noTopics = topicWindow.querySelector('.no-topics');
             if (noTopics) {
-                topicWindow.querySelector('.topics-list').innerHTML = '';
+                noTopics.remove();
             }
 
+            topicHistory.push({ timestamp, topic });
+            topicList.notify();
+        }
+
+        // Render a single topic change row
+        function renderTopicRow(record) {
+            const timestamp = record.timestamp;
             const entry = document.createElement('div');
             entry.className = 'topic-change';
 
             // Format the topic with better capitalization
-            const formattedTopic = topic.charAt(0).toUpperCase() + topic.slice(1);
+            const formattedTopic = formatTopic(record.topic);
             const formattedTimestamp = formatTimestampForCopy(timestamp);
             const topicText = `${formattedTimestamp} ${formattedTopic}`;
 
@@ -237,8 +328,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
             entry.innerHTML = `<span class="timestamp">${timestamp}</span> <strong>New Topic:</strong> ${formattedTopic}`;
             entry.appendChild(copyBtn);
-            topicWindow.querySelector('.topics-list').appendChild(entry);
-            topicWindow.scrollTop = topicWindow.scrollHeight;
+            return entry;
         }
 
         // Add major topic change entry
@@ -246,14 +336,21 @@ document.addEventListener('DOMContentLoaded', () => {
             // Clear no topics message if present
             const noTopics = majorTopicWindow.querySelector('.no-topics');
             if (noTopics) {
-                majorTopicWindow.querySelector('.topics-list').innerHTML = '';
+                noTopics.remove();
             }
 
+            majorTopicHistory.push({ interval, topic });
+            majorTopicList.notify();
+        }
+
+        // Render a single major topic row
+        function renderMajorTopicRow(record) {
+            const interval = record.interval;
             const entry = document.createElement('div');
             entry.className = 'major-topic-change';
 
             // Format the topic with better capitalization
-            const formattedTopic = topic.charAt(0).toUpperCase() + topic.slice(1);
+            const formattedTopic = formatTopic(record.topic);
 
             // Extract start time for the copy format
             const startTime = interval.split('-')[0].trim();
@@ -277,36 +374,25 @@ document.addEventListener('DOMContentLoaded', () => {
 
             entry.innerHTML = `<span class="interval">${interval}</span> <strong>Major Topic:</strong> ${formattedTopic}`;
             entry.appendChild(copyBtn);
-            majorTopicWindow.querySelector('.topics-list').appendChild(entry);
-            majorTopicWindow.scrollTop = majorTopicWindow.scrollHeight;
-
-            // Also log to debug console
-            logToConsole(`Major topic detected: ${topic} for interval ${interval}`, 'success');
+            return entry;
         }
 
+        // Virtualized lists for each panel
+        const transcriptList = new VirtualList(transcriptionWindow, transcriptHistory, renderTranscriptionRow);
+        const topicList = new VirtualList(topicWindow.querySelector('.topics-list'), topicHistory, renderTopicRow,
+            { scrollContainer: topicWindow });
+        const majorTopicList = new VirtualList(majorTopicWindow.querySelector('.topics-list'), majorTopicHistory,
+            renderMajorTopicRow, { scrollContainer: majorTopicWindow });
+
         // Copy all fine-grained topics
         function copyAllFineTopics() {
-            const topicEntries = topicWindow.querySelectorAll('.topic-change');
-            if (topicEntries.length === 0) {
+            if (topicHistory.length === 0) {
                 logToConsole('No topics to copy', 'error');
                 return;
             }
 
-            let allTopics = '';
-            topicEntries.forEach(entry => {
-                const timestamp = entry.querySelector('.timestamp').textContent;
-                const formattedTimestamp = formatTimestampForCopy(timestamp);
-
-                // Extract only the topic text without the icon
-                const topicElement = entry.cloneNode(true);
-                // Remove the copy button before getting text content
-                const copyButton = topicElement.querySelector('.topic-copy-btn');
-                if (copyButton) {
-                    topicElement.removeChild(copyButton);
-                }
-                const topicText = topicElement.textContent.split('New Topic:')[1].trim();
-                allTopics += `${formattedTimestamp} ${topicText}\n`;
-            });
+            const allTopics = topicHistory.toText(record =>
+                `${formatTimestampForCopy(record.timestamp)} ${formatTopic(record.topic)}\n`);
 
             navigator.clipboard.writeText(allTopics)
                 .then(() => {
@@ -319,27 +405,14 @@ document.addEventListener('DOMContentLoaded', () => {
 
         // Copy all major topics
         function copyAllMajorTopics() {
-            const topicEntries = majorTopicWindow.querySelectorAll('.major-topic-change');
-            if (topicEntries.length === 0) {
+            if (majorTopicHistory.length === 0) {
                 logToConsole('No major topics to copy', 'error');
                 return;
             }
 
-            let allTopics = '';
-            topicEntries.forEach(entry => {
-                const interval = entry.querySelector('.interval').textContent;
-                const startTime = interval.split('-')[0].trim();
-                const formattedTimestamp = formatTimestampForCopy(startTime);
-
-                // Extract only the topic text without the icon
-                const topicElement = entry.cloneNode(true);
-                // Remove the copy button before getting text content
-                const copyButton = topicElement.querySelector('.topic-copy-btn');
-                if (copyButton) {
-                    topicElement.removeChild(copyButton);
-                }
-                const topicText = topicElement.textContent.split('Major Topic:')[1].trim();
-                allTopics += `${formattedTimestamp} ${topicText}\n`;
+            const allTopics = majorTopicHistory.toText(record => {
+                const startTime = record.interval.split('-')[0].trim();
+                return `${formatTimestampForCopy(startTime)} ${formatTopic(record.topic)}\n`;
             });
 
             navigator.clipboard.writeText(allTopics)
@@ -364,6 +437,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
             // Send connection request to server with API key if available
             const userApiKey = apiKey ? apiKey : '';
+            lastSequence = 0;  // Each stream's room numbers its events from 1
             socket.emit('connect_livestream', { url, apiKey: userApiKey });
         }
 
@@ -376,6 +450,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
         // Copy transcription to clipboard
         function copyTranscription() {
+            const transcriptionText = getTranscriptionText();
             if (!transcriptionText) {
                 logToConsole('No transcription to copy', 'error');
                 return;
@@ -392,6 +467,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
         // Save transcription to file
         function saveTranscription() {
+            const transcriptionText = getTranscriptionText();
             if (!transcriptionText) {
                 logToConsole('No transcription to save', 'error');
                 return;
@@ -412,8 +488,9 @@ document.addEventListener('DOMContentLoaded', () => {
 
         // Clear transcription
         function clearTranscription() {
+            transcriptHistory.clear();
+            transcriptList.reset();
             transcriptionWindow.innerHTML = '<div class="waiting-message">Waiting for transcription...</div>';
-            transcriptionText = '';
             logToConsole('Transcription cleared');
         }
 
@@ -454,12 +531,40 @@ document.addEventListener('DOMContentLoaded', () => {
             logToConsole('API key saved', 'success');
         }
 
+        // Download a caption or chapter export streamed by the server
+        function downloadExport(kind) {
+            if (!exportUrls) {
+                logToConsole('No export available yet', 'error');
+                return;
+            }
+            const a = document.createElement('a');
+            a.href = `${serverUrl}${exportUrls[kind]}`;
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
+            logToConsole(`Downloading ${kind} export`, 'info');
+        }
+
+        // Re-transcribe chunks that failed after all retries
+        function retryFailedChunks() {
+            if (!isConnected) {
+                logToConsole('Not connected to server', 'error');
+                return;
+            }
+            socket.emit('retry_dead_letters', { apiKey: apiKey ? apiKey : '' });
+            logToConsole('Requested re-transcription of failed chunks', 'info');
+        }
+
         // Event Listeners
         startBtn.addEventListener('click', startTranscription);
         stopBtn.addEventListener('click', stopTranscription);
         copyBtn.addEventListener('click', copyTranscription);
         saveBtn.addEventListener('click', saveTranscription);
         clearBtn.addEventListener('click', clearTranscription);
+        retryFailedBtn.addEventListener('click', retryFailedChunks);
+        Object.entries(exportButtons).forEach(([kind, button]) => {
+            button.addEventListener('click', () => downloadExport(kind));
+        });
         clearDebugBtn.addEventListener('click', clearDebugConsole);
         toggleSettingsBtn.addEventListener('click', toggleSettings);
         themeToggleBtn.addEventListener('click', toggleTheme);
@@ -494,6 +599,9 @@ document.addEventListener('DOMContentLoaded', () => {
 
         socket.on('livestream_connected', (data) => {
             logToConsole(`Connected to livestream: ${data.url}`, 'success');
+            if (data.shared) {
+                logToConsole(`Joined a shared transcription with ${data.subscribers - 1} other viewer(s)`, 'info');
+            }
         });
 
         socket.on('livestream_error', (data) => {
@@ -506,23 +614,122 @@ document.addEventListener('DOMContentLoaded', () => {
             updateStreamStatus(true);
         });
 
-        socket.on('transcription', (data) => {
-            addTranscription(data.timestamp, data.text);
+        socket.on('wire_format', (data) => {
+            logToConsole(`Server wire format: ${data.compact ? 'compact binary' : 'JSON'}`, 'info');
+        });
+
+        socket.on('transcription', (payload) => {
+            const data = decodeEvent(payload);
+            addTranscription(data.timestamp, data.text, data.entities);
         });
 
         // Add handler for topic change events
-        socket.on('topic_change', (data) => {
+        socket.on('topic_change', (payload) => {
+            const data = decodeEvent(payload);
             logToConsole(`Topic change detected: ${data.topic} at ${data.timestamp}`, 'success');
             addTopicChange(data.timestamp, data.topic);
         });
 
         // Add handler for major topic change events
-        socket.on('major_topic_change', (data) => {
+        socket.on('major_topic_change', (payload) => {
+            const data = decodeEvent(payload);
             logToConsole(`Major topic detected: ${data.topic} for interval ${data.interval}`, 'success');
             addMajorTopicChange(data.interval, data.topic);
         });
 
-        socket.on('debug_log', (data) => {
+        // Replace the chapter list with the globally refined version
+        socket.on('major_topics_refined', (data) => {
+            logToConsole(`Refined chapter list received: ${data.chapters.length} chapters`, 'success');
+            majorTopicHistory.clear();
+            majorTopicList.reset();
+            data.chapters.forEach(chapter => {
+                addMajorTopicChange(chapter.interval, chapter.topic);
+            });
+        });
+
+        // Mention ranges of every tagged entity so far
+        socket.on('entity_timeline', (data) => {
+            const mentions = Object.entries(data.entities)
+                .map(([name, ranges]) => [name, ranges.reduce((total, range) => total + range[2], 0)])
+                .sort((a, b) => b[1] - a[1])
+                .slice(0, 5);
+            if (mentions.length) {
+                logToConsole(`Most mentioned: ${mentions.map(([name, count]) => `${name} (${count})`).join(', ')}`, 'info');
+            }
+        });
+
+        socket.on('cache_stats', (data) => {
+            if (data.hits !== undefined) {
+                logToConsole(`Result cache: ${data.hits} hits, ${data.misses} misses ` +
+                    `(${(data.hit_rate * 100).toFixed(0)}% hit rate, ${data.entries} entries)`, 'info');
+            }
+            if (data.llm) {
+                logToConsole(`LLM cache: ${data.llm.hits} hits, ${data.llm.collapsed} collapsed, ` +
+                    `${data.llm.misses} misses (${(data.llm.hit_rate * 100).toFixed(0)}% hit rate)`, 'info');
+            }
+        });
+
+        socket.on('dead_letters', (data) => {
+            retryFailedBtn.classList.toggle('hidden', data.count === 0);
+            retryFailedBtn.title = `Retry ${data.count} failed chunk(s)`;
+        });
+
+        socket.on('channel_live', (data) => {
+            logToConsole(`${data.channel} is live and being transcribed: ${data.title}`, 'success');
+            // Offer the stream for joining unless a URL is already entered
+            if (!isTranscribing && !livestreamUrlInput.value) {
+                livestreamUrlInput.value = data.url;
+            }
+        });
+
+        socket.on('export_ready', (data) => {
+            exportUrls = data.urls;
+            Object.values(exportButtons).forEach(button => button.classList.remove('hidden'));
+            logToConsole(`Captions and chapters are being saved as ${data.stream_id}`, 'info');
+        });
+
+        socket.on('dead_letter_recovered', (data) => {
+            addTranscription(data.timestamp, `[recovered] ${data.text}`);
+        });
+
+        socket.on('circuit_breaker', (data) => {
+            const detail = data.state === 'open' ? `, retrying in ${data.retry_in}s` : '';
+            logToConsole(`Circuit breaker '${data.name}' ${data.state}${detail}`,
+                data.state === 'closed' ? 'success' : 'error');
+        });
+
+        socket.on('latency', (data) => {
+            logToConsole(`Latency: ${data.latency}s behind airing ` +
+                `(mean ${data.mean}s, max ${data.max}s)`, 'info');
+        });
+
+        socket.on('overload', (data) => {
+            const actions = data.actions.length ? data.actions.join(', ') : 'none';
+            logToConsole(`Pipeline ${data.state}: ${data.lag}s behind live, active actions: ${actions}`,
+                data.state === 'recovered' ? 'info' : 'error');
+        });
+
+        // Live spend counters of the stream and its API key
+        socket.on('usage', (data) => {
+            const stream = data.stream;
+            streamCost.textContent = `$${stream.cost.toFixed(2)}`;
+            streamCost.classList.toggle('over-budget', data.budget.level > 0);
+            streamCost.title = `${stream.audio_minutes} min audio, ` +
+                `${stream.prompt_tokens} prompt + ${stream.completion_tokens} completion tokens, ` +
+                `$${stream.cost_per_hour.toFixed(3)}/h` +
+                (data.budget.stream_budget ? ` of $${data.budget.stream_budget}/h budget` : '') +
+                `\nAPI key: $${data.key.cost.toFixed(2)}, $${data.key.cost_per_hour.toFixed(3)}/h` +
+                (data.budget.key_budget ? ` of $${data.budget.key_budget}/h budget` : '');
+        });
+
+        socket.on('budget', (data) => {
+            const actions = data.actions.length ? data.actions.join(', ') : 'none';
+            logToConsole(`Budget ${data.state}: spending at ${(data.pace * 100).toFixed(0)}% of budget, ` +
+                `active actions: ${actions}`, data.state === 'recovered' ? 'info' : 'error');
+        });
+
+        socket.on('debug_log', (payload) => {
+            const data = decodeEvent(payload);
             logToConsole(data.message, data.type || 'info');
         });
 
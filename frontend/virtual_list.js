@@ -0,0 +1,339 @@
+/*
+ * Virtualized list rendering for the transcript, topic and debug panels.
+ * The full history lives in a compact column-oriented EventHistory, only a
+ * bounded window of rows is kept in the DOM, and inserts are batched into one
+ * DOM update per animation frame.
+ *
+ * Run `node virtual_list.js` for a browser-free benchmark of the data structures.
+ */
+
+// Column-oriented event store addressed by absolute index
+class EventHistory {
+    constructor(fields, capacity = 0) {
+        this.fields = fields;
+        this.capacity = capacity; // 0 keeps everything
+        this.clear();
+    }
+
+    // Index of the oldest record still retained
+    get firstIndex() {
+        return this.offset + this.head;
+    }
+
+    // Total number of records ever pushed (absolute end index)
+    get length() {
+        return this.offset + this.columns[this.fields[0]].length;
+    }
+
+    push(record) {
+        this.fields.forEach(field => {
+            this.columns[field].push(record[field]);
+        });
+
+        // Bound histories that are pushed to without a batch ever being trimmed
+        if (this.capacity && this.length - this.firstIndex > this.capacity * 1.5) {
+            this.trim();
+        }
+    }
+
+    // Drop the oldest records beyond capacity, called once a batch of pushes is done
+    trim() {
+        if (!this.capacity || this.length - this.firstIndex <= this.capacity) {
+            return;
+        }
+        this.head = this.length - this.capacity - this.offset;
+
+        // Compact in blocks so bounded histories don't shift on every trim
+        if (this.head > this.capacity / 2) {
+            this.fields.forEach(field => {
+                this.columns[field].splice(0, this.head);
+            });
+            this.offset += this.head;
+            this.head = 0;
+        }
+    }
+
+    get(index) {
+        const position = index - this.offset;
+        if (position < this.head || position >= this.columns[this.fields[0]].length) {
+            return null;
+        }
+        const record = {};
+        this.fields.forEach(field => {
+            record[field] = this.columns[field][position];
+        });
+        return record;
+    }
+
+    forEach(callback) {
+        for (let index = this.firstIndex; index < this.length; index++) {
+            callback(this.get(index));
+        }
+    }
+
+    // Join every record into one string, used by copy and save
+    toText(formatRecord) {
+        const lines = [];
+        this.forEach(record => lines.push(formatRecord(record)));
+        return lines.join('');
+    }
+
+    clear() {
+        this.columns = {};
+        this.fields.forEach(field => {
+            this.columns[field] = [];
+        });
+        this.offset = 0;
+        this.head = 0; // Trimmed records not yet compacted away
+    }
+}
+
+// Pure bookkeeping for which history range [start, end) is rendered
+class ListWindow {
+    constructor(maxRows = 200, pageSize = 50) {
+        this.maxRows = maxRows;
+        this.pageSize = pageSize;
+        this.reset(0);
+    }
+
+    reset(index) {
+        this.start = index;
+        this.end = index;
+        this.following = true; // Pinned to the newest rows
+    }
+
+    // New rows arrived; returns the rows to append and how many to evict from the top
+    appendRange(historyStart, historyEnd) {
+        if (!this.following || historyEnd <= this.end) {
+            return null;
+        }
+
+        const newStart = Math.max(this.start, historyStart, historyEnd - this.maxRows);
+        const change = {
+            from: Math.max(this.end, newStart),
+            to: historyEnd,
+            evictTop: Math.min(newStart, this.end) - this.start,
+            evictBottom: 0
+        };
+        this.start = newStart;
+        this.end = historyEnd;
+        return change;
+    }
+
+    // User scrolled to the top of the window; returns the rows to prepend
+    pageUp(historyStart) {
+        if (this.start <= historyStart) {
+            return null;
+        }
+
+        const newStart = Math.max(historyStart, this.start - this.pageSize);
+        const newEnd = Math.min(this.end, newStart + this.maxRows);
+        const change = {
+            from: newStart,
+            to: this.start,
+            evictTop: 0,
+            evictBottom: this.end - newEnd
+        };
+        this.start = newStart;
+        this.end = newEnd;
+        this.following = false;
+        return change;
+    }
+
+    // User scrolled to the bottom of the window; returns the rows to append
+    pageDown(historyStart, historyEnd) {
+        if (this.end >= historyEnd) {
+            this.following = true;
+            return null;
+        }
+
+        const newEnd = Math.min(historyEnd, this.end + this.pageSize);
+        const newStart = Math.max(this.start, historyStart, newEnd - this.maxRows);
+        const change = {
+            from: Math.max(this.end, newStart),
+            to: newEnd,
+            evictTop: Math.min(newStart, this.end) - this.start,
+            evictBottom: 0
+        };
+        this.start = newStart;
+        this.end = newEnd;
+        this.following = newEnd === historyEnd;
+        return change;
+    }
+}
+
+// DOM adapter that renders a bounded ListWindow of an EventHistory
+class VirtualList {
+    constructor(container, history, renderRow, options = {}) {
+        this.container = container;
+        this.scrollContainer = options.scrollContainer || container;
+        this.history = history;
+        this.renderRow = renderRow;
+        this.window = new ListWindow(options.maxRows || 200, options.pageSize || 50);
+        this.edgeThreshold = options.edgeThreshold || 40;
+        this.nodes = [];
+        this.frameRequested = false;
+
+        this.scrollContainer.addEventListener('scroll', () => this.onScroll());
+    }
+
+    // Schedule a batched render of everything pushed since the last frame
+    notify() {
+        if (this.frameRequested) {
+            return;
+        }
+        this.frameRequested = true;
+        requestAnimationFrame(() => {
+            this.frameRequested = false;
+            this.flush();
+        });
+    }
+
+    flush() {
+        // Everything pushed since the last frame is one batch
+        this.history.trim();
+        const change = this.window.appendRange(this.history.firstIndex, this.history.length);
+        if (!change) {
+            return;
+        }
+        this.removeTop(change.evictTop);
+        this.container.appendChild(this.renderRange(change.from, change.to, true));
+        this.scrollContainer.scrollTop = this.scrollContainer.scrollHeight;
+    }
+
+    onScroll() {
+        const element = this.scrollContainer;
+        if (element.scrollTop < this.edgeThreshold) {
+            const change = this.window.pageUp(this.history.firstIndex);
+            if (change) {
+                // Keep the visible rows in place while rows are added above them
+                const previousHeight = element.scrollHeight;
+                const anchor = this.nodes.length ? this.nodes[0] : null;
+                this.removeBottom(change.evictBottom);
+                this.container.insertBefore(this.renderRange(change.from, change.to, false), anchor);
+                element.scrollTop += element.scrollHeight - previousHeight;
+            }
+        } else if (element.scrollTop + element.clientHeight > element.scrollHeight - this.edgeThreshold) {
+            const change = this.window.pageDown(this.history.firstIndex, this.history.length);
+            if (change) {
+                element.scrollTop -= this.removeTop(change.evictTop);
+                this.container.appendChild(this.renderRange(change.from, change.to, true));
+            }
+        }
+    }
+
+    // Render rows [from, to) into a fragment and track their nodes
+    renderRange(from, to, atEnd) {
+        const fragment = document.createDocumentFragment();
+        const rendered = [];
+        for (let index = from; index < to; index++) {
+            const record = this.history.get(index);
+            if (record) {
+                const node = this.renderRow(record);
+                rendered.push(node);
+                fragment.appendChild(node);
+            }
+        }
+        this.nodes = atEnd ? this.nodes.concat(rendered) : rendered.concat(this.nodes);
+        return fragment;
+    }
+
+    // Remove rows from the top, returning the height they occupied
+    removeTop(count) {
+        let removedHeight = 0;
+        this.nodes.splice(0, count).forEach(node => {
+            removedHeight += node.offsetHeight;
+            node.remove();
+        });
+        return removedHeight;
+    }
+
+    removeBottom(count) {
+        if (count > 0) {
+            this.nodes.splice(this.nodes.length - count, count).forEach(node => node.remove());
+        }
+    }
+
+    // Drop all rendered rows and start following the newest rows again
+    reset() {
+        this.nodes.forEach(node => node.remove());
+        this.nodes = [];
+        this.window.reset(this.history.firstIndex);
+        this.notify();
+    }
+}
+
+// Browser-free benchmark with synthetic event streams
+function runBenchmark() {
+    const chunks = 8 * 60 * 3 * 10; // Ten 8-hour streams of 20 s chunks
+    const debugPerChunk = 12;
+    const sentence = 'Bitcoin is holding the weekly support while ETH funding rates reset after the FOMC minutes ';
+
+    function measure(label, body) {
+        const started = process.hrtime.bigint();
+        const operations = body();
+        const elapsedMs = Number(process.hrtime.bigint() - started) / 1e6;
+        const perOp = (elapsedMs * 1e6) / operations;
+        console.log(`${label}: ${operations} ops in ${elapsedMs.toFixed(1)} ms (${perOp.toFixed(0)} ns/op)`);
+    }
+
+    const heapBefore = process.memoryUsage().heapUsed;
+    const transcripts = new EventHistory(['timestamp', 'text']);
+    const debugLog = new EventHistory(['time', 'message', 'type'], 5000);
+    const transcriptWindow = new ListWindow(200, 50);
+    const debugWindow = new ListWindow(200, 50);
+
+    measure('push + window update (transcripts, 1 frame per event)', () => {
+        for (let i = 0; i < chunks; i++) {
+            transcripts.push({ timestamp: String(i * 20), text: sentence + i });
+            transcriptWindow.appendRange(transcripts.firstIndex, transcripts.length);
+        }
+        return chunks;
+    });
+
+    measure('push + window update (bounded debug log, 1 frame per 12 events)', () => {
+        let count = 0;
+        for (let i = 0; i < chunks; i++) {
+            for (let j = 0; j < debugPerChunk; j++) {
+                debugLog.push({ time: i, message: `Analyzing transcription for topic change at ${i}`, type: 'info' });
+                count++;
+            }
+            debugLog.trim();
+            debugWindow.appendRange(debugLog.firstIndex, debugLog.length);
+        }
+        return count;
+    });
+
+    measure('scroll through full transcript history (page up)', () => {
+        let pages = 0;
+        while (transcriptWindow.pageUp(transcripts.firstIndex)) {
+            pages++;
+        }
+        return pages;
+    });
+
+    measure('random access get()', () => {
+        const reads = 1000000;
+        for (let i = 0; i < reads; i++) {
+            transcripts.get((i * 7919) % transcripts.length);
+        }
+        return reads;
+    });
+
+    measure('toText() for copy/save', () => {
+        transcripts.toText(record => `[${record.timestamp}] ${record.text}\n`);
+        return transcripts.length;
+    });
+
+    const heapAfter = process.memoryUsage().heapUsed;
+    console.log(`rendered rows bounded at: transcripts ${transcriptWindow.end - transcriptWindow.start}, debug ${debugWindow.end - debugWindow.start}`);
+    console.log(`debug history retained: ${debugLog.length - debugLog.firstIndex} of ${debugLog.length}`);
+    console.log(`heap growth: ${((heapAfter - heapBefore) / 1048576).toFixed(1)} MB for ${transcripts.length} transcript rows`);
+}
+
+if (typeof module !== 'undefined' && module.exports) {
+    module.exports = { EventHistory, ListWindow, VirtualList };
+    if (require.main === module) {
+        runBenchmark();
+    }
+}